@@ -0,0 +1,258 @@
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+
+from app.core.config import (
+    OWM_API_KEYS_LIST,
+    OWM_KEY_BUDGETS,
+    OWM_KEY_COOLDOWN_429,
+    OWM_KEY_COOLDOWN_401,
+    OWM_COLLECTOR_QUOTA_SHARE,
+)
+from app.core.metrics import register_metrics
+
+
+def parse_budgets(spec: str) -> list:
+    """"60/60,1000000/2592000" -> [(60, 60.0), (1000000, 2592000.0)] (số lượt, độ dài cửa sổ giây)"""
+    budgets = []
+    for item in spec.split(","):
+        limit, sep, seconds = item.strip().partition("/")
+        if sep:
+            budgets.append((int(limit), float(seconds)))
+    return budgets
+
+
+class SlidingWindow:
+    """
+    Đếm số lượt gọi trong `seconds` giây gần nhất, chia thành `buckets` ô thời gian
+    (bộ nhớ cố định kể cả với cửa sổ 1 tháng; sai số tối đa 1 ô, luôn theo hướng an toàn).
+    """
+
+    def __init__(self, limit: int, seconds: float, buckets: int = 60):
+        self.limit = limit
+        self.seconds = seconds
+        self.buckets = buckets
+        self.bucket_seconds = seconds / buckets
+        self._counts = deque()  # [chỉ số ô, số lượt]
+        self._total = 0
+
+    def _expire(self, now: float):
+        oldest = math.floor(now / self.bucket_seconds) - self.buckets + 1
+        while self._counts and self._counts[0][0] < oldest:
+            self._total -= self._counts.popleft()[1]
+
+    def count(self, now: float) -> int:
+        self._expire(now)
+        return self._total
+
+    def add(self, now: float):
+        index = math.floor(now / self.bucket_seconds)
+        if self._counts and self._counts[-1][0] == index:
+            self._counts[-1][1] += 1
+        else:
+            self._counts.append([index, 1])
+        self._total += 1
+
+    def time_until_below(self, now: float, capacity: int) -> float:
+        """Số giây tới khi số lượt trong cửa sổ < capacity (0 nếu đã còn chỗ)"""
+        self._expire(now)
+        excess = self._total - capacity + 1
+        if excess <= 0:
+            return 0.0
+        freed = 0
+        for index, count in self._counts:
+            freed += count
+            if freed >= excess:
+                return max(0.0, (index + self.buckets) * self.bucket_seconds - now)
+        return self.seconds
+
+
+class _KeyState:
+    def __init__(self, key: str, budgets: list):
+        self.key = key
+        self.windows = [SlidingWindow(limit, seconds) for limit, seconds in budgets]
+        self.cooldown_until = 0.0
+        self.cooldown_reason = None
+        self.calls = 0
+        self.throttled = 0
+        self.unauthorized = 0
+
+
+def _mask(key: str) -> str:
+    return f"{key[:4]}…{key[-4:]}" if len(key) > 8 else "…"
+
+
+class KeyScheduler:
+    """
+    Chia lượt gọi API cho nhiều key theo quota thật:
+    - Mỗi key có các cửa sổ trượt (VD 60 lượt/phút + 1 triệu lượt/tháng), chỉ dùng `share` phần quota.
+    - Chọn key xoay vòng cố định (round-robin), bỏ qua key đã hết quota hoặc đang nghỉ.
+    - 429 -> key nghỉ theo Retry-After (hoặc cooldown_429); 401 -> key nghỉ lâu (cooldown_401).
+    Trạng thái nằm trong process: collector và API mỗi bên giữ 1 bản, chia quota bằng `share`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        keys: list,
+        budgets: str = OWM_KEY_BUDGETS,
+        share: float = 1.0,
+        cooldown_429: float = OWM_KEY_COOLDOWN_429,
+        cooldown_401: float = OWM_KEY_COOLDOWN_401,
+    ):
+        self.name = name
+        self.budgets = parse_budgets(budgets)
+        self.share = share
+        self.cooldown_429 = cooldown_429
+        self.cooldown_401 = cooldown_401
+        self._states = [_KeyState(key, self.budgets) for key in dict.fromkeys(keys)]
+        self._by_key = {state.key: state for state in self._states}
+        self._cursor = 0
+        self._lock = threading.Lock()
+        self.exhausted = 0  # số lần không còn key nào dùng được
+
+    def set_share(self, share: float):
+        """Phần quota của từng key mà process này được dùng (0..1)"""
+        with self._lock:
+            self.share = max(0.0, min(1.0, share))
+
+    def _capacity(self, window: SlidingWindow) -> int:
+        return int(window.limit * self.share)
+
+    def _usable(self, state: _KeyState, now: float) -> bool:
+        return state.cooldown_until <= now and all(w.count(now) < self._capacity(w) for w in state.windows)
+
+    def try_acquire(self):
+        """Lấy key kế tiếp còn quota (và ghi nhận 1 lượt gọi); None nếu mọi key đều hết/đang nghỉ"""
+        with self._lock:
+            now = time.monotonic()
+            n = len(self._states)
+            for offset in range(n):
+                index = (self._cursor + offset) % n
+                state = self._states[index]
+                if self._usable(state, now):
+                    for window in state.windows:
+                        window.add(now)
+                    state.calls += 1
+                    self._cursor = index + 1
+                    return state.key
+            self.exhausted += 1
+            return None
+
+    def wait_time(self) -> float:
+        """Số giây tới khi có ít nhất 1 key dùng được trở lại"""
+        with self._lock:
+            now = time.monotonic()
+            waits = [
+                max(
+                    state.cooldown_until - now,
+                    *(w.time_until_below(now, self._capacity(w)) if self._capacity(w) > 0 else w.seconds
+                      for w in state.windows),
+                    0.0,
+                )
+                for state in self._states
+            ]
+        return min(waits) if waits else math.inf
+
+    def acquire(self, timeout: float = None):
+        """Như try_acquire nhưng chờ (blocking) tới khi có key; hết timeout thì trả None"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            key = self.try_acquire()
+            if key is not None:
+                return key
+            delay = self.wait_time()
+            if deadline is not None:
+                delay = min(delay, deadline - time.monotonic())
+                if delay <= 0:
+                    return None
+            time.sleep(max(delay, 0.05))
+
+    async def acquire_async(self, timeout: float = None):
+        """Bản async của acquire (chờ bằng asyncio.sleep, không chặn event loop)"""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            key = self.try_acquire()
+            if key is not None:
+                return key
+            delay = self.wait_time()
+            if deadline is not None:
+                delay = min(delay, deadline - loop.time())
+                if delay <= 0:
+                    return None
+            await asyncio.sleep(max(delay, 0.05))
+
+    def report(self, key: str, status_code: int, retry_after=None):
+        """Báo kết quả gọi API bằng key: 429/401 thì cho key nghỉ"""
+        with self._lock:
+            state = self._by_key.get(key)
+            if state is None:
+                return
+            now = time.monotonic()
+            if status_code == 429:
+                state.throttled += 1
+                try:
+                    pause = float(retry_after)
+                except (TypeError, ValueError):
+                    pause = self.cooldown_429
+                state.cooldown_until = max(state.cooldown_until, now + pause)
+                state.cooldown_reason = "429"
+            elif status_code == 401:
+                state.unauthorized += 1
+                state.cooldown_until = max(state.cooldown_until, now + self.cooldown_401)
+                state.cooldown_reason = "401"
+
+    def sustainable_rate(self, per_seconds: float = 60.0) -> float:
+        """Số lượt gọi tối đa có thể duy trì lâu dài mỗi `per_seconds` giây (key bị 401 không tính)"""
+        with self._lock:
+            now = time.monotonic()
+            rate = 0.0
+            for state in self._states:
+                if state.cooldown_reason == "401" and state.cooldown_until > now:
+                    continue
+                rate += min((self._capacity(w) / w.seconds for w in state.windows), default=math.inf)
+        return rate * per_seconds
+
+    def remaining(self) -> dict:
+        """Số lượt còn gọi được ngay trong từng cửa sổ (cộng trên các key không đang nghỉ)"""
+        with self._lock:
+            now = time.monotonic()
+            active = [s for s in self._states if s.cooldown_until <= now]
+            by_window = {}
+            for i, (limit, seconds) in enumerate(self.budgets):
+                by_window[f"{limit}/{seconds:g}s"] = sum(
+                    max(0, self._capacity(s.windows[i]) - s.windows[i].count(now)) for s in active
+                )
+            return {"available_keys": len(active), "total_keys": len(self._states), "by_window": by_window}
+
+    def stats(self) -> dict:
+        remaining = self.remaining()
+        with self._lock:
+            now = time.monotonic()
+            keys = {
+                f"#{i + 1} {_mask(s.key)}": {
+                    "calls": s.calls,
+                    "throttled": s.throttled,
+                    "unauthorized": s.unauthorized,
+                    "cooldown_seconds": round(max(0.0, s.cooldown_until - now), 1),
+                    "cooldown_reason": s.cooldown_reason if s.cooldown_until > now else None,
+                }
+                for i, s in enumerate(self._states)
+            }
+            share, exhausted = self.share, self.exhausted
+        return {
+            **remaining,
+            "share": share,
+            "exhausted": exhausted,
+            "sustainable_per_minute": round(self.sustainable_rate(60), 2),
+            "keys": keys,
+        }
+
+
+# Key OWM dùng chung trong process. Mặc định (process API) dùng phần quota collector chừa lại;
+# collector gọi owm_keys.set_share(OWM_COLLECTOR_QUOTA_SHARE) khi khởi động.
+owm_keys = KeyScheduler("owm", OWM_API_KEYS_LIST, share=1.0 - OWM_COLLECTOR_QUOTA_SHARE)
+register_metrics("api_keys.owm", owm_keys.stats)
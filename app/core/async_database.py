@@ -0,0 +1,173 @@
+import asyncio
+import json
+import re
+import time
+
+from app.core.config import DB_CONFIG, ASYNC_DB_POOL_MIN_SIZE, ASYNC_DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT
+from app.core.database import (
+    LATEST_WEATHER_SQL,
+    active_risks_query,
+    dedupe_risks,
+    ensure_event_schema,
+    load_active_risks,
+    load_latest_weather_data,
+)
+from app.core.executors import run_io
+from app.core.geo_cache import MISS, event_cache
+from app.core.metrics import register_metrics
+
+# asyncpg là tuỳ chọn: không cài thì các hàm async chạy bản psycopg2 trong io pool
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+# Không kết nối được DB thì chờ 1 lúc mới thử tạo pool lại (tránh mỗi request lại thử 1 lần)
+_RETRY_AFTER_SECONDS = 30
+
+_pool = None
+_pool_loop = None
+_pool_lock = None
+_retry_at = 0.0
+_stats = {"queries": 0, "errors": 0, "fallbacks": 0}
+
+
+def _to_asyncpg(sql: str) -> str:
+    """Đổi placeholder %s (psycopg2) thành $1, $2... (asyncpg)"""
+    counter = iter(range(1, 1000))
+    return re.sub(r"%s", lambda _: f"${next(counter)}", sql)
+
+
+async def _init_connection(conn):
+    # Trả jsonb/json về dict giống RealDictCursor của psycopg2
+    for typename in ("jsonb", "json"):
+        await conn.set_type_codec(typename, encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+
+
+async def get_async_pool():
+    """
+    Pool asyncpg dùng chung (gắn với event loop đang chạy), tạo lazy.
+    Trả về None nếu không có asyncpg hoặc chưa kết nối được DB -> caller dùng bản đồng bộ.
+    """
+    global _pool, _pool_loop, _pool_lock, _retry_at
+    if asyncpg is None:
+        return None
+
+    loop = asyncio.get_running_loop()
+    if _pool is not None and _pool_loop is loop:
+        return _pool
+    if time.monotonic() < _retry_at:
+        return None
+
+    if _pool_lock is None or _pool_loop is not loop:
+        _pool_lock = asyncio.Lock()
+        _pool_loop = loop
+        _pool = None
+
+    async with _pool_lock:
+        if _pool is None:
+            try:
+                _pool = await asyncpg.create_pool(
+                    database=DB_CONFIG["dbname"],
+                    user=DB_CONFIG["user"],
+                    password=DB_CONFIG["password"],
+                    host=DB_CONFIG["host"],
+                    port=int(DB_CONFIG["port"]),
+                    min_size=max(0, min(ASYNC_DB_POOL_MIN_SIZE, ASYNC_DB_POOL_MAX_SIZE)),
+                    max_size=max(1, ASYNC_DB_POOL_MAX_SIZE),
+                    init=_init_connection,
+                    timeout=DB_POOL_TIMEOUT,
+                )
+                print(f"✅ [AsyncDB] asyncpg pool sẵn sàng ({ASYNC_DB_POOL_MIN_SIZE}-{ASYNC_DB_POOL_MAX_SIZE} kết nối)")
+                # Các truy vấn đọc từ events_latest -> đảm bảo schema đã migrate (chạy 1 lần qua psycopg2)
+                await run_io(ensure_event_schema)
+            except Exception as e:
+                _retry_at = time.monotonic() + _RETRY_AFTER_SECONDS
+                print(f"❌ [AsyncDB] Không tạo được asyncpg pool: {e} -> dùng psycopg2 trong io pool")
+                return None
+    return _pool
+
+
+async def close_async_db_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+async def fetch_latest_weather_data_async(lat: float, lon: float, radius_km: int = 50):
+    """Bản async của database.fetch_latest_weather_data (cùng SQL, cùng kết quả, dùng chung cache)"""
+    key = event_cache.key("weather", lat, lon, radius_km)
+    cached = event_cache.get(key)
+    if cached is not MISS:
+        return cached
+
+    snap_lat, snap_lon = event_cache.snap(lat, lon)
+    pool = await get_async_pool()
+    if pool is None:
+        _stats["fallbacks"] += 1
+        return await run_io(load_latest_weather_data, key, snap_lat, snap_lon, radius_km)
+
+    _stats["queries"] += 1
+    generation = event_cache.generation
+    try:
+        result = await pool.fetchval(_to_asyncpg(LATEST_WEATHER_SQL), snap_lon, snap_lat, radius_km * 1000)
+    except Exception as e:
+        _stats["errors"] += 1
+        print(f"❌ Error fetching weather data: {e}")
+        return None
+    event_cache.put(key, result, generation)
+    return result
+
+
+async def fetch_latest_weather_data_many(points, radius_km: int = 50) -> list:
+    """
+    fetch_latest_weather_data_async cho nhiều (lat, lon) chạy đồng thời,
+    giới hạn số truy vấn cùng lúc bằng kích thước pool (cả khi dùng bản psycopg2).
+    """
+    limiter = asyncio.Semaphore(max(1, ASYNC_DB_POOL_MAX_SIZE))
+
+    async def fetch_one(lat, lon):
+        async with limiter:
+            return await fetch_latest_weather_data_async(lat, lon, radius_km)
+
+    return await asyncio.gather(*(fetch_one(lat, lon) for lat, lon in points))
+
+
+async def get_active_risks_async(lat=None, lon=None, radius_km=50, limit=200):
+    """Bản async của database.get_active_risks (cùng SQL, cùng kết quả, dùng chung cache)"""
+    key = event_cache.key("risks", lat, lon, radius_km, limit)
+    cached = event_cache.get(key)
+    if cached is not MISS:
+        return list(cached)
+
+    snap_lat, snap_lon = event_cache.snap(lat, lon)
+    pool = await get_async_pool()
+    if pool is None:
+        _stats["fallbacks"] += 1
+        return await run_io(load_active_risks, key, snap_lat, snap_lon, radius_km, limit)
+
+    _stats["queries"] += 1
+    generation = event_cache.generation
+    try:
+        sql, params = active_risks_query(snap_lat, snap_lon, radius_km, limit)
+        rows = await pool.fetch(_to_asyncpg(sql), *params)
+        results = dedupe_risks([dict(row) for row in rows], limit)
+    except Exception as e:
+        _stats["errors"] += 1
+        print(f"❌ Lỗi Query DB (get_active_risks): {e}")
+        return []
+    event_cache.put(key, results, generation)
+    return list(results)
+
+
+def async_db_stats() -> dict:
+    return {
+        **_stats,
+        "driver": "asyncpg" if asyncpg is not None else "psycopg2 (io pool)",
+        "pool_size": _pool.get_size() if _pool is not None else 0,
+        "pool_idle": _pool.get_idle_size() if _pool is not None else 0,
+    }
+
+
+register_metrics("async_db", async_db_stats)
@@ -51,4 +51,127 @@ VIETNAM_BBOX = {
 # Fallback nếu không đọc được CSV
 TARGET_LOCATIONS = [
     {"name": "Ho Chi Minh City", "lat": 10.7769, "lon": 106.7009}
-]
\ No newline at end of file
+]
+
+# Micro-batching cho API dự đoán AI: gom các request đồng thời thành 1 batch
+# (tối đa PREDICT_BATCH_MAX_SIZE bản ghi hoặc chờ tối đa PREDICT_BATCH_MAX_LATENCY_MS)
+PREDICT_BATCH_MAX_SIZE = int(os.getenv("PREDICT_BATCH_MAX_SIZE", "32"))
+PREDICT_BATCH_MAX_LATENCY_MS = float(os.getenv("PREDICT_BATCH_MAX_LATENCY_MS", "5"))
+
+# Cache kết quả dự đoán (LRU + TTL), key = version model + hash vector feature đã làm tròn
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "10000"))
+PREDICTION_CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", "300"))
+PREDICTION_CACHE_DECIMALS = int(os.getenv("PREDICTION_CACHE_DECIMALS", "2"))
+
+# Backend suy luận cho model cây XGBoost:
+# - "xgboost": runtime gốc của XGBoost (mặc định)
+# - "compiled": biên dịch cây thành mảng numpy (app/ml/tree_engine.py), tự quay về runtime gốc nếu không khớp
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "xgboost").lower()
+
+# Chu kỳ (giây) kiểm tra file model trong data/models để hot-swap; 0 = tắt
+MODEL_WATCH_INTERVAL = float(os.getenv("MODEL_WATCH_INTERVAL", "30"))
+
+# Warm-up model lúc khởi động: các kích thước batch chạy thử và số lần đo mỗi kích thước
+WARMUP_BATCH_SIZES = [int(x) for x in os.getenv("WARMUP_BATCH_SIZES", "1,8,64").split(",") if x.strip()]
+WARMUP_ITERATIONS = int(os.getenv("WARMUP_ITERATIONS", "20"))
+
+# Executor cho handler async: pool thread cho I/O chặn, pool process cho việc nặng CPU
+# *_MAX_QUEUE: số việc được xếp hàng thêm khi mọi worker đều bận (vượt quá -> 503); 0 = không giới hạn
+IO_POOL_SIZE = int(os.getenv("IO_POOL_SIZE", "32"))
+IO_POOL_MAX_QUEUE = int(os.getenv("IO_POOL_MAX_QUEUE", "256"))
+CPU_POOL_SIZE = int(os.getenv("CPU_POOL_SIZE", str(max(1, min(4, (os.cpu_count() or 2) - 1)))))
+CPU_POOL_MAX_QUEUE = int(os.getenv("CPU_POOL_MAX_QUEUE", "32"))
+CPU_POOL_START_METHOD = os.getenv("CPU_POOL_START_METHOD", "spawn")
+
+# Connection pool PostgreSQL (event store): số kết nối giữ sẵn / tối đa,
+# thời gian chờ tối đa khi pool hết kết nối, và chu kỳ ping kiểm tra kết nối nằm yên trong pool
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_HEALTHCHECK_INTERVAL = float(os.getenv("DB_POOL_HEALTHCHECK_INTERVAL", "30"))
+
+# Pool asyncpg cho các route async (nếu không cài asyncpg thì dùng pool psycopg2 ở trên qua io pool)
+ASYNC_DB_POOL_MIN_SIZE = int(os.getenv("ASYNC_DB_POOL_MIN_SIZE", "1"))
+ASYNC_DB_POOL_MAX_SIZE = int(os.getenv("ASYNC_DB_POOL_MAX_SIZE", "10"))
+
+# Partition bảng events theo tháng: tạo trước N tháng tới, xoá partition cũ hơn N tháng (0 = giữ vô hạn)
+EVENTS_PARTITION_MONTHS_AHEAD = int(os.getenv("EVENTS_PARTITION_MONTHS_AHEAD", "2"))
+EVENTS_RETENTION_MONTHS = int(os.getenv("EVENTS_RETENTION_MONTHS", "12"))
+
+# Cache truy vấn event store theo ô lưới toạ độ (0.01° ~ 1.1 km): số ô tối đa, TTL (giây); 0 = tắt
+GEO_CACHE_SIZE = int(os.getenv("GEO_CACHE_SIZE", "5000"))
+GEO_CACHE_TTL = float(os.getenv("GEO_CACHE_TTL", "120"))
+GEO_CACHE_CELL_DEG = float(os.getenv("GEO_CACHE_CELL_DEG", "0.01"))
+
+# Collector: "async" = thu thập đồng thời bằng httpx (app/worker/async_collector.py), "sync" = tuần tự bằng requests
+COLLECTOR_ENGINE = os.getenv("COLLECTOR_ENGINE", "async").lower()
+# Giới hạn cho từng upstream: "host=số_request_đồng_thời:số_request_mỗi_giây" (0 req/s = không giới hạn tốc độ)
+# OWM để 0 req/s: nhịp gọi OWM do quota từng key quyết định (app/core/api_keys.py)
+COLLECTOR_HOST_LIMITS = os.getenv(
+    "COLLECTOR_HOST_LIMITS",
+    "api.openweathermap.org=8:0,api.open-meteo.com=8:8,flood-api.open-meteo.com=8:8,"
+    "earthquake.usgs.gov=4:4,www.gdacs.org=1:0",
+)
+COLLECTOR_DEFAULT_HOST_LIMIT = os.getenv("COLLECTOR_DEFAULT_HOST_LIMIT", "4:0")
+COLLECTOR_HTTP_TIMEOUT = float(os.getenv("COLLECTOR_HTTP_TIMEOUT", "30"))
+# Số lần thử lại khi upstream trả 429/5xx hoặc lỗi mạng (có tôn trọng Retry-After)
+COLLECTOR_MAX_RETRIES = int(os.getenv("COLLECTOR_MAX_RETRIES", "2"))
+
+# Quota mỗi key OWM: "số_lượt/số_giây" cho từng cửa sổ trượt (gói free: 60 lượt/phút, 1 triệu lượt/tháng)
+OWM_KEY_BUDGETS = os.getenv("OWM_KEY_BUDGETS", "60/60,1000000/2592000")
+# Key bị nghỉ bao lâu (giây) khi OWM trả 429 (hết quota) / 401 (key sai hoặc bị khoá)
+OWM_KEY_COOLDOWN_429 = float(os.getenv("OWM_KEY_COOLDOWN_429", "60"))
+OWM_KEY_COOLDOWN_401 = float(os.getenv("OWM_KEY_COOLDOWN_401", "3600"))
+# Collector và API là 2 process riêng, mỗi bên chỉ được dùng 1 phần quota của từng key
+OWM_COLLECTOR_QUOTA_SHARE = float(os.getenv("OWM_COLLECTOR_QUOTA_SHARE", "0.8"))
+# Collector chạy theo tick (phút); mỗi tick chỉ làm mới các địa điểm đến hạn
+COLLECTOR_TICK_MINUTES = float(os.getenv("COLLECTOR_TICK_MINUTES", "5"))
+# Khoảng làm mới mong muốn (phút) theo mức rủi ro hiện tại của địa điểm; bị giãn ra nếu vượt quota OWM
+COLLECTOR_REFRESH_MINUTES = os.getenv("COLLECTOR_REFRESH_MINUTES", "no=60,low=30,mid=15,mid-high=10,high=5")
+COLLECTOR_SCHEDULE_PATH = os.getenv(
+    "COLLECTOR_SCHEDULE_PATH", os.path.join(os.path.dirname(BASE_DIR), "data", "cache", "collector_schedule.json")
+)
+
+# Catalog động đất của cả vùng (USGS) cache trên đĩa, mỗi chu kỳ collector chỉ lấy event mới/cập nhật sau watermark
+EARTHQUAKE_CATALOG_PATH = os.getenv(
+    "EARTHQUAKE_CATALOG_PATH", os.path.join(os.path.dirname(BASE_DIR), "data", "cache", "earthquake_catalog.json")
+)
+# Tải lại toàn bộ catalog định kỳ (giờ) để loại event USGS đã xoá/gộp
+EARTHQUAKE_CATALOG_FULL_REFRESH_HOURS = float(os.getenv("EARTHQUAKE_CATALOG_FULL_REFRESH_HOURS", "168"))
+
+# Collector ghi CSV/DB theo từng micro-batch địa điểm và lưu checkpoint chu kỳ để chạy tiếp sau khi bị dừng giữa chừng
+COLLECTOR_FLUSH_BATCH_SIZE = int(os.getenv("COLLECTOR_FLUSH_BATCH_SIZE", "50"))
+COLLECTOR_CHECKPOINT_PATH = os.getenv(
+    "COLLECTOR_CHECKPOINT_PATH", os.path.join(os.path.dirname(BASE_DIR), "data", "cache", "collector_checkpoint.json")
+)
+
+# Đầu ra của collector: "csv", "parquet", "arrow" hoặc kết hợp, VD "csv,parquet" (parquet/arrow cần pyarrow)
+COLLECTOR_OUTPUT = [fmt.strip().lower() for fmt in os.getenv("COLLECTOR_OUTPUT", "csv").split(",") if fmt.strip()]
+# Lịch sử dạng cột, chia partition theo ngày: <dir>/date=YYYY-MM-DD/*.parquet|*.arrow
+COLLECTOR_HISTORY_DIR = os.getenv("COLLECTOR_HISTORY_DIR", os.path.join(os.path.dirname(BASE_DIR), "data", "history", "collector"))
+COLLECTOR_HISTORY_FORMAT = next((fmt for fmt in COLLECTOR_OUTPUT if fmt in ("parquet", "arrow")), "parquet")
+
+# Trạng thái feed GDACS (ETag/Last-Modified + GUID đã gửi vào DB) giữa các chu kỳ collector
+GDACS_STATE_PATH = os.getenv(
+    "GDACS_STATE_PATH", os.path.join(os.path.dirname(BASE_DIR), "data", "cache", "gdacs_feed.json")
+)
+# GUID đã rời feed quá số ngày này thì quên đi
+GDACS_SEEN_TTL_DAYS = float(os.getenv("GDACS_SEEN_TTL_DAYS", "30"))
+
+# Số toạ độ tối đa gộp vào 1 request Open-Meteo (forecast/flood nhận danh sách toạ độ)
+OPEN_METEO_BATCH_SIZE = int(os.getenv("OPEN_METEO_BATCH_SIZE", "50"))
+# Dự báo 7 ngày: các request đồng thời trong cửa sổ này được gộp thành 1 lần gọi Open-Meteo
+FORECAST_BATCH_MAX_LATENCY_MS = float(os.getenv("FORECAST_BATCH_MAX_LATENCY_MS", "20"))
+
+# Cache response của các API thời tiết (OWM, Open-Meteo, flood) dùng chung mọi module, lưu SQLite trên đĩa ("" = chỉ trong RAM)
+HTTP_CACHE_PATH = os.getenv(
+    "HTTP_CACHE_PATH", os.path.join(os.path.dirname(BASE_DIR), "data", "cache", "http_cache.sqlite")
+)
+# TTL (giây) theo host: "host=giây,..." (host không có trong danh sách hoặc 0 = không cache)
+# TTL của OWM nên nhỏ hơn COLLECTOR_TICK_MINUTES, không thì địa điểm rủi ro cao (làm mới mỗi tick) nhận lại dữ liệu cũ
+HTTP_CACHE_TTLS = os.getenv(
+    "HTTP_CACHE_TTLS", "api.openweathermap.org=240,api.open-meteo.com=900,flood-api.open-meteo.com=10800"
+)
+# Toạ độ trong key cache làm tròn theo ô lưới (0.01° ~ 1.1 km); 0 = giữ nguyên toạ độ
+HTTP_CACHE_CELL_DEG = float(os.getenv("HTTP_CACHE_CELL_DEG", "0.01"))
+HTTP_CACHE_MAX_ENTRIES = int(os.getenv("HTTP_CACHE_MAX_ENTRIES", "200000"))
@@ -1,157 +1,388 @@
+import threading
+import time
+from contextlib import contextmanager
+
 import psycopg2
+from psycopg2 import pool as pg_pool
 from psycopg2.extras import RealDictCursor
-from app.core.config import DB_CONFIG
+from app.core.config import (
+    DB_CONFIG,
+    DB_POOL_MIN_SIZE,
+    DB_POOL_MAX_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_POOL_HEALTHCHECK_INTERVAL,
+)
+from app.core.geo_cache import MISS, event_cache, invalidate_event_cache
+from app.core.metrics import register_metrics
+from app.core.schema import LATEST_UPSERT_TEMPLATE, ensure_schema, is_schema_ready, maintain_partitions
 from psycopg2.extras import Json, execute_values
 
-def get_db_connection():
+# --- CONNECTION POOL DÙNG CHUNG CHO EVENT STORE ---
+# ThreadedConnectionPool báo lỗi ngay khi hết kết nối -> semaphore giữ cho caller chờ tới lượt
+_pool = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(max(1, DB_POOL_MAX_SIZE))
+_last_used = {}  # id(conn) -> thời điểm trả về pool, để biết khi nào cần health check
+_pool_stats = {"checkouts": 0, "timeouts": 0, "errors": 0, "discarded": 0, "in_use": 0}
+_stats_lock = threading.Lock()
+
+def _count(key, delta=1):
+    with _stats_lock:
+        _pool_stats[key] += delta
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = pg_pool.ThreadedConnectionPool(
+                    max(0, min(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE)), max(1, DB_POOL_MAX_SIZE), **DB_CONFIG
+                )
+                print(f"✅ [DB] Connection pool sẵn sàng ({DB_POOL_MIN_SIZE}-{DB_POOL_MAX_SIZE} kết nối)")
+    return _pool
+
+def _is_healthy(conn) -> bool:
+    """Kết nối còn sống? Chỉ ping DB khi kết nối đã nằm yên trong pool lâu hơn chu kỳ health check"""
+    if conn.closed:
+        return False
+    if time.monotonic() - _last_used.get(id(conn), 0) < DB_POOL_HEALTHCHECK_INTERVAL:
+        return True
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        return conn
-    except Exception as e:
-        print(f"❌ Database Connection Error: {e}")
-        return None
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except Exception:
+        return False
 
-def fetch_latest_weather_data(lat: float, lon: float, radius_km: int = 50):
-    conn = get_db_connection()
-    if not conn: return None
-    
-    result = None
+def _discard(pool, conn):
+    _last_used.pop(id(conn), None)
+    _count("discarded")
     try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            sql = """
-                SELECT raw_data 
-                FROM events 
-                WHERE event_type = 'weather_analytics'
-                AND event_time >= NOW() - INTERVAL '24 HOURS'
-                AND ST_DWithin(
-                    geom::geography, 
-                    ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography, 
-                    %s
-                )
-                ORDER BY event_time DESC 
-                LIMIT 1
-            """
-            cur.execute(sql, (lon, lat, radius_km * 1000))
-            row = cur.fetchone()
-            if row: result = row['raw_data'] 
-    except Exception as e:
-        print(f"❌ Error fetching weather data: {e}")
+        pool.putconn(conn, close=True)
+    except Exception:
+        pass
+
+@contextmanager
+def db_connection():
+    """
+    Mượn 1 kết nối từ pool (yield None nếu không kết nối được DB, giống get_db_connection cũ).
+    Hết khối with: transaction dở dang bị rollback, kết nối được trả lại pool;
+    kết nối hỏng bị đóng và thay bằng kết nối mới ở lần mượn sau.
+    """
+    if not _slots.acquire(timeout=DB_POOL_TIMEOUT):
+        _count("timeouts")
+        print(f"❌ Database Connection Error: hết kết nối trong pool sau {DB_POOL_TIMEOUT}s")
+        yield None
+        return
+
+    pool, conn = None, None
+    try:
+        try:
+            pool = _get_pool()
+            conn = pool.getconn()
+            # Thử tối đa vài lần nếu gặp kết nối chết (VD: DB vừa restart)
+            for _ in range(DB_POOL_MAX_SIZE):
+                if _is_healthy(conn):
+                    break
+                _discard(pool, conn)
+                conn = pool.getconn()
+            _count("checkouts")
+        except Exception as e:
+            _count("errors")
+            print(f"❌ Database Connection Error: {e}")
+            if conn is not None:
+                _discard(pool, conn)
+            conn = None
+
+        if conn is None:
+            yield None
+            return
+
+        _count("in_use")
+        broken = False
+        try:
+            yield conn
+        except psycopg2.OperationalError:
+            broken = True
+            raise
+        finally:
+            _count("in_use", -1)
+            try:
+                if not conn.closed and conn.status != psycopg2.extensions.STATUS_READY:
+                    conn.rollback()
+            except Exception:
+                broken = True
+            if broken or conn.closed:
+                _discard(pool, conn)
+            else:
+                _last_used[id(conn)] = time.monotonic()
+                pool.putconn(conn)
     finally:
-        conn.close()
+        _slots.release()
+
+def close_db_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _last_used.clear()
+
+def db_pool_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_pool_stats)
+    return {
+        **stats,
+        "config": {"min": DB_POOL_MIN_SIZE, "max": DB_POOL_MAX_SIZE, "timeout_s": DB_POOL_TIMEOUT},
+        "initialized": _pool is not None,
+    }
+
+register_metrics("db_pool", db_pool_stats)
+
+# --- SCHEMA (events, events_latest, index, partition) do app/core/schema.py quản lý ---
+def ensure_event_schema(conn=None):
+    """Chạy migration còn thiếu (mỗi process chỉ 1 lần) trước khi đọc/ghi event store"""
+    if is_schema_ready():
+        return True
+    if conn is None:
+        with db_connection() as pooled:
+            return bool(pooled) and ensure_schema(pooled)
+    return ensure_schema(conn)
+
+def maintain_event_store():
+    """Migration + tạo/xoá partition theo tháng (collector gọi đầu mỗi chu kỳ)"""
+    with db_connection() as conn:
+        if not conn or not ensure_event_schema(conn):
+            return None
+        try:
+            return maintain_partitions(conn)
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ [Schema] Lỗi bảo trì partition: {e}")
+            return None
+
+# event_time NULL: dòng cũ ghi trước khi upsert bỏ qua event_time NULL -> dọn luôn
+EVENTS_LATEST_RETENTION_SQL = """
+    DELETE FROM events_latest
+    WHERE event_time IS NULL OR event_time < NOW() - INTERVAL '24 HOURS'
+"""
+
+# --- SQL DÙNG CHUNG (placeholder kiểu psycopg2; bản async tự đổi sang $1, $2...) ---
+# Đọc từ events_latest: geog có GiST index, mỗi (địa điểm, hazard) chỉ còn 1 dòng
+LATEST_WEATHER_SQL = """
+    SELECT raw_data 
+    FROM events_latest 
+    WHERE event_type = 'weather_analytics'
+    AND event_time >= NOW() - INTERVAL '24 HOURS'
+    AND ST_DWithin(
+        geog, 
+        ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography, 
+        %s
+    )
+    ORDER BY event_time DESC 
+    LIMIT 1
+"""
+
+# [FIX] Đã XÓA dòng: AND raw_data->>'overall_hazard_prediction' != 'No'
+# Để hiển thị cả những vùng an toàn (Info/Green)
+ACTIVE_RISKS_BASE_SQL = """
+    SELECT event_id AS id, title, description, event_time, 
+           ST_X(geom) as lon, ST_Y(geom) as lat,
+           raw_data
+    FROM events_latest 
+    WHERE event_time >= NOW() - INTERVAL '24 HOURS'
+"""
+ACTIVE_RISKS_NEARBY_SQL = ACTIVE_RISKS_BASE_SQL + """
+    AND ST_DWithin(
+        geog, 
+        ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography, 
+        %s
+    )
+    ORDER BY event_time DESC
+    LIMIT %s
+"""
+ACTIVE_RISKS_ALL_SQL = ACTIVE_RISKS_BASE_SQL + " ORDER BY event_time DESC LIMIT %s"
+
+def active_risks_query(lat, lon, radius_km, limit):
+    """(sql, params) cho get_active_risks: lọc theo bán kính nếu có toạ độ"""
+    if lat is not None and lon is not None:
+        return ACTIVE_RISKS_NEARBY_SQL, (lon, lat, radius_km * 1000, limit)
+    return ACTIVE_RISKS_ALL_SQL, (limit,)
+
+def dedupe_risks(raw_results, limit):
+    """
+    Lọc trùng (chỉ lấy mới nhất cho mỗi địa điểm); raw_results đã sắp xếp mới nhất trước.
+    events_latest vốn đã là 1 dòng/(địa điểm, hazard), bước này chỉ còn để phòng hờ.
+    """
+    seen_locations = set()
+    unique_results = []
+    
+    for row in raw_results:
+        loc_name = row['title']
+        hazard_type = row['raw_data'].get('overall_hazard_prediction', 'Unknown')
+        
+        # Key duy nhất gồm Tên + Loại rủi ro
+        unique_key = f"{loc_name}-{hazard_type}"
+        
+        if unique_key not in seen_locations:
+            unique_results.append(row)
+            seen_locations.add(unique_key)
     
+    return unique_results[:limit]
+
+def fetch_latest_weather_data(lat: float, lon: float, radius_km: int = 50):
+    key = event_cache.key("weather", lat, lon, radius_km)
+    cached = event_cache.get(key)
+    if cached is not MISS:
+        return cached
+    return load_latest_weather_data(key, *event_cache.snap(lat, lon), radius_km)
+
+def load_latest_weather_data(cache_key, lat, lon, radius_km):
+    """Truy vấn DB (bỏ qua cache) rồi lưu kết quả vào cache; lỗi thì không cache"""
+    generation = event_cache.generation
+    with db_connection() as conn:
+        if not conn: return None
+        ensure_event_schema(conn)
+        try:
+            result = _fetch_latest_weather_data(conn, lat, lon, radius_km)
+        except Exception as e:
+            print(f"❌ Error fetching weather data: {e}")
+            return None
+    event_cache.put(cache_key, result, generation)
     return result
 
+def _fetch_latest_weather_data(conn, lat, lon, radius_km):
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(LATEST_WEATHER_SQL, (lon, lat, radius_km * 1000))
+        row = cur.fetchone()
+        return row['raw_data'] if row else None
+
 def get_active_risks(lat=None, lon=None, radius_km=50, limit=200):
-    conn = get_db_connection()
-    if not conn: return []
-    
-    results = []
-    try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            # [FIX] Đã XÓA dòng: AND raw_data->>'overall_hazard_prediction' != 'No'
-            # Để hiển thị cả những vùng an toàn (Info/Green)
-            base_query = """
-                SELECT id, title, description, event_time, 
-                       ST_X(geom::geometry) as lon, ST_Y(geom::geometry) as lat,
-                       raw_data
-                FROM events 
-                WHERE event_time >= NOW() - INTERVAL '24 HOURS'
-            """
-            
-            if lat is not None and lon is not None:
-                query = base_query + """
-                    AND ST_DWithin(
-                        geom::geography, 
-                        ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography, 
-                        %s
-                    )
-                    ORDER BY event_time DESC
-                """
-                cur.execute(query, (lon, lat, radius_km * 1000))
-            else:
-                query = base_query + " ORDER BY event_time DESC LIMIT %s"
-                cur.execute(query, (limit * 2,)) 
-            
-            raw_results = cur.fetchall()
+    key = event_cache.key("risks", lat, lon, radius_km, limit)
+    cached = event_cache.get(key)
+    if cached is not MISS:
+        return list(cached)
+    return load_active_risks(key, *event_cache.snap(lat, lon), radius_km, limit)
 
-            # Lọc trùng (chỉ lấy mới nhất cho mỗi địa điểm)
-            seen_locations = set()
-            unique_results = []
-            
-            for row in raw_results:
-                loc_name = row['title']
-                hazard_type = row['raw_data'].get('overall_hazard_prediction', 'Unknown')
-                
-                # Key duy nhất gồm Tên + Loại rủi ro
-                unique_key = f"{loc_name}-{hazard_type}"
-                
-                if unique_key not in seen_locations:
-                    unique_results.append(row)
-                    seen_locations.add(unique_key)
-            
-            results = unique_results[:limit]
+def load_active_risks(cache_key, lat, lon, radius_km, limit):
+    """Truy vấn DB (bỏ qua cache) rồi lưu kết quả vào cache; lỗi thì không cache"""
+    generation = event_cache.generation
+    with db_connection() as conn:
+        if not conn: return []
+        ensure_event_schema(conn)
+        try:
+            results = _get_active_risks(conn, lat, lon, radius_km, limit)
+        except Exception as e:
+            print(f"❌ Lỗi Query DB (get_active_risks): {e}")
+            return []
+    event_cache.put(cache_key, results, generation)
+    return list(results)
+
+def _get_active_risks(conn, lat, lon, radius_km, limit):
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(*active_risks_query(lat, lon, radius_km, limit))
+        return dedupe_risks(cur.fetchall(), limit)
+
+# Ghi cả batch trong 1 câu lệnh: geom dựng ngay trong SQL từ lon/lat,
+# bỏ qua sự kiện đã có (cùng source, title, event_time; event_time NULL coi là bằng nhau),
+# đồng thời upsert các dòng vừa ghi vào events_latest.
+# Không dùng IS NOT DISTINCT FROM: Postgres không dùng được index/partition pruning với nó.
+# event_time có giá trị -> so "=" (dò đúng 1 partition qua index dedup);
+# event_time NULL -> kiểm tra riêng "IS NULL" (chỉ nằm ở partition default)
+BULK_INSERT_EVENTS_SQL = """
+    WITH inserted AS (
+    INSERT INTO events (source, event_type, title, description, event_time, geom, raw_data)
+    SELECT v.source, v.event_type, v.title, v.description, v.event_time,
+           CASE WHEN v.lon IS NULL OR v.lat IS NULL THEN NULL
+                ELSE ST_SetSRID(ST_MakePoint(v.lon, v.lat), 4326) END,
+           v.raw_data
+    FROM (VALUES %s) AS v(source, event_type, title, description, event_time, lon, lat, raw_data)
+    WHERE (
+        v.event_time IS NULL
+        OR NOT EXISTS (
+            SELECT 1 FROM events e
+            WHERE e.source = v.source
+              AND e.title = v.title
+              AND e.event_time = v.event_time
+        )
+    )
+    AND (
+        v.event_time IS NOT NULL
+        OR NOT EXISTS (
+            SELECT 1 FROM events e
+            WHERE e.source = v.source
+              AND e.title = v.title
+              AND e.event_time IS NULL
+        )
+    )
+    ON CONFLICT DO NOTHING
+    RETURNING id, source, event_type, title, description, event_time, geom, raw_data
+    ),
+    latest AS (""" + LATEST_UPSERT_TEMPLATE.format(source="inserted") + """)
+    SELECT COUNT(*) FROM inserted
+"""
+BULK_INSERT_EVENTS_TEMPLATE = "(%s, %s, %s, %s, %s::timestamptz, %s::float8, %s::float8, %s::jsonb)"
+
+def event_dedup_key(event):
+    return (event["source"], event["title"], event.get("event_time"))
+
+def prepare_event_rows(events_list):
+    """Tuple cho BULK_INSERT_EVENTS_SQL, bỏ trùng ngay trong batch (giữ bản đầu tiên)"""
+    seen = set()
+    rows = []
+    for event in events_list:
+        key = event_dedup_key(event)
+        if key in seen:
+            continue
+        seen.add(key)
+        rows.append((
+            event["source"],
+            event["event_type"],
+            event["title"],
+            event["description"],
+            event.get("event_time"),
+            event.get("lon"),
+            event.get("lat"),
+            Json(event["raw_data"]),
+        ))
+    return rows
 
-    except Exception as e:
-        print(f"❌ Lỗi Query DB (get_active_risks): {e}")
-    finally:
-        if conn: conn.close()
-    
-    return results
 def write_events_to_database(events_list):
     """
-    Ghi dữ liệu thu thập được vào bảng events (Dùng cho Data Collector)
+    Ghi dữ liệu thu thập được vào bảng events (Dùng cho Data Collector).
+    Cả batch đi trong 1 round-trip; sự kiện trùng (source, title, event_time) bị bỏ qua,
+    nên chạy lại cùng 1 batch không sinh bản ghi lặp.
+    Trả về True nếu batch đã được ghi (hoặc không có gì để ghi).
     """
     if not events_list:
         print("ℹ️ [DB] Không có sự kiện mới để ghi.")
-        return
+        return True
     
-    conn = get_db_connection()
-    if not conn: return
+    with db_connection() as conn:
+        if not conn: return False
+        return _write_events(conn, events_list)
 
+def _write_events(conn, events_list):
+    rows = prepare_event_rows(events_list)
+    ensure_event_schema(conn)
     try:
         with conn.cursor() as cur:
-            sql = """
-            INSERT INTO events (source, event_type, title, description, event_time, geom, raw_data)
-            VALUES %s
-            ON CONFLICT DO NOTHING; -- Tránh lỗi nếu trùng lặp
-            """
-            data_to_insert = []
-            for event in events_list:
-                geom_sql = None
-                if event["lon"] is not None and event["lat"] is not None:
-                    # Tạo cú pháp hình học cho PostGIS
-                    geom_sql = f"ST_SetSRID(ST_MakePoint({event['lon']}, {event['lat']}), 4326)"
-                
-                data_to_insert.append((
-                    event["source"], 
-                    event["event_type"], 
-                    event["title"],
-                    event["description"], 
-                    event.get("event_time"),
-                    geom_sql, # Lưu ý: Khi dùng execute_values, chuỗi này cần xử lý khéo léo hoặc dùng string format trước
-                    Json(event["raw_data"])
-                ))
-            
-            # Lưu ý: execute_values với PostGIS cần xử lý geom cẩn thận. 
-            # Để đơn giản và an toàn nhất trong context này, ta loop insert hoặc dùng logic cũ.
-            # Dưới đây là logic an toàn từ code cũ của bạn, chuyển sang dùng conn backend:
-            
-            for item in data_to_insert:
-                # Bung item ra để insert từng dòng (chậm hơn chút nhưng an toàn logic cũ)
-                cur.execute("""
-                    INSERT INTO events (source, event_type, title, description, event_time, geom, raw_data)
-                    VALUES (%s, %s, %s, %s, %s, ST_SetSRID(ST_MakePoint(%s, %s), 4326), %s)
-                """, (
-                    item[0], item[1], item[2], item[3], item[4], 
-                    events_list[data_to_insert.index(item)]['lon'], # Lấy lại lon
-                    events_list[data_to_insert.index(item)]['lat'], # Lấy lại lat
-                    item[6]
-                ))
-            
-            conn.commit()
-            print(f"✅ [DB] Đã ghi {len(data_to_insert)} sự kiện vào Database.")
+            # page_size = cả batch -> đúng 1 câu lệnh gửi lên DB (ghi events + upsert events_latest)
+            result = execute_values(
+                cur, BULK_INSERT_EVENTS_SQL, rows,
+                template=BULK_INSERT_EVENTS_TEMPLATE, page_size=max(1, len(rows)), fetch=True
+            )
+            inserted = result[0][0] if result else 0
+            # Dọn trạng thái cũ hơn cửa sổ 24h để bảng luôn nhỏ
+            cur.execute(EVENTS_LATEST_RETENTION_SQL)
+        conn.commit()
+        # Dữ liệu mới đã vào DB -> kết quả truy vấn theo toạ độ đang cache không còn đúng
+        invalidate_event_cache()
+        print(f"✅ [DB] Đã ghi {inserted}/{len(events_list)} sự kiện vào Database (bỏ qua {len(events_list) - inserted} bản trùng).")
+        return True
             
     except Exception as error:
+        conn.rollback()
         print(f"❌ [DB] Lỗi khi ghi batch: {error}")
-    finally:
-        conn.close()
\ No newline at end of file
+        return False
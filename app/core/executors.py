@@ -0,0 +1,156 @@
+import asyncio
+import functools
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from app.core.config import (
+    IO_POOL_SIZE,
+    IO_POOL_MAX_QUEUE,
+    CPU_POOL_SIZE,
+    CPU_POOL_MAX_QUEUE,
+    CPU_POOL_START_METHOD,
+)
+from app.core.metrics import register_metrics
+
+
+class ExecutorBusyError(Exception):
+    """Pool đã đầy hàng đợi -> router nên trả 503 thay vì xếp hàng vô hạn"""
+
+
+class ManagedExecutor:
+    """
+    Bọc 1 pool (thread hoặc process) với giới hạn số việc đang chờ + số liệu hàng đợi.
+    Pool được tạo lazy lần đầu có việc, để import module không sinh thread/process.
+    """
+
+    def __init__(self, name: str, kind: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.kind = kind  # "thread" | "process"
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "errors": 0,
+            "rejected": 0,
+            "in_flight": 0,
+            "max_in_flight": 0,
+            "wait_ms_total": 0.0,
+            "run_ms_total": 0.0,
+        }
+        register_metrics(f"executor.{name}", self.stats)
+
+    def _get_pool(self):
+        if self._pool is not None:
+            return self._pool
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = self._create_pool()
+        return self._pool
+
+    def _create_pool(self):
+        if self.kind == "process":
+            try:
+                # spawn: process con chỉ import module chứa hàm được gọi, không thừa hưởng thread/lock của server
+                ctx = multiprocessing.get_context(CPU_POOL_START_METHOD)
+                return ProcessPoolExecutor(max_workers=self.max_workers, mp_context=ctx)
+            except Exception as e:
+                print(f"⚠️ [Executor] {self.name}: không tạo được process pool ({e}) -> dùng thread pool")
+                self.kind = "thread"
+        return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"{self.name}-pool")
+
+    async def run(self, func, *args, **kwargs):
+        """Chạy func trong pool và await kết quả; raise ExecutorBusyError nếu hàng đợi đã đầy"""
+        with self._stats_lock:
+            limit = self.max_workers + self.max_queue
+            if self.max_queue and self._stats["in_flight"] >= limit:
+                self._stats["rejected"] += 1
+                raise ExecutorBusyError(f"Hệ thống đang bận ({self.name} pool đầy), vui lòng thử lại sau")
+            self._stats["submitted"] += 1
+            self._stats["in_flight"] += 1
+            self._stats["max_in_flight"] = max(self._stats["max_in_flight"], self._stats["in_flight"])
+
+        # partial của hàm cấp module vẫn pickle được cho process pool
+        call = functools.partial(func, *args, **kwargs)
+        submitted_at = started_at = time.perf_counter()
+        error = False
+        try:
+            loop = asyncio.get_running_loop()
+            if self.kind == "thread":
+                # Thread pool đo được cả thời gian chờ trong hàng đợi
+                started_at, result = await loop.run_in_executor(self._get_pool(), _timed, call)
+            else:
+                result = await loop.run_in_executor(self._get_pool(), call)
+            return result
+        except BrokenProcessPool:
+            # 1 process con chết làm hỏng cả pool -> bỏ pool, lần sau tạo lại
+            error = True
+            self.shutdown()
+            raise
+        except Exception:
+            error = True
+            raise
+        finally:
+            finished_at = time.perf_counter()
+            with self._stats_lock:
+                self._stats["in_flight"] -= 1
+                self._stats["completed"] += 1
+                if error:
+                    self._stats["errors"] += 1
+                else:
+                    self._stats["wait_ms_total"] += (started_at - submitted_at) * 1000
+                    self._stats["run_ms_total"] += (finished_at - started_at) * 1000
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            s = dict(self._stats)
+        done = s["completed"] - s["errors"]
+        return {
+            **s,
+            "kind": self.kind,
+            "config": {"max_workers": self.max_workers, "max_queue": self.max_queue},
+            "queue_depth": max(0, s["in_flight"] - self.max_workers),
+            "avg_wait_ms": round(s["wait_ms_total"] / done, 3) if done else 0.0,
+            "avg_run_ms": round(s["run_ms_total"] / done, 3) if done else 0.0,
+        }
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+def _timed(call):
+    return time.perf_counter(), call()
+
+
+# Pool I/O: việc chặn chờ mạng/DB (requests, psycopg2...) -> nhiều thread
+io_executor = ManagedExecutor("io", "thread", IO_POOL_SIZE, IO_POOL_MAX_QUEUE)
+# Pool CPU: việc tính toán nặng (quét CSV, pandas...) -> process riêng để tránh GIL
+cpu_executor = ManagedExecutor("cpu", "process", CPU_POOL_SIZE, CPU_POOL_MAX_QUEUE)
+
+
+async def run_io(func, *args, **kwargs):
+    """Chạy hàm blocking I/O trong io pool (không chặn event loop)"""
+    return await io_executor.run(func, *args, **kwargs)
+
+
+async def run_cpu(func, *args, **kwargs):
+    """
+    Chạy hàm CPU nặng trong cpu pool (process riêng).
+    func + tham số + kết quả phải pickle được: dùng hàm cấp module, không dùng lambda/bound method.
+    """
+    return await cpu_executor.run(func, *args, **kwargs)
+
+
+def shutdown_executors():
+    io_executor.shutdown()
+    cpu_executor.shutdown()
@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import OrderedDict
+
+from app.core.config import GEO_CACHE_CELL_DEG, GEO_CACHE_SIZE, GEO_CACHE_TTL
+from app.core.metrics import register_metrics
+
+# Phân biệt "không có trong cache" với giá trị None đã cache (VD: không có dữ liệu thời tiết gần đó)
+MISS = object()
+
+
+class GeoCache:
+    """
+    Cache LRU + TTL cho truy vấn theo toạ độ (event store).
+    Toạ độ được làm tròn về tâm ô lưới cell_deg (0.01° ~ 1.1 km): mọi request trong cùng 1 ô
+    dùng chung 1 kết quả, và truy vấn DB cũng chạy với tâm ô đó để kết quả không phụ thuộc ai hỏi trước.
+    Dữ liệu chỉ đổi sau mỗi chu kỳ collector -> xoá toàn bộ cache khi có batch ingest mới.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: int = GEO_CACHE_SIZE,
+        ttl: float = GEO_CACHE_TTL,
+        cell_deg: float = GEO_CACHE_CELL_DEG,
+    ):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.cell_deg = cell_deg
+
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.last_invalidated_at = None
+        # Tăng mỗi lần clear(): kết quả của truy vấn bắt đầu trước lần clear sẽ không được lưu lại
+        self.generation = 0
+        register_metrics(f"geo_cache.{name}", self.stats)
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0 and self.ttl > 0 and self.cell_deg > 0
+
+    def snap(self, lat, lon):
+        """(lat, lon) -> tâm ô lưới chứa nó; None giữ nguyên (truy vấn toàn quốc)"""
+        if lat is None or lon is None or not self.enabled:
+            return lat, lon
+        return (
+            round(round(lat / self.cell_deg) * self.cell_deg, 6),
+            round(round(lon / self.cell_deg) * self.cell_deg, 6),
+        )
+
+    def key(self, kind: str, lat, lon, *params):
+        """Key = loại truy vấn + ô lưới + các tham số còn lại (bán kính, limit...)"""
+        return (kind, *self.snap(lat, lon), *params)
+
+    def get(self, key):
+        """Trả về value hoặc MISS nếu không có / đã hết hạn"""
+        if not self.enabled:
+            return MISS
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return MISS
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, generation=None):
+        """generation: giá trị self.generation lúc bắt đầu truy vấn (bỏ qua nếu cache đã bị xoá giữa chừng)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Xoá toàn bộ cache (khi có batch dữ liệu mới được ghi vào event store)"""
+        with self._lock:
+            self._data.clear()
+            self.generation += 1
+            self.invalidations += 1
+            self.last_invalidated_at = time.time()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._data)
+        total = self.hits + self.misses
+        return {
+            "size": size,
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "cell_deg": self.cell_deg,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "last_invalidated_at": self.last_invalidated_at,
+        }
+
+
+# Dùng chung cho bản sync (database.py) và async (async_database.py)
+event_cache = GeoCache("events")
+
+
+def invalidate_event_cache():
+    """Gọi khi có batch ingest mới (cùng process) hoặc khi collector báo đã thu thập xong"""
+    event_cache.clear()
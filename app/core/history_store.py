@@ -0,0 +1,163 @@
+"""
+Lưu lịch sử collector dạng cột (Parquet hoặc Arrow IPC), chia partition theo ngày:
+    <COLLECTOR_HISTORY_DIR>/date=YYYY-MM-DD/part-<ms>-<id>.parquet
+Cột có kiểu cố định (timestamp, float, nhãn dictionary-encoded) -> phân tích/huấn luyện chỉ đọc
+đúng các ngày + cột cần, không phải parse lại cả file CSV.
+"""
+import glob
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+
+# pyarrow là tuỳ chọn: không có thì collector chỉ ghi CSV
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    import pyarrow.feather as feather
+except ImportError:
+    pa = ds = pq = feather = None
+
+from app.core.config import COLLECTOR_HISTORY_DIR, COLLECTOR_HISTORY_FORMAT
+
+# Thứ tự cột của dòng collector (dùng chung với CSV)
+HISTORY_FIELDS = [
+    ("timestamp", "timestamp"),
+    ("location", "label"), ("lat", "float64"), ("lon", "float64"),
+    ("temperature", "float32"), ("humidity", "float32"), ("pressure", "float32"), ("wind_speed", "float32"),
+    ("precip6", "float32"), ("precip24", "float32"), ("gust6", "float32"),
+    ("river_discharge", "float32"),
+    ("eq_mag", "float32"), ("eq_dist", "float32"),
+    ("rain_label", "label"), ("wind_label", "label"), ("storm_label", "label"),
+    ("flood_label", "label"), ("earthquake_label", "label"),
+    ("overall_hazard_prediction", "label"),
+]
+HISTORY_COLUMNS = [name for name, _ in HISTORY_FIELDS]
+EXTENSIONS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+
+def available() -> bool:
+    return pa is not None
+
+
+def history_schema():
+    types = {
+        "timestamp": pa.timestamp("s", tz="UTC"),
+        "label": pa.dictionary(pa.int32(), pa.string()),
+        "float64": pa.float64(),
+        "float32": pa.float32(),
+    }
+    return pa.schema([(name, types[kind]) for name, kind in HISTORY_FIELDS])
+
+
+def _to_table(rows: list):
+    """Dòng dict của collector -> pyarrow.Table theo history_schema (timestamp dạng 'YYYY-mm-dd HH:MM:SS' UTC)"""
+    schema = history_schema()
+    columns = {}
+    for field in schema:
+        values = [row.get(field.name) for row in rows]
+        if pa.types.is_timestamp(field.type):
+            values = [datetime.strptime(v, "%Y-%m-%d %H:%M:%S") if isinstance(v, str) else v for v in values]
+            columns[field.name] = pa.array(values, type=field.type)
+        elif pa.types.is_dictionary(field.type):
+            columns[field.name] = pa.array([None if v is None else str(v) for v in values], type=pa.string()).dictionary_encode()
+        else:
+            columns[field.name] = pa.array([None if v is None or v == "" else float(v) for v in values], type=field.type)
+    return pa.table(columns, schema=schema)
+
+
+def _write_file(table, path: str, fmt: str):
+    tmp_path = path + ".tmp"
+    if fmt == "arrow":
+        feather.write_feather(table, tmp_path, compression="zstd")
+    else:
+        pq.write_table(table, tmp_path, compression="zstd")
+    os.replace(tmp_path, path)  # reader không bao giờ thấy file dở dang
+
+
+def write_history(rows: list, root: str = COLLECTOR_HISTORY_DIR, fmt: str = COLLECTOR_HISTORY_FORMAT) -> int:
+    """
+    Ghi 1 micro-batch dòng collector thành 1 file mới trong partition của từng ngày (không sửa file cũ).
+    Trả về số dòng đã ghi.
+    """
+    if not rows:
+        return 0
+    if pa is None:
+        raise RuntimeError("Chưa cài pyarrow -> không ghi được lịch sử dạng cột")
+    table = _to_table(rows)
+    dates = table.column("timestamp").to_pandas().dt.strftime("%Y-%m-%d")
+    name = f"part-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}{EXTENSIONS[fmt]}"
+    for date in sorted(set(dates)):
+        part = table.filter(pa.array((dates == date).to_numpy()))
+        directory = os.path.join(root, f"date={date}")
+        os.makedirs(directory, exist_ok=True)
+        _write_file(part, os.path.join(directory, name), fmt)
+    return table.num_rows
+
+
+def compact_partitions(root: str = COLLECTOR_HISTORY_DIR, fmt: str = COLLECTOR_HISTORY_FORMAT, keep_today: bool = True) -> int:
+    """Gộp các file nhỏ (mỗi micro-batch 1 file) của những ngày đã qua thành 1 file/ngày. Trả về số partition đã gộp"""
+    if pa is None:
+        return 0
+    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    compacted = 0
+    for directory in sorted(glob.glob(os.path.join(root, "date=*"))):
+        if keep_today and directory.endswith(today):
+            continue
+        parts = sorted(glob.glob(os.path.join(directory, f"part-*{EXTENSIONS[fmt]}")))
+        if len(parts) < 2:
+            continue
+        table = ds.dataset(parts, format="ipc" if fmt == "arrow" else "parquet", schema=history_schema()).to_table()
+        _write_file(table.sort_by("timestamp"), os.path.join(directory, f"compacted-{uuid.uuid4().hex[:8]}{EXTENSIONS[fmt]}"), fmt)
+        for path in parts:
+            os.remove(path)
+        compacted += 1
+    return compacted
+
+
+def history_dataset(root: str = COLLECTOR_HISTORY_DIR, fmt: str = COLLECTOR_HISTORY_FORMAT):
+    """pyarrow.dataset có partition 'date' (hive) -> lọc theo ngày chỉ mở đúng thư mục cần"""
+    if pa is None:
+        raise RuntimeError("Chưa cài pyarrow -> không đọc được lịch sử dạng cột")
+    return ds.dataset(
+        root, format="ipc" if fmt == "arrow" else "parquet", schema=history_schema().append(pa.field("date", pa.string())),
+        partitioning="hive", exclude_invalid_files=True,
+    )
+
+
+def read_history(columns: list = None, start_date: str = None, end_date: str = None,
+                 root: str = COLLECTOR_HISTORY_DIR, fmt: str = COLLECTOR_HISTORY_FORMAT):
+    """
+    Đọc lịch sử collector -> DataFrame. start_date/end_date: 'YYYY-MM-DD' (gồm cả 2 đầu).
+    Chỉ các partition trong khoảng ngày và các cột được chọn được đọc từ đĩa.
+    """
+    if not os.path.isdir(root):
+        return history_schema().empty_table().to_pandas() if pa is not None else None
+    dataset = history_dataset(root, fmt)
+    condition = None
+    if start_date:
+        condition = ds.field("date") >= start_date
+    if end_date:
+        condition = (ds.field("date") <= end_date) if condition is None else condition & (ds.field("date") <= end_date)
+    return dataset.to_table(columns=columns, filter=condition).to_pandas()
+
+
+def import_csv(csv_path: str, root: str = COLLECTOR_HISTORY_DIR, fmt: str = COLLECTOR_HISTORY_FORMAT, chunk_size: int = 50000) -> int:
+    """Chuyển file CSV cũ của collector sang dạng partition (chạy 1 lần để backfill)"""
+    import pandas as pd
+
+    total = 0
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_size, encoding="utf-8-sig", dtype={"timestamp": str}):
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        total += write_history(chunk.to_dict("records"), root, fmt)
+    compact_partitions(root, fmt, keep_today=False)
+    return total
+
+
+if __name__ == "__main__":
+    # python -m app.core.history_store vietnam_weather_disaster.csv
+    import sys
+
+    for path in sys.argv[1:]:
+        print(f"✅ [History] Đã chuyển {import_csv(path)} dòng từ {path} -> {COLLECTOR_HISTORY_DIR}")
@@ -0,0 +1,166 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+from app.core.config import HTTP_CACHE_PATH, HTTP_CACHE_TTLS, HTTP_CACHE_CELL_DEG, HTTP_CACHE_MAX_ENTRIES
+from app.core.geo_cache import MISS
+from app.core.metrics import register_metrics
+
+# Cache response JSON (status 200) của các API thời tiết, dùng chung giữa collector, API live và dự báo 7 ngày.
+# Key = host + path + params đã sắp xếp, toạ độ làm tròn về ô lưới (điểm cách nhau vài trăm mét dùng chung 1 response),
+# bỏ các tham số bí mật (API key). Lưu trong SQLite trên đĩa: khởi động lại vẫn còn, nhiều process dùng chung 1 file.
+
+SECRET_PARAMS = {"appid", "apikey", "api_key", "key"}
+COORD_PARAMS = {"lat", "lon", "latitude", "longitude"}
+
+
+def parse_ttls(spec: str = HTTP_CACHE_TTLS) -> dict:
+    """"api.openweathermap.org=240,..." -> {host: ttl giây}"""
+    ttls = {}
+    for item in spec.split(","):
+        host, sep, ttl = item.strip().partition("=")
+        if sep:
+            try:
+                ttls[host.strip().lower()] = float(ttl)
+            except ValueError:
+                print(f"⚠️ [HTTP cache] Bỏ qua TTL không hợp lệ: '{item}'")
+    return ttls
+
+
+class HttpCache:
+    """
+    get(url, params) -> payload hoặc MISS; put(url, params, payload) sau khi gọi upstream thành công.
+    Host không có TTL (hoặc TTL <= 0) thì không cache.
+    """
+
+    def __init__(self, path: str = HTTP_CACHE_PATH, ttls: dict = None,
+                 cell_deg: float = HTTP_CACHE_CELL_DEG, max_entries: int = HTTP_CACHE_MAX_ENTRIES):
+        self.path = path or ":memory:"
+        self.ttls = parse_ttls() if ttls is None else ttls
+        self.cell_deg = cell_deg
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = None
+        self._puts = 0
+        self.stats_by_host = {}
+
+    def _connect(self):
+        if self._conn is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")  # collector ghi trong lúc API đọc
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, host TEXT, body TEXT, stored_at REAL, expires_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires_at)")
+            self._conn = conn
+        return self._conn
+
+    def _snap(self, value):
+        """Làm tròn toạ độ (hỗ trợ danh sách 'a,b,c' của Open-Meteo)"""
+        if self.cell_deg <= 0:
+            return value
+        parts = []
+        for v in str(value).split(","):
+            try:
+                parts.append(f"{round(round(float(v) / self.cell_deg) * self.cell_deg, 6):g}")
+            except ValueError:
+                parts.append(v)
+        return ",".join(parts)
+
+    def key(self, url: str, params: dict = None) -> str:
+        parsed = urlsplit(url)
+        items = [(k, v) for k, v in (params or {}).items() if k.lower() not in SECRET_PARAMS]
+        items = sorted((k, self._snap(v) if k in COORD_PARAMS else str(v)) for k, v in items)
+        return f"{parsed.hostname}{parsed.path}?{urlencode(items)}"
+
+    def ttl_for(self, url: str) -> float:
+        return self.ttls.get((urlsplit(url).hostname or "").lower(), 0.0)
+
+    def _count(self, host: str, field: str):
+        entry = self.stats_by_host.setdefault(host, {"hits": 0, "misses": 0, "stores": 0, "errors": 0})
+        entry[field] += 1
+
+    def get(self, url: str, params: dict = None):
+        if self.ttl_for(url) <= 0:
+            return MISS
+        host = urlsplit(url).hostname
+        try:
+            with self._lock:
+                row = self._connect().execute(
+                    "SELECT body FROM responses WHERE key = ? AND expires_at > ?", (self.key(url, params), time.time())
+                ).fetchone()
+                self._count(host, "hits" if row else "misses")
+            return json.loads(row[0]) if row else MISS
+        except Exception as e:
+            with self._lock:
+                self._count(host, "errors")
+            print(f"⚠️ [HTTP cache] Lỗi đọc cache: {e}")
+            return MISS
+
+    def put(self, url: str, params: dict, payload):
+        ttl = self.ttl_for(url)
+        if ttl <= 0 or payload is None:
+            return
+        host = urlsplit(url).hostname
+        now = time.time()
+        try:
+            body = json.dumps(payload, separators=(",", ":"))
+            with self._lock:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, host, body, stored_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                    (self.key(url, params), host, body, now, now + ttl),
+                )
+                self._count(host, "stores")
+                self._puts += 1
+                if self._puts % 500 == 0:
+                    self._prune(conn, now)
+        except Exception as e:
+            with self._lock:
+                self._count(host, "errors")
+            print(f"⚠️ [HTTP cache] Lỗi ghi cache: {e}")
+
+    def _prune(self, conn, now: float):
+        """Xoá bản hết hạn, và bản cũ nhất nếu vượt max_entries"""
+        conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        conn.execute(
+            "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def clear(self):
+        with self._lock:
+            self._connect().execute("DELETE FROM responses")
+
+    def stats(self) -> dict:
+        with self._lock:
+            by_host = {host: dict(s) for host, s in self.stats_by_host.items()}
+            try:
+                size = self._connect().execute("SELECT COUNT(*) FROM responses WHERE expires_at > ?", (time.time(),)).fetchone()[0]
+            except Exception:
+                size = None
+        for s in by_host.values():
+            total = s["hits"] + s["misses"]
+            s["hit_rate"] = round(s["hits"] / total, 4) if total else 0.0
+        hits = sum(s["hits"] for s in by_host.values())
+        lookups = hits + sum(s["misses"] for s in by_host.values())
+        return {
+            "path": self.path,
+            "entries": size,
+            "ttl_seconds": self.ttls,
+            "cell_deg": self.cell_deg,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "by_host": by_host,
+        }
+
+
+# Dùng chung trong process (collector, router live_data, dự báo 7 ngày)
+http_cache = HttpCache()
+register_metrics("http_cache", http_cache.stats)
@@ -0,0 +1,26 @@
+import threading
+from typing import Callable, Dict
+
+# Các nguồn metrics trong process: tên -> hàm trả về dict số liệu hiện tại
+_sources: Dict[str, Callable[[], dict]] = {}
+_lock = threading.Lock()
+
+
+def register_metrics(name: str, source: Callable[[], dict]):
+    """Đăng ký 1 nguồn metrics (gọi lại mỗi khi có người đọc /system/metrics)"""
+    with _lock:
+        _sources[name] = source
+
+
+def collect_metrics() -> dict:
+    """Gom số liệu từ mọi nguồn đã đăng ký; nguồn nào lỗi thì trả về thông báo lỗi"""
+    with _lock:
+        sources = dict(_sources)
+
+    result = {}
+    for name, source in sorted(sources.items()):
+        try:
+            result[name] = source()
+        except Exception as e:
+            result[name] = {"error": str(e)}
+    return result
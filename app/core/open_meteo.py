@@ -0,0 +1,162 @@
+import asyncio
+import threading
+
+import requests
+
+from app.core.config import OPEN_METEO_BATCH_SIZE
+from app.core.http_cache import MISS, http_cache
+from app.core.metrics import register_metrics
+
+# Open-Meteo nhận danh sách toạ độ "lat1,lat2,..." / "lon1,lon2,..." trong 1 request
+# và trả về list kết quả theo đúng thứ tự đó (1 toạ độ thì trả về 1 object).
+# Module này gom nhiều địa điểm vào 1 request, tách kết quả ra lại, lỗi thì gọi lẻ từng điểm.
+# Kết quả cache theo từng điểm (http_cache) -> chỉ các điểm chưa có trong cache mới được gom đi gọi.
+
+_stats_lock = threading.Lock()
+_stats = {"batch_requests": 0, "single_requests": 0, "locations": 0, "cached_locations": 0, "fallbacks": 0, "failed_locations": 0}
+
+
+def _count(**deltas):
+    with _stats_lock:
+        for key, value in deltas.items():
+            _stats[key] += value
+
+
+def chunk_points(points: list, batch_size: int = OPEN_METEO_BATCH_SIZE) -> list:
+    """Chia danh sách (lat, lon) thành các nhóm tối đa batch_size điểm"""
+    size = max(1, int(batch_size))
+    return [points[i:i + size] for i in range(0, len(points), size)]
+
+
+def batch_params(base_params: dict, points: list) -> dict:
+    """Params cho 1 request nhiều toạ độ"""
+    return {
+        **base_params,
+        "latitude": ",".join(str(lat) for lat, _ in points),
+        "longitude": ",".join(str(lon) for _, lon in points),
+    }
+
+
+def split_response(payload, n: int) -> list:
+    """JSON trả về -> list n kết quả (theo thứ tự toạ độ gửi đi); sai số lượng thì raise ValueError"""
+    items = payload if isinstance(payload, list) else [payload]
+    if len(items) != n or not all(isinstance(item, dict) for item in items):
+        raise ValueError(f"Open-Meteo trả về {len(items)} kết quả cho {n} toạ độ")
+    if any(item.get("error") for item in items):
+        raise ValueError(items[0].get("reason") or "Open-Meteo báo lỗi")
+    return items
+
+
+def _lookup_cache(url: str, base_params: dict, points: list):
+    """-> (results theo thứ tự points, None ở điểm chưa có cache; chỉ số các điểm cần gọi upstream)"""
+    results, missing = [], []
+    for i, point in enumerate(points):
+        cached = http_cache.get(url, batch_params(base_params, [point]))
+        results.append(None if cached is MISS else cached)
+        if cached is MISS:
+            missing.append(i)
+    _count(cached_locations=len(points) - len(missing))
+    return results, missing
+
+
+def _store_cache(url: str, base_params: dict, points: list, fetched: list):
+    for point, item in zip(points, fetched):
+        if item is not None:
+            http_cache.put(url, batch_params(base_params, [point]), item)
+
+
+def _get_json(url, params, timeout, http_get):
+    resp = http_get(url, params=params, timeout=timeout)
+    if resp.status_code != 200:
+        raise RuntimeError(f"HTTP {resp.status_code}")
+    return resp.json()
+
+
+def fetch_batched(url: str, base_params: dict, points: list, batch_size: int = OPEN_METEO_BATCH_SIZE,
+                  timeout: float = 30, http_get=requests.get) -> list:
+    """
+    Gọi Open-Meteo cho nhiều (lat, lon): mỗi nhóm batch_size điểm 1 request.
+    Trả về list JSON theo thứ tự points; nhóm nào lỗi thì gọi lẻ từng điểm, điểm lỗi -> None.
+    """
+    cached, missing = _lookup_cache(url, base_params, points)
+    results = []
+    for chunk in chunk_points([points[i] for i in missing], batch_size):
+        try:
+            _count(batch_requests=1)
+            results.extend(split_response(_get_json(url, batch_params(base_params, chunk), timeout, http_get), len(chunk)))
+            continue
+        except Exception as e:
+            if len(chunk) > 1:
+                print(f"⚠️ [Open-Meteo] Batch {len(chunk)} điểm lỗi ({e}) -> gọi lẻ từng điểm")
+            _count(fallbacks=1)
+
+        for lat, lon in chunk:
+            try:
+                _count(single_requests=1)
+                results.append(split_response(_get_json(url, batch_params(base_params, [(lat, lon)]), timeout, http_get), 1)[0])
+            except Exception:
+                _count(failed_locations=1)
+                results.append(None)
+    _count(locations=len(points))
+    _store_cache(url, base_params, [points[i] for i in missing], results)
+    for i, item in zip(missing, results):
+        cached[i] = item
+    return cached
+
+
+async def fetch_batched_async(request, url: str, base_params: dict, points: list,
+                              batch_size: int = OPEN_METEO_BATCH_SIZE) -> list:
+    """
+    Bản async của fetch_batched. request(url, params=...) là coroutine trả về response httpx
+    (VD AsyncCollector.request, đã có giới hạn theo host + retry).
+    """
+    async def get_json(params):
+        resp = await request(url, params=params)
+        if resp.status_code != 200:
+            raise RuntimeError(f"HTTP {resp.status_code}")
+        return resp.json()
+
+    async def fetch_chunk(chunk):
+        try:
+            _count(batch_requests=1)
+            return split_response(await get_json(batch_params(base_params, chunk)), len(chunk))
+        except Exception as e:
+            if len(chunk) > 1:
+                print(f"⚠️ [Open-Meteo] Batch {len(chunk)} điểm lỗi ({e}) -> gọi lẻ từng điểm")
+            _count(fallbacks=1)
+
+        results = []
+        for lat, lon in chunk:
+            try:
+                _count(single_requests=1)
+                results.append(split_response(await get_json(batch_params(base_params, [(lat, lon)])), 1)[0])
+            except Exception:
+                _count(failed_locations=1)
+                results.append(None)
+        return results
+
+    # Tra/ghi cache SQLite trong thread để không chặn event loop
+    cached, missing = await asyncio.to_thread(_lookup_cache, url, base_params, points)
+    to_fetch = [points[i] for i in missing]
+    # Các nhóm chạy đồng thời (giới hạn thật nằm ở limiter của request)
+    chunks = await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunk_points(to_fetch, batch_size)))
+    _count(locations=len(points))
+    fetched = [item for chunk in chunks for item in chunk]
+    await asyncio.to_thread(_store_cache, url, base_params, to_fetch, fetched)
+    for i, item in zip(missing, fetched):
+        cached[i] = item
+    return cached
+
+
+def open_meteo_stats() -> dict:
+    with _stats_lock:
+        s = dict(_stats)
+    requests_total = s["batch_requests"] + s["single_requests"]
+    return {
+        **s,
+        "batch_size": OPEN_METEO_BATCH_SIZE,
+        "locations_per_request": round((s["locations"] - s["cached_locations"]) / requests_total, 2) if requests_total else 0.0,
+    }
+
+
+register_metrics("open_meteo", open_meteo_stats)
@@ -102,4 +102,9 @@ backend_dir = os.path.dirname(os.path.dirname(core_dir))
 csv_file_path = os.path.join(backend_dir, "Vietnam_Rescue.csv")
 
 # Khởi tạo
-rescue_finder = RescueFinder(csv_file_path)
\ No newline at end of file
+rescue_finder = RescueFinder(csv_file_path)
+
+
+def find_nearest_station(user_lat: float, user_lon: float, type_filter: str = None):
+    """Hàm cấp module (pickle được) để chạy find_nearest_station trong cpu pool"""
+    return rescue_finder.find_nearest_station(user_lat, user_lon, type_filter)
@@ -0,0 +1,328 @@
+import threading
+from datetime import date, datetime, timezone
+
+from app.core.config import EVENTS_PARTITION_MONTHS_AHEAD, EVENTS_RETENTION_MONTHS
+
+# Khoá advisory: nhiều process (API workers, collector) khởi động cùng lúc chỉ 1 process chạy migration
+_MIGRATION_LOCK_ID = 804_2024_01
+
+# --- EVENTS (bảng sự kiện chính) ---
+# Cài mới: partition theo tháng trên event_time (+ partition default cho event_time NULL, VD tin GDACS).
+# geog là cột geography lưu sẵn -> ST_DWithin dùng được GiST index, không phải cast geom mỗi dòng.
+EVENTS_DDL = """
+    CREATE EXTENSION IF NOT EXISTS postgis;
+
+    CREATE TABLE IF NOT EXISTS events (
+        id           BIGSERIAL,
+        source       TEXT NOT NULL,
+        event_type   TEXT,
+        title        TEXT,
+        description  TEXT,
+        event_time   TIMESTAMPTZ,
+        geom         geometry(Point, 4326),
+        geog         geography(Point, 4326) GENERATED ALWAYS AS (geom::geography) STORED,
+        raw_data     JSONB,
+        created_at   TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    ) PARTITION BY RANGE (event_time);
+
+    CREATE TABLE IF NOT EXISTS events_default PARTITION OF events DEFAULT;
+
+    -- Chống trùng cho ingest đồng thời (event_time NULL vẫn được lọc bằng NOT EXISTS khi ghi)
+    CREATE UNIQUE INDEX IF NOT EXISTS uq_events_dedup ON events (source, title, event_time);
+"""
+
+# Bảng events đã có từ trước (không partition): chỉ bổ sung cột/index, không đụng dữ liệu.
+# Migration 3 (_partition_legacy_events) sau đó chuyển bảng này sang dạng partition theo tháng
+LEGACY_EVENTS_DDL = """
+    ALTER TABLE events ADD COLUMN IF NOT EXISTS geog geography(Point, 4326)
+        GENERATED ALWAYS AS (geom::geography) STORED;
+    CREATE INDEX IF NOT EXISTS idx_events_dedup ON events (source, title, event_time);
+"""
+
+EVENTS_INDEXES_DDL = """
+    CREATE INDEX IF NOT EXISTS idx_events_geog ON events USING GIST (geog);
+    -- event_time tăng dần theo thứ tự ghi -> BRIN nhỏ mà vẫn lọc tốt "24 giờ gần nhất"
+    CREATE INDEX IF NOT EXISTS idx_events_time_brin ON events USING BRIN (event_time);
+    CREATE INDEX IF NOT EXISTS idx_events_type_time ON events (event_type, event_time DESC);
+"""
+
+# --- EVENTS_LATEST (trạng thái mới nhất cho mỗi địa điểm + hazard) ---
+EVENTS_LATEST_DDL = """
+    CREATE TABLE IF NOT EXISTS events_latest (
+        title        TEXT NOT NULL,
+        hazard       TEXT NOT NULL,
+        event_id     BIGINT,
+        source       TEXT,
+        event_type   TEXT,
+        description  TEXT,
+        event_time   TIMESTAMPTZ,
+        geom         geometry(Point, 4326),
+        geog         geography(Point, 4326) GENERATED ALWAYS AS (geom::geography) STORED,
+        raw_data     JSONB,
+        PRIMARY KEY (title, hazard)
+    );
+    CREATE INDEX IF NOT EXISTS idx_events_latest_geog ON events_latest USING GIST (geog);
+    CREATE INDEX IF NOT EXISTS idx_events_latest_time ON events_latest (event_time DESC);
+"""
+
+# Upsert vào events_latest từ 1 tập dòng events (id, source, event_type, title, description, event_time, geom, raw_data).
+# Bỏ dòng event_time NULL (VD tin GDACS): truy vấn đọc và retention đều lọc theo event_time,
+# nên các dòng đó không bao giờ được đọc cũng không bao giờ bị xoá
+LATEST_UPSERT_TEMPLATE = """
+    INSERT INTO events_latest (title, hazard, event_id, source, event_type, description, event_time, geom, raw_data)
+    SELECT DISTINCT ON (title, hazard)
+           title, hazard, id, source, event_type, description, event_time, geom::geometry, raw_data::jsonb
+    FROM (
+        SELECT *, COALESCE(raw_data->>'overall_hazard_prediction', 'Unknown') AS hazard FROM {source}
+    ) src
+    WHERE title IS NOT NULL AND event_time IS NOT NULL
+    ORDER BY title, hazard, event_time DESC NULLS LAST
+    ON CONFLICT (title, hazard) DO UPDATE SET
+        event_id = EXCLUDED.event_id,
+        source = EXCLUDED.source,
+        event_type = EXCLUDED.event_type,
+        description = EXCLUDED.description,
+        event_time = EXCLUDED.event_time,
+        geom = EXCLUDED.geom,
+        raw_data = EXCLUDED.raw_data
+    WHERE events_latest.event_time IS NULL
+       OR EXCLUDED.event_time >= events_latest.event_time
+"""
+
+# Nạp events_latest từ lịch sử 24h gần nhất
+EVENTS_LATEST_BACKFILL_SQL = LATEST_UPSERT_TEMPLATE.format(
+    source="(SELECT * FROM events WHERE event_time >= NOW() - INTERVAL '24 HOURS') recent"
+)
+
+
+def _is_partitioned(cur, table: str) -> bool:
+    cur.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cur.fetchone()
+    return bool(row and row[0])
+
+
+def _create_events(cur):
+    cur.execute("SELECT to_regclass('events') IS NOT NULL")
+    if cur.fetchone()[0]:
+        cur.execute(LEGACY_EVENTS_DDL)
+    else:
+        cur.execute(EVENTS_DDL)
+        ensure_partitions(cur)
+    cur.execute(EVENTS_INDEXES_DDL)
+
+
+def _create_events_latest(cur):
+    cur.execute(EVENTS_LATEST_DDL)
+    cur.execute(EVENTS_LATEST_BACKFILL_SQL)
+
+
+# Cột ghi được của events (geog là cột generated, tự tính lại khi chép)
+_EVENTS_COPY_COLUMNS = ("id", "source", "event_type", "title", "description", "event_time", "geom", "raw_data", "created_at")
+
+
+def _partition_legacy_events(cur):
+    """
+    Bảng events cũ (không partition, migration 1 chỉ thêm cột/index) -> bảng partition theo tháng.
+    Chép dữ liệu còn trong cửa sổ EVENTS_RETENTION_MONTHS sang bảng mới (giữ nguyên id
+    để events_latest.event_id vẫn đúng) rồi xoá bảng cũ, tất cả trong 1 transaction.
+    """
+    if _is_partitioned(cur, "events"):
+        return
+
+    cur.execute("ALTER TABLE events RENAME TO events_legacy")
+    cur.execute(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = 'events_legacy'"
+    )
+    legacy_columns = {row[0] for row in cur.fetchall()}
+    if "id" in legacy_columns:
+        # Sequence cũ (events_id_seq) phải nhường tên cho BIGSERIAL của bảng mới
+        cur.execute("SELECT pg_get_serial_sequence('events_legacy', 'id')")
+        sequence = cur.fetchone()[0]
+        if sequence:
+            cur.execute(f"ALTER SEQUENCE {sequence} RENAME TO events_legacy_id_seq")
+
+    cur.execute(EVENTS_DDL)
+    # Tạo sẵn partition cho cả các tháng quá khứ còn trong cửa sổ lưu trữ -> dữ liệu cũ không dồn vào default
+    ensure_partitions(cur, months_behind=max(EVENTS_RETENTION_MONTHS, 0))
+
+    columns = ", ".join(c for c in _EVENTS_COPY_COLUMNS if c in legacy_columns)
+    where, params = "", ()
+    if EVENTS_RETENTION_MONTHS > 0:
+        cutoff = _month_start(date.today(), -EVENTS_RETENTION_MONTHS)
+        cutoff = datetime(cutoff.year, cutoff.month, 1, tzinfo=timezone.utc)
+        where, params = "WHERE event_time IS NULL OR event_time >= %s", (cutoff,)
+    # Bản trùng (source, title, event_time) từ trước khi có dedup chỉ giữ 1
+    cur.execute(
+        f"INSERT INTO events ({columns}) SELECT {columns} FROM events_legacy {where} ON CONFLICT DO NOTHING",
+        params,
+    )
+    if "id" in legacy_columns:
+        cur.execute(
+            "SELECT setval(pg_get_serial_sequence('events', 'id'), "
+            "GREATEST((SELECT MAX(id) FROM events_legacy), 1))"
+        )
+    cur.execute("DROP TABLE events_legacy")
+    cur.execute(EVENTS_INDEXES_DDL)
+
+
+# (version, tên, hàm nhận cursor). Chỉ THÊM migration mới vào cuối, không sửa migration đã chạy.
+MIGRATIONS = [
+    (1, "events_table_and_indexes", _create_events),
+    (2, "events_latest", _create_events_latest),
+    (3, "partition_legacy_events", _partition_legacy_events),
+]
+
+
+def _month_start(d: date, offset: int) -> date:
+    month_index = d.year * 12 + (d.month - 1) + offset
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def ensure_partitions(cur, months_ahead: int = EVENTS_PARTITION_MONTHS_AHEAD, months_behind: int = 0) -> list:
+    """Tạo partition theo tháng từ months_behind tháng trước tới months_ahead tháng sau (nếu events có partition)"""
+    if not _is_partitioned(cur, "events"):
+        return []
+
+    created = []
+    today = date.today()
+    for offset in range(-months_behind, months_ahead + 1):
+        start, end = _month_start(today, offset), _month_start(today, offset + 1)
+        name = f"events_{start:%Y%m}"
+        # Biên partition là mốc UTC đầu tháng (timestamptz, không phụ thuộc TimeZone của session)
+        lower = datetime(start.year, start.month, 1, tzinfo=timezone.utc)
+        upper = datetime(end.year, end.month, 1, tzinfo=timezone.utc)
+        cur.execute("SELECT to_regclass(%s) IS NOT NULL", (name,))
+        if cur.fetchone()[0]:
+            continue
+        # Dữ liệu tháng này có thể đang nằm ở partition default -> chuyển sang partition mới
+        cur.execute(
+            f"CREATE TABLE {name} (LIKE events INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED)"
+        )
+        cur.execute(
+            f"""WITH moved AS (
+                    DELETE FROM events_default
+                    WHERE event_time >= %s AND event_time < %s
+                    RETURNING id, source, event_type, title, description, event_time, geom, raw_data, created_at
+                )
+                INSERT INTO {name} (id, source, event_type, title, description, event_time, geom, raw_data, created_at)
+                SELECT * FROM moved""",
+            (lower, upper),
+        )
+        cur.execute(f"ALTER TABLE events ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", (lower, upper))
+        created.append(name)
+    return created
+
+
+def drop_expired_partitions(cur, retention_months: int = EVENTS_RETENTION_MONTHS) -> list:
+    """Xoá partition tháng đã ra khỏi cửa sổ lưu trữ (0 = giữ vô hạn)"""
+    if retention_months <= 0 or not _is_partitioned(cur, "events"):
+        return []
+
+    cutoff = _month_start(date.today(), -retention_months)
+    cur.execute(
+        """
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'events'::regclass AND c.relname ~ '^events_[0-9]{6}$'
+        """
+    )
+    dropped = []
+    for (name,) in cur.fetchall():
+        month = date(int(name[7:11]), int(name[11:13]), 1)
+        if _month_start(month, 1) <= cutoff:
+            cur.execute(f"DROP TABLE {name}")
+            dropped.append(name)
+    return dropped
+
+
+def delete_expired_rows(cur, retention_months: int = EVENTS_RETENTION_MONTHS) -> int:
+    """
+    Retention bằng DELETE cho dữ liệu không nằm trong partition tháng: partition default
+    (event_time NULL thì tính theo created_at), hoặc cả bảng events nếu chưa partition.
+    """
+    if retention_months <= 0:
+        return 0
+
+    cutoff = _month_start(date.today(), -retention_months)
+    cutoff = datetime(cutoff.year, cutoff.month, 1, tzinfo=timezone.utc)
+    if _is_partitioned(cur, "events"):
+        cur.execute("DELETE FROM events_default WHERE COALESCE(event_time, created_at) < %s", (cutoff,))
+    else:
+        cur.execute("DELETE FROM events WHERE event_time < %s", (cutoff,))
+    return cur.rowcount
+
+
+def migrate(conn) -> list:
+    """Chạy các migration chưa áp dụng (theo thứ tự version), mỗi migration 1 transaction"""
+    applied_now = []
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version     INTEGER PRIMARY KEY,
+                name        TEXT NOT NULL,
+                applied_at  TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            )
+            """
+        )
+        conn.commit()
+
+        for version, name, apply in MIGRATIONS:
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (_MIGRATION_LOCK_ID,))
+            cur.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (version,))
+            if cur.fetchone():
+                conn.commit()
+                continue
+            try:
+                apply(cur)
+                cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+                conn.commit()
+                applied_now.append(name)
+                print(f"✅ [Schema] Đã áp dụng migration {version}: {name}")
+            except Exception:
+                conn.rollback()
+                raise
+    return applied_now
+
+
+def maintain_partitions(conn) -> dict:
+    """Tạo partition tháng tới + xoá partition/dòng hết hạn (collector gọi mỗi chu kỳ)"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (_MIGRATION_LOCK_ID,))
+        result = {
+            "created": ensure_partitions(cur),
+            "dropped": drop_expired_partitions(cur),
+            "deleted": delete_expired_rows(cur),
+        }
+    conn.commit()
+    if result["created"] or result["dropped"] or result["deleted"]:
+        print(
+            f"🗂️ [Schema] Partition mới: {result['created']}, đã xoá: {result['dropped']}, "
+            f"dòng hết hạn đã xoá: {result['deleted']}"
+        )
+    return result
+
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+
+def is_schema_ready() -> bool:
+    return _schema_ready
+
+
+def ensure_schema(conn) -> bool:
+    """migrate() 1 lần cho mỗi process; lỗi thì in ra và thử lại ở lần gọi sau"""
+    global _schema_ready
+    if _schema_ready:
+        return True
+    with _schema_lock:
+        if not _schema_ready:
+            try:
+                migrate(conn)
+                _schema_ready = True
+            except Exception as e:
+                print(f"❌ [Schema] Migration thất bại: {e}")
+    return _schema_ready
@@ -37,6 +37,12 @@ from app.routers import (
     past_hazards
 )
 
+from app.ml.registry import start_model_watcher
+from app.ml.warmup import start_warmup
+from app.core.executors import shutdown_executors
+from app.core.database import close_db_pool, ensure_event_schema
+from app.core.async_database import close_async_db_pool
+
 # --- Import router mới (Import riêng để tránh lỗi vòng lặp) ---
 from app.profile_data import router as profile_router
 # --- 2. TẠO BẢNG ---
@@ -92,6 +98,20 @@ app.include_router(past_hazards.router, prefix="/api/v1/hazards/past", tags=["Pa
 # --- SỬA DÒNG NÀY (Dùng biến profile_router) ---
 app.include_router(profile_router, prefix="/api/v1/profile", tags=["User Profile Data"])
 
+# --- Warm-up model + theo dõi file model để hot-swap khi có model mới ---
+@app.on_event("startup")
+def start_background_services():
+    # Migration event store (events, events_latest, index, partition); DB lỗi thì chỉ log, API vẫn chạy
+    ensure_event_schema()
+    start_warmup()
+    start_model_watcher()
+
+@app.on_event("shutdown")
+async def stop_background_services():
+    await close_async_db_pool()
+    shutdown_executors()
+    close_db_pool()
+
 @app.get("/")
 def health_check():
     return {"status": "ok", "message": "Travel Safety Backend is Running 🚀"}
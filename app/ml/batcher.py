@@ -0,0 +1,147 @@
+import asyncio
+import threading
+import time
+from typing import Any, Callable, List
+
+from app.core.config import PREDICT_BATCH_MAX_SIZE, PREDICT_BATCH_MAX_LATENCY_MS
+from app.core.executors import ManagedExecutor, io_executor
+from app.core.metrics import register_metrics
+
+
+class MicroBatcher:
+    """
+    Gom các request dự đoán đồng thời thành 1 batch:
+    - Request đầu tiên mở 1 "cửa sổ" chờ tối đa max_latency_ms.
+    - Đủ max_batch_size bản ghi hoặc hết thời gian -> gọi predict_many 1 lần
+      trong pool được quản lý (mặc định io pool, không chặn event loop), rồi trả kết quả cho từng caller.
+    - Pool đầy -> mọi caller của batch nhận ExecutorBusyError (router trả 503).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        predict_many: Callable[[List[Any]], list],
+        max_batch_size: int = PREDICT_BATCH_MAX_SIZE,
+        max_latency_ms: float = PREDICT_BATCH_MAX_LATENCY_MS,
+        executor: ManagedExecutor = io_executor,
+    ):
+        self.name = name
+        self.predict_many = predict_many
+        self.executor = executor
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_latency = max(0.0, float(max_latency_ms)) / 1000.0
+
+        self._loop = None
+        self._queue = None
+        self._worker = None
+
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "batches": 0,
+            "errors": 0,
+            "max_batch_size_seen": 0,
+            "queue_wait_ms_total": 0.0,
+            "predict_ms_total": 0.0,
+        }
+        register_metrics(f"batcher.{name}", self.stats)
+
+    async def submit(self, item):
+        """Đưa 1 bản ghi vào hàng đợi và chờ kết quả dự đoán của chính nó"""
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put((item, future, time.perf_counter()))
+        return await future
+
+    def _ensure_worker(self):
+        # Queue/Task gắn với event loop đang chạy (tạo lại nếu loop đổi, VD khi test)
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def _collect(self) -> list:
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_latency
+
+        while len(batch) < self.max_batch_size:
+            # Lấy ngay những gì đã có sẵn trong queue
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - self._loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # Bỏ các request mà client đã huỷ trong lúc chờ
+            batch = [entry for entry in batch if not entry[1].done()]
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            items = [item for item, _, _ in batch]
+            try:
+                outcomes = await self.executor.run(self._predict_batch, items)
+            except Exception as e:
+                # ExecutorBusyError (pool đầy) hoặc lỗi pool: báo cho cả batch, worker vẫn chạy tiếp
+                outcomes = [(None, e)] * len(batch)
+            finished = time.perf_counter()
+
+            for (_, future, _), (result, error) in zip(batch, outcomes):
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+            with self._stats_lock:
+                self._stats["requests"] += len(batch)
+                self._stats["batches"] += 1
+                self._stats["errors"] += sum(1 for _, error in outcomes if error is not None)
+                self._stats["max_batch_size_seen"] = max(self._stats["max_batch_size_seen"], len(batch))
+                self._stats["queue_wait_ms_total"] += sum((started - t0) * 1000 for _, _, t0 in batch)
+                self._stats["predict_ms_total"] += (finished - started) * 1000
+
+    def _predict_batch(self, items: list) -> list:
+        """
+        Chạy trong worker thread. Trả về list (result, error) cho từng item.
+        Nếu cả batch lỗi thì chạy lại từng item để 1 input xấu không kéo theo cả batch.
+        """
+        try:
+            results = self.predict_many(items)
+            if len(results) != len(items):
+                raise RuntimeError(f"predict_many trả về {len(results)} kết quả cho {len(items)} input")
+            return [(result, None) for result in results]
+        except Exception as e:
+            if len(items) == 1:
+                return [(None, e)]
+
+        outcomes = []
+        for item in items:
+            try:
+                outcomes.append((self.predict_many([item])[0], None))
+            except Exception as e:
+                outcomes.append((None, e))
+        return outcomes
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            s = dict(self._stats)
+        return {
+            **s,
+            "config": {"max_batch_size": self.max_batch_size, "max_latency_ms": self.max_latency * 1000},
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "avg_batch_size": round(s["requests"] / s["batches"], 2) if s["batches"] else 0.0,
+            "avg_queue_wait_ms": round(s["queue_wait_ms_total"] / s["requests"], 3) if s["requests"] else 0.0,
+            "avg_predict_ms": round(s["predict_ms_total"] / s["batches"], 3) if s["batches"] else 0.0,
+        }
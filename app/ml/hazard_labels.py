@@ -0,0 +1,170 @@
+"""
+Gán nhãn rủi ro theo luật (rain / wind / storm / flood / earthquake + overall) cho cả mảng quan trắc một lần.
+Dùng chung cho collector (nowcast) và dự báo 7 ngày (forecast): 2 bên có ngưỡng khác nhau
+nên mỗi bên là 1 LabelProfile, còn logic tính điểm chỉ có 1 bản (numpy, không lặp từng dòng).
+"""
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import numpy as np
+
+RISK_LEVELS = np.array(["no", "low", "mid", "mid-high", "high"], dtype=object)
+RISK_ORDER = {lv: i for i, lv in enumerate(RISK_LEVELS)}
+# Thứ tự xét hazard khi chọn nhãn tổng hợp
+HAZARD_PRIORITY = ["wind", "rain", "storm", "flood", "earthquake"]
+
+
+@dataclass(frozen=True)
+class LabelProfile:
+    """
+    Ngưỡng của từng luật. Các bộ 4 ngưỡng xếp từ "high" xuống "low".
+    missing: giá trị đánh dấu "không có dữ liệu" của phía gọi (-1.0 ở collector, None/NaN ở forecast).
+    """
+    name: str
+    missing: Optional[float]
+    clip_negative: bool  # collector: max(0, x); forecast: None -> 0
+    wind: Tuple[float, ...]
+    storm_gust: Tuple[float, ...]
+    storm_gust_vs_wind: bool  # gió giật vượt hẳn gió trung bình + mưa -> cộng điểm
+    storm_pressure: Tuple[float, ...]  # ngưỡng áp suất cho 4, 3, 2, (1) điểm
+    storm_weather_desc: bool  # mô tả OWM "thunderstorm"/"heavy" -> cộng điểm
+    storm_levels: Tuple[int, ...]
+    overall_min_score: dict  # điểm tối thiểu để hazard được tính vào nhãn tổng hợp
+    overall_strict_max: bool  # True: lấy hazard điểm cao nhất; False: hazard đạt ngưỡng cuối cùng theo HAZARD_PRIORITY
+
+
+NOWCAST = LabelProfile(
+    name="nowcast",
+    missing=-1.0,
+    clip_negative=True,
+    wind=(25, 18, 10, 5),
+    storm_gust=(25, 18, 12, 8),
+    storm_gust_vs_wind=False,
+    storm_pressure=(990, 995, 1000),
+    storm_weather_desc=True,
+    storm_levels=(12, 9, 6, 3),
+    overall_min_score={},
+    overall_strict_max=False,
+)
+
+FORECAST = LabelProfile(
+    name="forecast",
+    missing=None,
+    clip_negative=False,
+    wind=(30, 22, 15, 8),
+    storm_gust=(28, 20, 13, 7),
+    storm_gust_vs_wind=True,
+    storm_pressure=(990, 995, 1000, 1005),
+    storm_weather_desc=False,
+    storm_levels=(14, 10, 7, 3),
+    overall_min_score={"wind": 3},
+    overall_strict_max=True,
+)
+
+
+def _array(values, n=None) -> np.ndarray:
+    """list/Series/scalar (None -> NaN) -> mảng float"""
+    if values is None or np.isscalar(values):
+        values = [values] * (1 if n is None else n)
+    return np.asarray(values, dtype=np.float64)
+
+
+def _level(x: np.ndarray, profile: LabelProfile) -> np.ndarray:
+    """Giá trị đầu vào cho luật mưa/gió: collector cắt số âm về 0, forecast coi thiếu = 0"""
+    x = np.nan_to_num(x, nan=0.0)
+    return np.maximum(x, 0.0) if profile.clip_negative else x
+
+
+def _tier(x: np.ndarray, thresholds, strict: bool = True) -> np.ndarray:
+    """Số điểm 4..1 theo ngưỡng giảm dần (x > ngưỡng), 0 nếu không đạt ngưỡng nào"""
+    conditions = [x > t if strict else x >= t for t in thresholds]
+    return np.select(conditions, [4, 3, 2, 1][:len(thresholds)], default=0)
+
+
+def _rain_score(p6, p24) -> np.ndarray:
+    return np.select(
+        [(p24 > 80) | (p6 > 40), (p24 > 50) | (p6 > 25), (p24 > 20) | (p6 > 10), (p24 > 3) | (p6 > 1)],
+        [4, 3, 2, 1], default=0,
+    )
+
+
+def rain_scores(p6, p24, profile: LabelProfile) -> np.ndarray:
+    return _rain_score(_level(_array(p6), profile), _level(_array(p24), profile))
+
+
+def wind_scores(gust6, profile: LabelProfile) -> np.ndarray:
+    return _tier(_level(_array(gust6), profile), profile.wind)
+
+
+def storm_scores(gust6, p6, p24, wind, pressure, profile: LabelProfile, weather_desc=None) -> np.ndarray:
+    g6, r6, r24 = (_level(_array(v), profile) for v in (gust6, p6, p24))
+    score = _tier(g6, profile.storm_gust) + _rain_score(r6, r24)
+
+    if profile.storm_gust_vs_wind:
+        w = _array(wind)
+        score += np.select([(g6 > w + 12) & (r6 > 20), (g6 > w + 8) & (r6 > 10)], [2, 1], default=0)
+
+    pres = _array(pressure)
+    if profile.missing is not None:
+        pres = np.where(pres == profile.missing, 1013.0, pres)
+    score += np.select([pres < t for t in profile.storm_pressure], [4, 3, 2, 1][:len(profile.storm_pressure)], default=0)
+
+    if profile.storm_weather_desc and weather_desc is not None:
+        desc = np.char.lower(np.array([str(d) for d in weather_desc], dtype=str))
+        score += np.where(np.char.find(desc, "thunderstorm") >= 0, 2, np.where(np.char.find(desc, "heavy") >= 0, 1, 0))
+
+    return _tier(score, profile.storm_levels, strict=False)
+
+
+def flood_scores(river, profile: LabelProfile) -> np.ndarray:
+    # Thiếu dữ liệu (-1 / NaN) luôn dưới mọi ngưỡng -> "no"
+    return _tier(_array(river), (8000, 5000, 2000, 500))
+
+
+def earthquake_scores(mag, dist, profile: LabelProfile, n: int = None) -> np.ndarray:
+    m, d = _array(mag, n), _array(dist, n)
+    missing = np.isnan(m) | np.isnan(d)
+    if profile.missing is not None:
+        missing |= (m == profile.missing) | (d == profile.missing)
+    score = np.select(
+        [(m >= 6.0) & (d <= 150), (m >= 5.5) & (d <= 300), (m >= 5.0) & (d <= 500), (m >= 4.5) & (d <= 800)],
+        [4, 3, 2, 1], default=0,
+    )
+    return np.where(missing, 0, score)
+
+
+def overall_hazard(scores: dict, profile: LabelProfile) -> np.ndarray:
+    """scores: hazard -> mảng điểm 0..4 -> mảng nhãn tổng hợp ("No", "Rain", "Storm"...)"""
+    matrix = np.column_stack([scores[hz] for hz in HAZARD_PRIORITY])
+    thresholds = np.array([profile.overall_min_score.get(hz, 2) for hz in HAZARD_PRIORITY])
+    qualified = matrix >= thresholds
+    names = np.array([hz.capitalize() for hz in HAZARD_PRIORITY], dtype=object)
+
+    if profile.overall_strict_max:
+        # Điểm cao nhất trong các hazard đạt ngưỡng; bằng điểm thì hazard đứng trước trong HAZARD_PRIORITY thắng
+        masked = np.where(qualified, matrix, 0)
+        best = np.argmax(masked, axis=1)
+        found = masked.max(axis=1) > 0
+    else:
+        # Hazard đạt ngưỡng đứng sau cùng trong HAZARD_PRIORITY
+        best = len(HAZARD_PRIORITY) - 1 - np.argmax(qualified[:, ::-1], axis=1)
+        found = qualified.any(axis=1)
+    return np.where(found, names[best], "No")
+
+
+def label_hazards(profile: LabelProfile, *, p6, p24, gust6, wind, pressure, river,
+                  eq_mag=None, eq_dist=None, weather_desc=None) -> dict:
+    """
+    Gán nhãn cho n quan trắc (mỗi tham số là mảng/list độ dài n; eq_* có thể là None = không có dữ liệu).
+    Trả về dict mảng: rain, wind, storm, flood, earthquake (no/low/mid/mid-high/high) và overall.
+    """
+    scores = {
+        "rain": rain_scores(p6, p24, profile),
+        "wind": wind_scores(gust6, profile),
+        "storm": storm_scores(gust6, p6, p24, wind, pressure, profile, weather_desc),
+        "flood": flood_scores(river, profile),
+    }
+    scores["earthquake"] = earthquake_scores(eq_mag, eq_dist, profile, n=len(scores["rain"]))
+    labels = {hz: RISK_LEVELS[score] for hz, score in scores.items()}
+    labels["overall"] = overall_hazard(scores, profile)
+    return labels
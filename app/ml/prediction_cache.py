@@ -0,0 +1,98 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from app.core.config import PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL, PREDICTION_CACHE_DECIMALS
+from app.core.metrics import register_metrics
+
+
+class PredictionCache:
+    """
+    Cache LRU + TTL cho kết quả dự đoán.
+    Key = version model + hash của vector feature đã làm tròn (quantize),
+    nên các snapshot thời tiết giống nhau (hoặc gần như giống nhau) dùng lại kết quả cũ.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: int = PREDICTION_CACHE_SIZE,
+        ttl: float = PREDICTION_CACHE_TTL,
+        decimals: int = PREDICTION_CACHE_DECIMALS,
+    ):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.decimals = decimals
+
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        register_metrics(f"prediction_cache.{name}", self.stats)
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0 and self.ttl > 0
+
+    def keys_for(self, model_version: str, X: np.ndarray) -> list:
+        """Tạo key cho từng dòng của ma trận feature (làm tròn cả ma trận 1 lần)"""
+        Q = np.round(np.asarray(X, dtype=np.float64), self.decimals)
+        # -0.0 và 0.0 phải ra cùng 1 key
+        Q += 0.0
+        prefix = model_version.encode()
+        return [
+            prefix + b":" + hashlib.blake2b(row.tobytes(), digest_size=16).digest()
+            for row in Q
+        ]
+
+    def get(self, key):
+        """Trả về value hoặc None nếu không có / đã hết hạn"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        if value is None:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Xoá toàn bộ cache (VD: khi model được thay)"""
+        with self._lock:
+            self._data.clear()
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._data)
+        total = self.hits + self.misses
+        return {
+            "size": size,
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "decimals": self.decimals,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
@@ -1,5 +1,6 @@
 import os
-import joblib
+import threading
+import numpy as np
 import pandas as pd
 import xgboost as xgb
 import json
@@ -17,70 +18,159 @@ except ImportError:
         # Fallback 2: Nếu chạy trực tiếp tại thư mục con (lúc test)
         from .schemas import SafetyInput
 
+from app.ml.registry import registry
+from app.ml.prediction_cache import PredictionCache
+from app.ml.tree_engine import compile_booster
+from app.core.config import INFERENCE_BACKEND
+
 # --- CẤU HÌNH ĐƯỜNG DẪN MODEL (Tuyệt đối hóa để tránh lỗi File Not Found) ---
 # Lấy đường dẫn gốc của dự án (TravelSafetyBackend)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Trỏ vào thư mục data/models mà bạn đã copy sang
-MODEL_PATH = os.path.join(BASE_DIR, "data", "models", "xgboost_safety.json")
-FEATURES_PATH = os.path.join(BASE_DIR, "data", "models", "features_list.pkl")
+MODEL_PATH = registry.path_of("safety_model")
+FEATURES_PATH = registry.path_of("safety_features")
+
+# Cache kết quả dự đoán dùng chung; xoá sạch khi artifact của model bị thay
+prediction_cache = PredictionCache("safety")
+registry.add_listener(
+    lambda name: prediction_cache.clear() if name in ("safety_model", "safety_features") else None
+)
 
 class SafetyPredictor:
-    def __init__(self):
+    def __init__(self, handles=None):
         self.model = None
         self.features = []
+        self.model_version = ""
+        # Bộ handle cố định khi được dựng bởi registry.reload() (hot-swap); None = lấy từ registry
+        self._handles = handles
+        # Fast path: thứ tự feature biên dịch sẵn + buffer float32 riêng cho từng thread
+        self._use_fast_path = False
+        self._engine = None  # CompiledTreeEnsemble nếu INFERENCE_BACKEND = "compiled"
+        self._local = threading.local()
         self._load_model()
+        self._build_plan()
 
     def _load_model(self):
-        """Load model XGBoost và danh sách features"""
+        """Load model XGBoost và danh sách features (qua registry dùng chung)"""
         if not os.path.exists(MODEL_PATH):
             raise FileNotFoundError(f"❌ Không tìm thấy model tại: {MODEL_PATH}")
         
         if not os.path.exists(FEATURES_PATH):
             raise FileNotFoundError(f"❌ Không tìm thấy feature list tại: {FEATURES_PATH}")
 
-        # Load Model
-        self.model = xgb.Booster()
-        self.model.load_model(MODEL_PATH)
+        # Load Model (registry chỉ đọc file 1 lần cho cả process)
+        model_handle = registry.resolve("safety_model", self._handles)
+        self.model = model_handle.obj
         
         # Load Features List
-        self.features = joblib.load(FEATURES_PATH)
+        features_handle = registry.resolve("safety_features", self._handles)
+        self.features = features_handle.obj
+        self.model_version = f"{model_handle.version}+{features_handle.version}"
         print(f"✅ AI Model loaded successfully from {MODEL_PATH}")
 
+    # ------------------------------------------------------------------
+    # FAST PATH: không dùng pandas / DMatrix
+    # ------------------------------------------------------------------
+
+    def _build_plan(self):
+        """
+        Biên dịch 1 lần từ features_list.pkl: danh sách tên cột theo đúng thứ tự model.
+        Sau đó tự kiểm tra fast path cho kết quả giống hệt đường DataFrame cũ;
+        nếu lệch thì quay về đường cũ để không đổi output.
+        """
+        self._feature_plan = tuple(self.features)
+        try:
+            self._use_fast_path = self._fast_path_matches_reference()
+        except Exception as e:
+            print(f"⚠️ Fast path lỗi, dùng DataFrame: {e}")
+            self._use_fast_path = False
+
+        if not self._use_fast_path:
+            print("⚠️ Fast path không khớp đường DataFrame -> dùng DataFrame + DMatrix.")
+
+        if INFERENCE_BACKEND == "compiled":
+            self._engine = compile_booster(
+                self.model, self._score_reference, len(self._feature_plan), label="safety"
+            )
+
+    def _fast_path_matches_reference(self) -> bool:
+        rng = np.random.default_rng(0)
+        samples = []
+        for i in range(16):
+            row = {col: float(rng.normal(0, 50)) for col in self._feature_plan}
+            # Bỏ bớt vài feature để kiểm tra cả logic điền 0.0
+            for col in self._feature_plan[i % 3::3]:
+                row.pop(col)
+            samples.append(row)
+
+        fast = self._score_fast(samples)
+        reference = self._score_reference(samples)
+        return bool(np.array_equal(fast, reference))
+
+    def _buffer(self, n_rows: int) -> np.ndarray:
+        """Buffer float32 cấp phát sẵn (mỗi thread 1 buffer, chỉ nới rộng khi batch lớn hơn)"""
+        buf = getattr(self._local, "buf", None)
+        if buf is None or buf.shape[0] < n_rows:
+            buf = np.empty((max(n_rows, 1), len(self._feature_plan)), dtype=np.float32)
+            self._local.buf = buf
+        return buf[:n_rows]
+
+    def _fill_row(self, out: np.ndarray, input_obj):
+        """Điền 1 dòng buffer từ dict hoặc Pydantic model (thiếu cột -> 0.0, None -> NaN)"""
+        if isinstance(input_obj, dict):
+            get = input_obj.get
+            for j, col in enumerate(self._feature_plan):
+                val = get(col, 0.0)
+                out[j] = np.nan if val is None else val
+        else:
+            for j, col in enumerate(self._feature_plan):
+                val = getattr(input_obj, col, 0.0)
+                out[j] = np.nan if val is None else val
+
+    def _matrix(self, inputs) -> np.ndarray:
+        """Ma trận float32 (n, n_features) theo đúng thứ tự feature (buffer của thread hiện tại)"""
+        if isinstance(inputs, np.ndarray):
+            return np.ascontiguousarray(inputs, dtype=np.float32)
+        X = self._buffer(len(inputs))
+        for i, item in enumerate(inputs):
+            self._fill_row(X[i], item)
+        return X
+
+    def _score_fast(self, inputs) -> np.ndarray:
+        # inplace_predict: XGBoost đọc thẳng từ numpy, không tạo DMatrix
+        return np.asarray(self.model.inplace_predict(self._matrix(inputs))).reshape(-1)
+
+    def _score_reference(self, inputs) -> np.ndarray:
+        """Đường cũ (DataFrame + DMatrix), giữ lại làm chuẩn đối chiếu và fallback"""
+        if isinstance(inputs, np.ndarray):
+            input_df = pd.DataFrame(np.asarray(inputs, dtype=float), columns=self.features)
+        else:
+            # Cột thiếu ở từng bản ghi điền 0.0 giống predict_safety_score
+            rows = [self._to_dict(item) for item in inputs]
+            input_df = pd.DataFrame(
+                [{col: row.get(col, 0.0) for col in self.features} for row in rows],
+                columns=self.features,
+            )
+        return self.model.predict(xgb.DMatrix(input_df))
+
+    def _score(self, inputs) -> np.ndarray:
+        if self._engine is not None:
+            return self._engine.predict(self._matrix(inputs))
+        if self._use_fast_path:
+            return self._score_fast(inputs)
+        return self._score_reference(inputs)
+
     def predict_safety_score(self, input_data: dict) -> dict:
         """
         Dự đoán điểm an toàn từ dữ liệu đầu vào.
         Input: Dictionary chứa các trường như temperature, wind_speed...
         Output: Dictionary {'safety_score': 85, 'risk_level': 'Low', ...}
         """
-        if not self.model:
-            raise Exception("Model chưa được load!")
+        return self.predict_many([input_data])[0]
 
-        # 1. Chuyển đổi input dict thành DataFrame
-        # Đảm bảo thứ tự cột khớp với lúc train (dùng self.features)
-        input_df = pd.DataFrame([input_data])
-        
-        # Tạo các cột còn thiếu (nếu có) và điền 0 hoặc giá trị mặc định
-        for col in self.features:
-            if col not in input_df.columns:
-                input_df[col] = 0.0
-                
-        # Chỉ lấy đúng các cột feature cần thiết theo thứ tự
-        input_df = input_df[self.features]
-
-        # 2. Tạo DMatrix cho XGBoost
-        dtest = xgb.DMatrix(input_df)
-
-        # 3. Dự đoán (Model trả về giá trị 0-100 hoặc 0-1 tùy lúc train)
-        # Giả sử model trả về 0-100
-        score = self.model.predict(dtest)[0]
-        
-        # Logic hậu xử lý (nếu model trả về 0-1 thì nhân 100)
-        # score = float(score) * 100 if score <= 1 else float(score)
-        
-        final_score = float(score)
-
-        # 4. Phân loại rủi ro (Logic riêng của AI hoặc dùng chung GIS)
+    def _format_result(self, final_score: float) -> dict:
+        """Phân loại rủi ro (Logic riêng của AI hoặc dùng chung GIS)"""
         risk_level = "Info"
         if final_score < 25: risk_level = "High"
         elif final_score < 50: risk_level = "Medium"
@@ -91,10 +181,69 @@ class SafetyPredictor:
             "risk_level": risk_level
         }
 
+    def predict_many(self, inputs) -> list:
+        """
+        Dự đoán điểm an toàn cho nhiều bản ghi trong 1 lần gọi model.
+        Input: list dict / Pydantic model, hoặc mảng 2 chiều (cột theo thứ tự self.features).
+        Output: list {'safety_score', 'risk_level'} cùng thứ tự input.
+        """
+        if not self.model:
+            raise Exception("Model chưa được load!")
+        if len(inputs) == 0:
+            return []
+
+        if not prediction_cache.enabled:
+            return [self._format_result(float(score)) for score in self._score(inputs)]
+
+        # 1. Tra cache theo vector feature đã làm tròn
+        X = self._matrix(inputs)
+        keys = prediction_cache.keys_for(self.model_version, X)
+        results = [prediction_cache.get(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+
+        # 2. Chỉ chạy model cho các dòng chưa có trong cache
+        if missing:
+            if self._engine is not None:
+                scores = self._engine.predict(X[missing])
+            elif self._use_fast_path:
+                scores = np.asarray(self.model.inplace_predict(X[missing])).reshape(-1)
+            elif isinstance(inputs, np.ndarray):
+                scores = self._score_reference(inputs[missing])
+            else:
+                scores = self._score_reference([inputs[i] for i in missing])
+
+            for i, score in zip(missing, scores):
+                results[i] = self._format_result(float(score))
+                prediction_cache.put(keys[i], results[i])
+
+        # Trả bản sao để caller sửa dict không làm hỏng cache
+        return [dict(result) for result in results]
+
+    def run_model(self, X: np.ndarray) -> np.ndarray:
+        """Chạy model trực tiếp trên ma trận feature, bỏ qua cache (dùng cho warm-up/benchmark)"""
+        return self._score(X)
+
+    def warm_up(self):
+        """Chạy thử 1 batch trước khi được đưa vào phục vụ (registry gọi khi hot-swap)"""
+        if not self.model:
+            raise RuntimeError("Model chưa được load!")
+        self.run_model(np.zeros((8, len(self._feature_plan)), dtype=np.float32))
+
+    @staticmethod
+    def _to_dict(input_obj):
+        if hasattr(input_obj, 'dict'):
+            return input_obj.dict()
+        return input_obj
+
     # Hàm wrapper để hỗ trợ Pydantic Input (nếu gọi từ API)
+    # Fast path đọc thẳng thuộc tính của Pydantic model, không cần .dict()
     def predict(self, input_obj):
-        if hasattr(input_obj, 'dict'):
-            data = input_obj.dict()
-        else:
-            data = input_obj
-        return self.predict_safety_score(data)
\ No newline at end of file
+        return self.predict_safety_score(input_obj)
+
+
+registry.register_model("safety", SafetyPredictor, ["safety_model", "safety_features"])
+
+
+def get_safety_predictor() -> SafetyPredictor:
+    """SafetyPredictor đang phục vụ (API, pipeline...); đổi sang bản mới sau mỗi lần hot-swap"""
+    return registry.model("safety")
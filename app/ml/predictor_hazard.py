@@ -1,16 +1,23 @@
 import os
-import joblib
 import numpy as np
 import pandas as pd
 import xgboost as xgb
 
+from app.ml.registry import registry
+from app.ml.prediction_cache import PredictionCache
+from app.ml.tree_engine import compile_booster
+from app.core.config import INFERENCE_BACKEND
+
 # Lấy đường dẫn gốc
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-MODEL_PATH = os.path.join(BASE_DIR, "data", "models", "hazard_model.pkl")
+MODEL_PATH = registry.path_of("hazard_model")
 # Chúng ta sẽ ưu tiên lấy feature từ model, file này chỉ là dự phòng
-FEATURES_PATH = os.path.join(BASE_DIR, "data", "models", "features_list.pkl")
-LABEL_PATH = os.path.join(BASE_DIR, "data", "models", "hazard_label_encoder.pkl")
+FEATURES_PATH = registry.path_of("safety_features")
+LABEL_PATH = registry.path_of("hazard_label_encoder")
+# Feature list + scaler của dự báo 7 ngày: đi cùng model, được hot-swap cùng lúc với model
+FORECAST_FEATURES_PATH = registry.path_of("hazard_features")
+SCALER_PATH = registry.path_of("hazard_scaler")
 
 # Mapping chuẩn để chuyển đổi chuỗi sang số (Khớp với logic data_collector)
 RISK_MAPPING = {
@@ -21,12 +28,25 @@ RISK_MAPPING = {
     "high": 4, "danger": 4
 }
 
+# Cache kết quả dự đoán dùng chung; xoá sạch khi artifact của model bị thay
+prediction_cache = PredictionCache("hazard")
+registry.add_listener(
+    lambda name: prediction_cache.clear() if name.startswith("hazard_") or name == "safety_features" else None
+)
+
 class HazardPredictor:
-    def __init__(self):
+    def __init__(self, handles=None):
         self.model = None
+        self.raw_model = None  # object gốc trong file (VD XGBClassifier) cho dự báo 7 ngày
         self.features = []
         self.label_encoder = None
+        self.forecast_features = None
+        self.scaler = None
         self.model_type = "sklearn" # Mặc định
+        self.model_version = ""
+        self._engine = None  # CompiledTreeEnsemble nếu INFERENCE_BACKEND = "compiled"
+        # Bộ handle cố định khi được dựng bởi registry.reload() (hot-swap); None = lấy từ registry
+        self._handles = handles
         
         self.DEFAULT_MAP = {
             0: "No", 1: "Rain", 2: "Storm", 3: "Wind", 4: "Flood", 5: "Earthquake"
@@ -40,8 +60,11 @@ class HazardPredictor:
             return
 
         try:
-            # 1. Load Model
-            loaded_object = joblib.load(MODEL_PATH)
+            # 1. Load Model (qua registry: cả process chỉ đọc pickle 1 lần)
+            model_handle = registry.resolve("hazard_model", self._handles)
+            loaded_object = model_handle.obj
+            self.raw_model = loaded_object
+            versions = [model_handle.version]
 
             # Tự động nhận diện loại Model
             if isinstance(loaded_object, xgb.Booster):
@@ -63,20 +86,43 @@ class HazardPredictor:
                 print(f"✅ Detected features from booster: {self.features}")
             elif os.path.exists(FEATURES_PATH):
                 # Chỉ dùng file list nếu model không tự khai báo được
-                self.features = joblib.load(FEATURES_PATH)
+                self.features = registry.resolve("safety_features", self._handles).obj
                 print(f"⚠️ Loaded features from list file: {self.features}")
             else:
                 print("❌ Cannot determine input features!")
 
             # 3. Load Label Encoder cho Output
             if os.path.exists(LABEL_PATH):
-                self.label_encoder = joblib.load(LABEL_PATH)
+                encoder_handle = registry.resolve("hazard_label_encoder", self._handles)
+                self.label_encoder = encoder_handle.obj
+                versions.append(encoder_handle.version)
 
+            # 4. Feature list + scaler của dự báo 7 ngày (cùng bộ handle với model -> không ghép model mới với scaler cũ)
+            for name, path, attr in (
+                ("hazard_features", FORECAST_FEATURES_PATH, "forecast_features"),
+                ("hazard_scaler", SCALER_PATH, "scaler"),
+            ):
+                if os.path.exists(path):
+                    handle = registry.resolve(name, self._handles)
+                    setattr(self, attr, handle.obj)
+                    versions.append(handle.version)
+
+            self.model_version = "+".join(versions)
             print(f"✅ Hazard Model loaded ({self.model_type}).")
+
+            # 5. Backend biên dịch (tuỳ chọn), chỉ áp dụng cho booster XGBoost
+            if INFERENCE_BACKEND == "compiled" and self.model_type == "xgboost" and self.features:
+                self._engine = compile_booster(
+                    self.model,
+                    lambda X: self.model.predict(xgb.DMatrix(X, feature_names=self.features)),
+                    len(self.features),
+                    label="hazard",
+                )
             
         except Exception as e:
             print(f"❌ Error loading model: {e}")
             self.model = None
+            self.raw_model = None
 
     def _prepare_value(self, feature_name, value):
         """
@@ -95,64 +141,117 @@ class HazardPredictor:
         except:
             return 0.0
 
-    def _prepare(self, data: dict):
-        """Chuẩn bị dữ liệu input khớp hoàn toàn với yêu cầu của Model"""
-        try:
-            row = []
-            if not self.features:
-                print("⚠️ No features defined for model input.")
+    def _prepare_many(self, inputs):
+        """
+        Chuẩn bị ma trận (n, n_features) cho cả batch.
+        - inputs là mảng 2 chiều: coi như cột đã đúng thứ tự self.features.
+        - inputs là list dict: mỗi dict được xử lý như _prepare().
+        """
+        if not self.features:
+            print("⚠️ No features defined for model input.")
+            return None
+
+        if isinstance(inputs, np.ndarray):
+            X = np.asarray(inputs, dtype=float)
+            if X.ndim != 2 or X.shape[1] != len(self.features):
+                print(f"⚠️ Input shape {X.shape} không khớp {len(self.features)} features.")
                 return None
+            return X
 
-            for feature in self.features:
-                # Lấy giá trị từ DB (data)
-                raw_val = data.get(feature, 0)
-                
-                # Xử lý giá trị (Encode nếu cần)
-                clean_val = self._prepare_value(feature, raw_val)
-                row.append(clean_val)
-                
-            return np.array(row).reshape(1, -1)
-        except Exception as e:
-            print(f"⚠️ Error preparing data: {e}")
-            return None
+        X = np.empty((len(inputs), len(self.features)), dtype=float)
+        for i, data in enumerate(inputs):
+            for j, feature in enumerate(self.features):
+                X[i, j] = self._prepare_value(feature, data.get(feature, 0))
+        return X
 
-    def predict_overall_hazard(self, input_data: dict):
+    def _predict_raw(self, X):
+        """Chạy model trên cả ma trận X trong 1 lần gọi"""
+        if self._engine is not None:
+            return self._engine.predict(X)
+        if self.model_type == "xgboost":
+            dmatrix = xgb.DMatrix(X, feature_names=self.features)
+            return self.model.predict(dmatrix)
+        # Scikit-Learn cần DataFrame có tên cột
+        X_df = pd.DataFrame(X, columns=self.features)
+        return self.model.predict(X_df)
+
+    def _decode_labels(self, pred_raw) -> list:
+        """Chuyển output thô của model (xác suất hoặc id) thành tên hazard"""
+        pred_raw = np.asarray(pred_raw)
+        if pred_raw.ndim > 1:
+            label_ids = np.argmax(pred_raw, axis=1)
+        else:
+            label_ids = np.rint(pred_raw.astype(float)).astype(int)
+
+        if self.label_encoder:
+            try:
+                return [str(x) for x in self.label_encoder.inverse_transform(label_ids)]
+            except Exception:
+                # Có id ngoài encoder -> xử lý từng phần tử như logic cũ
+                labels = []
+                for label_id in label_ids:
+                    try:
+                        labels.append(str(self.label_encoder.inverse_transform([label_id])[0]))
+                    except Exception:
+                        labels.append(self.DEFAULT_MAP.get(int(label_id), "Unknown"))
+                return labels
+
+        return [self.DEFAULT_MAP.get(int(label_id), "Unknown") for label_id in label_ids]
+
+    def predict_many(self, inputs) -> list:
+        """
+        Dự báo cho nhiều bản ghi trong 1 lần gọi model.
+        Input: list dict (giống predict_overall_hazard) hoặc mảng 2 chiều.
+        Output: list tên hazard cùng thứ tự input ("Unknown" nếu lỗi).
+        """
+        n = len(inputs)
+        if n == 0:
+            return []
         if not self.model:
-            return "Unknown"
+            return ["Unknown"] * n
 
         try:
-            # 1. Chuẩn bị dữ liệu
-            X = self._prepare(input_data)
-            if X is None: return "Unknown"
-            
-            # 2. Chạy dự báo
-            if self.model_type == "xgboost":
-                dmatrix = xgb.DMatrix(X)
-                dmatrix.feature_names = self.features
-                pred_raw = self.model.predict(dmatrix)
-            else:
-                # Scikit-Learn cần DataFrame có tên cột
-                X_df = pd.DataFrame(X, columns=self.features)
-                pred_raw = self.model.predict(X_df)
-            
-            # 3. Xử lý kết quả
-            if isinstance(pred_raw, list): pred_raw = np.array(pred_raw)
-
-            if len(pred_raw.shape) > 1:
-                label_id = int(np.argmax(pred_raw[0]))
-            else:
-                val = pred_raw[0] if isinstance(pred_raw, (np.ndarray, list)) else pred_raw
-                label_id = int(round(val))
-
-            # 4. Map sang tên gọi
-            if self.label_encoder:
-                try:
-                    return self.label_encoder.inverse_transform([label_id])[0]
-                except:
-                    return self.DEFAULT_MAP.get(label_id, "Unknown")
-            else:
-                return self.DEFAULT_MAP.get(label_id, "Unknown")
+            X = self._prepare_many(inputs)
+            if X is None:
+                return ["Unknown"] * n
+            if not prediction_cache.enabled:
+                return self._decode_labels(self._predict_raw(X))
 
+            # Tra cache theo vector feature đã làm tròn, chỉ chạy model cho phần còn thiếu
+            keys = prediction_cache.keys_for(self.model_version, X)
+            labels = [prediction_cache.get(key) for key in keys]
+            missing = [i for i, label in enumerate(labels) if label is None]
+            if missing:
+                new_labels = self._decode_labels(self._predict_raw(X[missing]))
+                for i, label in zip(missing, new_labels):
+                    labels[i] = label
+                    prediction_cache.put(keys[i], label)
+            return labels
         except Exception as e:
             print(f"⚠️ Prediction logic error: {e}")
-            return "Unknown"
\ No newline at end of file
+            return ["Unknown"] * n
+
+    def predict_overall_hazard(self, input_data: dict):
+        return self.predict_many([input_data])[0]
+
+    def run_model(self, X: np.ndarray) -> list:
+        """Chạy model trực tiếp trên ma trận feature, bỏ qua cache (dùng cho warm-up/benchmark)"""
+        return self._decode_labels(self._predict_raw(np.asarray(X, dtype=float)))
+
+    def warm_up(self):
+        """
+        Chạy thử 1 batch trước khi được đưa vào phục vụ (registry gọi khi hot-swap).
+        Lỗi thì raise để registry giữ lại model cũ.
+        """
+        if not self.model or not self.features:
+            raise RuntimeError("Hazard model chưa được load!")
+        self.run_model(np.zeros((8, len(self.features)), dtype=float))
+
+registry.register_model(
+    "hazard", HazardPredictor,
+    ["hazard_model", "safety_features", "hazard_label_encoder", "hazard_features", "hazard_scaler"],
+)
+
+def get_hazard_predictor() -> HazardPredictor:
+    """HazardPredictor đang phục vụ (API, pipeline...); đổi sang bản mới sau mỗi lần hot-swap"""
+    return registry.model("hazard")
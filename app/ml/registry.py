@@ -0,0 +1,299 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+import joblib
+import xgboost as xgb
+
+from app.core.config import MODEL_WATCH_INTERVAL
+from app.core.metrics import register_metrics
+
+# Lấy đường dẫn gốc của dự án
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+MODELS_DIR = os.path.join(BASE_DIR, "data", "models")
+
+# Tên logic -> tên file trong data/models (mọi module dùng chung bảng này)
+ARTIFACTS = {
+    "safety_model": "xgboost_safety.json",
+    "safety_features": "features_list.pkl",
+    "hazard_model": "hazard_model.pkl",
+    "hazard_features": "hazard_features.pkl",
+    "hazard_label_encoder": "hazard_label_encoder.pkl",
+    "hazard_scaler": "hazard_scaler.pkl",
+}
+
+
+@dataclass(frozen=True)
+class ModelHandle:
+    """
+    Handle bất biến trỏ tới 1 artifact đã load.
+    `obj` được chia sẻ giữa mọi request/thread -> chỉ đọc, không được sửa.
+    """
+    name: str
+    path: str
+    obj: Any
+    version: str
+    loaded_at: float
+
+
+def _file_version(path: str) -> str:
+    """Version của artifact = mtime + size (đổi file là đổi version)"""
+    st = os.stat(path)
+    return f"{int(st.st_mtime)}-{st.st_size}"
+
+
+def _load_artifact(path: str):
+    """Model XGBoost (.json/.ubj) load bằng Booster, còn lại dùng joblib"""
+    if path.endswith((".json", ".ubj")):
+        booster = xgb.Booster()
+        booster.load_model(path)
+        return booster
+    return joblib.load(path)
+
+
+class ModelRegistry:
+    """
+    Registry dùng chung cho toàn process:
+    - Mỗi artifact chỉ load 1 lần, lazy (lần đầu có người cần).
+    - Thread-safe: nhiều thread gọi get() cùng lúc vẫn chỉ load 1 lần.
+    - Các object dùng chung (VD: predictor) cũng được giữ tại đây qua shared().
+    """
+
+    def __init__(self, models_dir: str = MODELS_DIR):
+        self.models_dir = models_dir
+        self._handles: Dict[str, ModelHandle] = {}
+        self._shared: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+        self._listeners: List[Callable[[str], None]] = []
+        # Model (predictor) đã đăng ký: key -> (factory(handles=...), danh sách artifact)
+        self._factories: Dict[str, tuple] = {}
+        self._swaps: Dict[str, dict] = {}
+
+    def _lock_for(self, key: str) -> threading.Lock:
+        with self._guard:
+            if key not in self._locks:
+                self._locks[key] = threading.Lock()
+            return self._locks[key]
+
+    def path_of(self, name: str) -> str:
+        if name not in ARTIFACTS:
+            raise KeyError(f"Artifact không được đăng ký: {name}")
+        return os.path.join(self.models_dir, ARTIFACTS[name])
+
+    def exists(self, name: str) -> bool:
+        return os.path.exists(self.path_of(name))
+
+    def get(self, name: str) -> ModelHandle:
+        """Trả về handle của artifact, load nếu chưa có. Lỗi nếu file không tồn tại."""
+        handle = self._handles.get(name)
+        if handle is not None:
+            return handle
+
+        with self._lock_for(name):
+            # Double-check: thread khác có thể đã load xong trong lúc chờ lock
+            handle = self._handles.get(name)
+            if handle is not None:
+                return handle
+
+            handle = self._load_handle(name)
+            self._handles[name] = handle
+            return handle
+
+    def _load_handle(self, name: str) -> ModelHandle:
+        """Đọc artifact từ đĩa thành handle mới (chưa công bố cho ai dùng)"""
+        path = self.path_of(name)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"❌ Không tìm thấy artifact '{name}' tại: {path}")
+
+        # Lấy version trước khi đọc: nếu file bị ghi đè trong lúc đọc, lần kiểm tra sau sẽ thấy lệch và load lại
+        version = _file_version(path)
+        handle = ModelHandle(
+            name=name,
+            path=path,
+            obj=_load_artifact(path),
+            version=version,
+            loaded_at=time.time(),
+        )
+        print(f"✅ [ModelRegistry] Loaded '{name}' ({handle.version})")
+        return handle
+
+    def resolve(self, name: str, handles: Optional[Dict[str, ModelHandle]] = None) -> ModelHandle:
+        """Lấy handle từ bộ handles được truyền vào (khi đang dựng model mới), nếu không có thì từ registry"""
+        if handles and name in handles:
+            return handles[name]
+        return self.get(name)
+
+    def shared(self, key: str, factory: Callable[[], Any]):
+        """Singleton dùng chung cho cả process (VD: HazardPredictor), tạo lazy bằng factory"""
+        obj = self._shared.get(key)
+        if obj is not None:
+            return obj
+
+        with self._lock_for(f"shared:{key}"):
+            obj = self._shared.get(key)
+            if obj is None:
+                obj = factory()
+                self._shared[key] = obj
+            return obj
+
+    def add_listener(self, callback: Callable[[str], None]):
+        """Đăng ký callback(name) được gọi mỗi khi 1 artifact bị thay (hot-swap)"""
+        with self._guard:
+            self._listeners.append(callback)
+
+    def _notify(self, name: str):
+        with self._guard:
+            listeners = list(self._listeners)
+        for callback in listeners:
+            try:
+                callback(name)
+            except Exception as e:
+                print(f"⚠️ [ModelRegistry] Listener lỗi khi xử lý '{name}': {e}")
+
+    # ------------------------------------------------------------------
+    # MODEL CÓ VERSION + HOT-SWAP
+    # ------------------------------------------------------------------
+
+    def register_model(self, key: str, factory: Callable[..., Any], artifacts: List[str]):
+        """
+        Đăng ký 1 model dùng chung (VD: "hazard" -> HazardPredictor).
+        factory(handles=None) dựng object từ các handle; artifacts là các file model phụ thuộc.
+        """
+        self._factories[key] = (factory, tuple(artifacts))
+
+    def model_names(self) -> List[str]:
+        return list(self._factories)
+
+    def model(self, key: str):
+        """Object đang phục vụ của model `key` (dựng lazy lần đầu)"""
+        factory, _ = self._factories[key]
+        return self.shared(key, factory)
+
+    def reload(self, key: str) -> dict:
+        """
+        Hot-swap không downtime:
+        1. Đọc lại các artifact có file thay đổi (artifact không đổi dùng lại handle cũ).
+        2. Dựng object mới + warm-up ở thread hiện tại (request vẫn dùng object cũ).
+        3. Công bố handle + object mới trong 1 thao tác dưới lock, rồi báo listener (xoá cache).
+        Lỗi ở bước 1-2 thì object cũ vẫn phục vụ bình thường.
+        """
+        factory, artifacts = self._factories[key]
+        with self._lock_for(f"reload:{key}"):
+            handles, changed = {}, []
+            for name in artifacts:
+                if not self.exists(name):
+                    continue
+                current = self._handles.get(name)
+                if current is not None and current.version == _file_version(current.path):
+                    handles[name] = current
+                else:
+                    handles[name] = self._load_handle(name)
+                    changed.append(name)
+
+            obj = factory(handles=handles)
+            warm_up = getattr(obj, "warm_up", None)
+            if callable(warm_up):
+                warm_up()
+
+            with self._guard:
+                for name in changed:
+                    self._handles[name] = handles[name]
+                self._shared[key] = obj
+                info = self._swaps.setdefault(key, {"swaps": 0})
+                info["swaps"] += 1
+                info["last_swap_at"] = time.time()
+                info["version"] = getattr(obj, "model_version", "")
+
+            for name in changed:
+                self._notify(name)
+
+            print(f"🔁 [ModelRegistry] Model '{key}' -> version {info['version']} (đổi: {changed or 'không'})")
+            return {"model": key, "version": info["version"], "changed": changed}
+
+    def changed_models(self) -> List[str]:
+        """Các model đang chạy có file artifact trên đĩa khác với bản đang dùng"""
+        result = []
+        for key, (_, artifacts) in self._factories.items():
+            if key not in self._shared:
+                continue  # chưa ai dùng -> lần dựng đầu tiên sẽ đọc file mới
+            for name in artifacts:
+                if not self.exists(name):
+                    continue
+                current = self._handles.get(name)
+                try:
+                    if current is None or current.version != _file_version(current.path):
+                        result.append(key)
+                        break
+                except OSError:
+                    continue
+        return result
+
+    def reload_changed(self) -> List[dict]:
+        """Reload mọi model có artifact thay đổi (gọi định kỳ bởi ModelWatcher)"""
+        results = []
+        for key in self.changed_models():
+            try:
+                results.append(self.reload(key))
+            except Exception as e:
+                print(f"❌ [ModelRegistry] Reload '{key}' thất bại, giữ model cũ: {e}")
+        return results
+
+    def status(self) -> Dict[str, dict]:
+        """Version đang phục vụ của từng model + artifact (cho API /system/models và metrics)"""
+        models = {}
+        for key in self._factories:
+            obj = self._shared.get(key)
+            models[key] = {
+                "loaded": obj is not None,
+                "version": getattr(obj, "model_version", None) if obj is not None else None,
+                **{k: v for k, v in self._swaps.get(key, {}).items() if k != "version"},
+            }
+        return {"models": models, "artifacts": self.loaded()}
+
+    def loaded(self) -> Dict[str, dict]:
+        """Thông tin các artifact đang nằm trong bộ nhớ (phục vụ debug/giám sát)"""
+        return {
+            name: {"path": h.path, "version": h.version, "loaded_at": h.loaded_at}
+            for name, h in self._handles.items()
+        }
+
+
+class ModelWatcher(threading.Thread):
+    """Thread nền: định kỳ kiểm tra file model, có thay đổi thì hot-swap"""
+
+    def __init__(self, target_registry: ModelRegistry, interval: float):
+        super().__init__(name="model-watcher", daemon=True)
+        self.registry = target_registry
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.registry.reload_changed()
+            except Exception as e:
+                print(f"⚠️ [ModelWatcher] Lỗi: {e}")
+
+    def stop(self):
+        self._stop_event.set()
+
+
+# Instance duy nhất cho toàn process
+registry = ModelRegistry()
+register_metrics("models", registry.status)
+
+_watcher: Optional[ModelWatcher] = None
+
+
+def start_model_watcher(interval: float = MODEL_WATCH_INTERVAL) -> Optional[ModelWatcher]:
+    """Bật thread theo dõi file model (interval <= 0 thì tắt)"""
+    global _watcher
+    if interval <= 0 or (_watcher is not None and _watcher.is_alive()):
+        return _watcher
+    _watcher = ModelWatcher(registry, interval)
+    _watcher.start()
+    print(f"👀 [ModelWatcher] Theo dõi {registry.models_dir} mỗi {interval:g}s")
+    return _watcher
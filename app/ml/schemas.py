@@ -29,6 +29,14 @@ class SafetyOutput(BaseModel):
     safety_score: float
     risk_level: Literal['Info', 'Low', 'Medium', 'High']
     suggestion: str
+
+class SafetyBatchInput(BaseModel):
+    # Danh sách bản ghi cần dự đoán trong 1 lần gọi model
+    items: List[SafetyInput] = Field(..., description="Danh sách input (tối đa MAX_BATCH_ITEMS)")
+
+# Giới hạn số bản ghi mỗi request batch (tránh 1 request chiếm hết CPU)
+MAX_BATCH_ITEMS = 500
+
 class SOSRequest(BaseModel):
     latitude: float
     longitude: float
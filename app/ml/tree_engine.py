@@ -0,0 +1,200 @@
+import json
+from typing import Optional
+
+import numpy as np
+
+# Objective XGBoost mà engine hỗ trợ -> cách biến margin thành output
+_IDENTITY_OBJECTIVES = {"reg:squarederror", "reg:linear", "reg:absoluteerror", "reg:pseudohubererror"}
+_SIGMOID_OBJECTIVES = {"binary:logistic", "reg:logistic"}
+_SOFTMAX_OBJECTIVES = {"multi:softprob", "multi:softmax"}
+
+
+class UnsupportedModelError(Exception):
+    """Model có cấu trúc engine không biên dịch được (dart, gblinear, split categorical...)"""
+
+
+def _parse_base_score(raw) -> np.ndarray:
+    # XGBoost >= 2 lưu dạng chuỗi "[8.424046E1]" hoặc "[a,b,c]" (multi-output)
+    text = str(raw).strip().strip("[]")
+    return np.array([float(x) for x in text.split(",") if x.strip()], dtype=np.float32)
+
+
+class CompiledTreeEnsemble:
+    """
+    Biên dịch Booster XGBoost (gbtree) thành các mảng phẳng và dự đoán bằng numpy:
+    mọi cây được duyệt song song, mỗi bước xuống 1 tầng cho cả batch.
+
+    Mảng node có kích thước (n_trees * max_nodes); node lá trỏ left/right về chính nó
+    nên sau max_depth bước mọi dòng đều dừng ở lá, không cần nhánh if.
+    """
+
+    def __init__(self, config: dict):
+        learner = config["learner"]
+        self.objective = learner["objective"]["name"]
+        if self.objective not in _IDENTITY_OBJECTIVES | _SIGMOID_OBJECTIVES | _SOFTMAX_OBJECTIVES:
+            raise UnsupportedModelError(f"Objective chưa hỗ trợ: {self.objective}")
+
+        booster = learner["gradient_booster"]
+        if booster.get("name") != "gbtree":
+            raise UnsupportedModelError(f"Booster chưa hỗ trợ: {booster.get('name')}")
+
+        model = booster["model"]
+        trees = model["trees"]
+        if not trees:
+            raise UnsupportedModelError("Model không có cây nào")
+
+        model_param = learner["learner_model_param"]
+        self.num_class = int(model_param.get("num_class", "0") or 0)
+        self.num_feature = int(model_param["num_feature"])
+        self.n_outputs = max(1, self.num_class)
+        self.tree_group = np.asarray(model["tree_info"], dtype=np.int64)
+
+        base_score = _parse_base_score(model_param["base_score"])
+        if self.objective in _SIGMOID_OBJECTIVES:
+            # base_score lưu ở không gian xác suất -> đổi sang margin
+            p = base_score.astype(np.float64)
+            base_score = np.log(p / (1.0 - p)).astype(np.float32)
+        self.base_margin = np.broadcast_to(base_score, (self.n_outputs,)).astype(np.float32)
+
+        self._compile(trees)
+
+    @classmethod
+    def from_booster(cls, booster) -> "CompiledTreeEnsemble":
+        return cls(json.loads(booster.save_raw("json")))
+
+    def _compile(self, trees: list):
+        n_trees = len(trees)
+        max_nodes = max(len(t["left_children"]) for t in trees)
+
+        feature = np.zeros((n_trees, max_nodes), dtype=np.int64)
+        threshold = np.zeros((n_trees, max_nodes), dtype=np.float32)
+        left = np.zeros((n_trees, max_nodes), dtype=np.int64)
+        right = np.zeros((n_trees, max_nodes), dtype=np.int64)
+        default_left = np.zeros((n_trees, max_nodes), dtype=bool)
+        value = np.zeros((n_trees, max_nodes), dtype=np.float32)
+
+        max_depth = 0
+        for t, tree in enumerate(trees):
+            if any(int(x) != 0 for x in tree.get("split_type", [])):
+                raise UnsupportedModelError("Split categorical chưa hỗ trợ")
+            if int(tree["tree_param"].get("size_leaf_vector", "1")) > 1:
+                raise UnsupportedModelError("Cây multi-target chưa hỗ trợ")
+
+            lc = np.asarray(tree["left_children"], dtype=np.int64)
+            rc = np.asarray(tree["right_children"], dtype=np.int64)
+            n = len(lc)
+            nodes = np.arange(n)
+            is_leaf = lc == -1
+            offset = t * max_nodes
+
+            # Chỉ số node được đổi sang chỉ số phẳng toàn ensemble
+            feature[t, :n] = np.asarray(tree["split_indices"], dtype=np.int64)
+            threshold[t, :n] = np.asarray(tree["split_conditions"], dtype=np.float32)
+            default_left[t, :n] = np.asarray(tree["default_left"], dtype=np.int64) != 0
+            left[t, :n] = np.where(is_leaf, nodes, lc) + offset
+            right[t, :n] = np.where(is_leaf, nodes, rc) + offset
+            # Với node lá, split_conditions chính là giá trị lá
+            value[t, :n] = np.where(is_leaf, threshold[t, :n], 0.0)
+            feature[t, :n][is_leaf] = 0
+
+            # Node đệm (cây nhỏ hơn max_nodes) trỏ về chính nó, không bao giờ được dùng
+            pad = np.arange(n, max_nodes)
+            left[t, n:] = pad + offset
+            right[t, n:] = pad + offset
+
+            max_depth = max(max_depth, self._depth(lc, rc))
+
+        self.n_trees = n_trees
+        self.max_depth = max_depth
+        self._feature = feature.ravel()
+        self._threshold = threshold.ravel()
+        self._left = left.ravel()
+        self._right = right.ravel()
+        self._default_left = default_left.ravel()
+        self._value = value.ravel()
+        self._roots = np.arange(n_trees, dtype=np.int64) * max_nodes
+
+    @staticmethod
+    def _depth(lc: np.ndarray, rc: np.ndarray) -> int:
+        depth, frontier = 0, [0]
+        while frontier:
+            children = [c for node in frontier for c in (lc[node], rc[node]) if c != -1]
+            if not children:
+                break
+            depth += 1
+            frontier = children
+        return depth
+
+    def predict_margin(self, X) -> np.ndarray:
+        """Margin thô (n, n_outputs), cộng dồn float32 theo đúng thứ tự cây như XGBoost"""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.num_feature:
+            raise ValueError(f"Input shape {X.shape} không khớp {self.num_feature} features")
+
+        n_rows = X.shape[0]
+        row_base = (np.arange(n_rows, dtype=np.int64) * self.num_feature)[:, None]
+        X_flat = X.ravel()
+        node = np.broadcast_to(self._roots, (n_rows, self.n_trees)).copy()
+
+        for _ in range(self.max_depth):
+            x = X_flat[row_base + self._feature[node]]
+            go_left = (x < self._threshold[node]) | (np.isnan(x) & self._default_left[node])
+            node = np.where(go_left, self._left[node], self._right[node])
+
+        leaf = self._value[node]
+        margin = np.empty((n_rows, self.n_outputs), dtype=np.float32)
+        for k in range(self.n_outputs):
+            cols = leaf[:, self.tree_group == k]
+            stacked = np.concatenate([np.full((n_rows, 1), self.base_margin[k], dtype=np.float32), cols], axis=1)
+            # add.accumulate cộng tuần tự (không pairwise) -> khớp thứ tự cộng của XGBoost
+            margin[:, k] = np.add.accumulate(stacked, axis=1, dtype=np.float32)[:, -1]
+        return margin
+
+    def predict(self, X) -> np.ndarray:
+        """Output giống Booster.predict: (n,) cho hồi quy/nhị phân, (n, k) cho softprob"""
+        margin = self.predict_margin(X)
+        if self.objective in _IDENTITY_OBJECTIVES:
+            return margin[:, 0]
+        if self.objective in _SIGMOID_OBJECTIVES:
+            return (1.0 / (1.0 + np.exp(-margin[:, 0]))).astype(np.float32)
+
+        shifted = margin - margin.max(axis=1, keepdims=True)
+        prob = np.exp(shifted)
+        prob /= prob.sum(axis=1, keepdims=True)
+        if self.objective == "multi:softmax":
+            return np.argmax(prob, axis=1).astype(np.float32)
+        return prob.astype(np.float32)
+
+
+def compile_booster(booster, reference_predict, n_features: int, label: str = "model") -> Optional[CompiledTreeEnsemble]:
+    """
+    Biên dịch booster và kiểm tra parity với runtime gốc trên dữ liệu tổng hợp.
+    reference_predict(X float32) -> output của runtime gốc.
+    Trả về None (giữ runtime gốc) nếu không biên dịch được hoặc kết quả lệch.
+    """
+    try:
+        engine = CompiledTreeEnsemble.from_booster(booster)
+    except UnsupportedModelError as e:
+        print(f"ℹ️ [TreeEngine] {label}: {e} -> dùng runtime XGBoost.")
+        return None
+    except Exception as e:
+        print(f"⚠️ [TreeEngine] {label}: lỗi biên dịch ({e}) -> dùng runtime XGBoost.")
+        return None
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(0, 100, size=(256, n_features)).astype(np.float32)
+    X[rng.random(X.shape) < 0.05] = np.nan  # kiểm tra cả nhánh missing value
+    X[:32] = np.round(X[:32])  # giá trị tròn dễ rơi đúng ngưỡng split
+
+    try:
+        expected = np.asarray(reference_predict(X))
+        got = engine.predict(X)
+        if expected.shape != got.shape or not np.allclose(got, expected, rtol=1e-5, atol=1e-5, equal_nan=True):
+            print(f"⚠️ [TreeEngine] {label}: kết quả lệch runtime gốc -> dùng runtime XGBoost.")
+            return None
+    except Exception as e:
+        print(f"⚠️ [TreeEngine] {label}: lỗi khi kiểm tra parity ({e}) -> dùng runtime XGBoost.")
+        return None
+
+    print(f"✅ [TreeEngine] {label}: đã biên dịch {engine.n_trees} cây (depth {engine.max_depth}).")
+    return engine
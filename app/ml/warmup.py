@@ -0,0 +1,108 @@
+import threading
+import time
+
+import numpy as np
+
+from app.core.config import WARMUP_BATCH_SIZES, WARMUP_ITERATIONS
+from app.core.metrics import register_metrics
+from app.ml.registry import registry
+
+# Import để các predictor tự đăng ký với registry
+from app.ml import predictor as _safety  # noqa: F401
+from app.ml import predictor_hazard as _hazard  # noqa: F401
+
+# Trạng thái warm-up của process: pending -> warming -> ready
+_state = {"status": "pending", "started_at": None, "finished_at": None, "models": {}}
+_lock = threading.Lock()
+
+
+def _n_features(model) -> int:
+    plan = getattr(model, "_feature_plan", None) or getattr(model, "features", None)
+    return len(plan) if plan else 0
+
+
+def _benchmark(model, batch_sizes, iterations: int) -> dict:
+    """Chạy model trên batch tổng hợp, đo p50/p99 (ms) cho từng kích thước batch"""
+    n_features = _n_features(model)
+    if n_features == 0:
+        raise RuntimeError("Model không có danh sách feature")
+
+    rng = np.random.default_rng(0)
+    latencies = {}
+    for batch_size in batch_sizes:
+        X = rng.normal(0, 50, size=(batch_size, n_features)).astype(np.float32)
+        model.run_model(X)  # lần đầu: khởi tạo lazy bên trong runtime, không tính
+
+        samples = []
+        for _ in range(iterations):
+            t0 = time.perf_counter()
+            model.run_model(X)
+            samples.append((time.perf_counter() - t0) * 1000)
+
+        latencies[str(batch_size)] = {
+            "p50_ms": round(float(np.percentile(samples, 50)), 3),
+            "p99_ms": round(float(np.percentile(samples, 99)), 3),
+        }
+    return latencies
+
+
+def run_warmup(batch_sizes=None, iterations: int = WARMUP_ITERATIONS) -> dict:
+    """
+    Load + chạy thử mọi model đã đăng ký với registry.
+    Model không load được (thiếu file...) được ghi là "unavailable" và không chặn readiness:
+    các endpoint của model đó đã tự trả lỗi "chưa sẵn sàng".
+    """
+    batch_sizes = batch_sizes or WARMUP_BATCH_SIZES
+    with _lock:
+        _state.update(status="warming", started_at=time.time(), finished_at=None, models={})
+
+    for name in registry.model_names():
+        try:
+            model = registry.model(name)
+            if not getattr(model, "model", None):
+                raise RuntimeError("Model chưa được load")
+        except Exception as e:
+            result = {"status": "unavailable", "error": str(e)}
+        else:
+            try:
+                result = {
+                    "status": "ready",
+                    "version": getattr(model, "model_version", ""),
+                    "latency": _benchmark(model, batch_sizes, iterations),
+                }
+            except Exception as e:
+                result = {"status": "failed", "error": str(e)}
+
+        with _lock:
+            _state["models"][name] = result
+        print(f"🔥 [Warmup] {name}: {result.get('latency', result.get('error'))}")
+
+    with _lock:
+        failed = [n for n, r in _state["models"].items() if r["status"] == "failed"]
+        _state["status"] = "failed" if failed else "ready"
+        _state["finished_at"] = time.time()
+        return _snapshot()
+
+
+def start_warmup() -> threading.Thread:
+    """Warm-up trong thread nền để server vẫn nhận health check trong lúc chờ"""
+    thread = threading.Thread(target=run_warmup, name="model-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def _snapshot() -> dict:
+    return {**_state, "models": {k: dict(v) for k, v in _state["models"].items()}}
+
+
+def warmup_status() -> dict:
+    with _lock:
+        return _snapshot()
+
+
+def is_ready() -> bool:
+    with _lock:
+        return _state["status"] == "ready"
+
+
+register_metrics("warmup", warmup_status)
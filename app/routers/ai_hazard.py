@@ -1,17 +1,35 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from typing import Optional
-from app.ml.predictor_hazard import HazardPredictor
-from app.core.database import fetch_latest_weather_data # Hàm lấy dữ liệu thật
+from typing import List, Optional
+from app.ml.predictor_hazard import get_hazard_predictor
+from app.core.async_database import fetch_latest_weather_data_async, fetch_latest_weather_data_many # Hàm lấy dữ liệu thật (async)
+from app.ml.schemas import MAX_BATCH_ITEMS
+from app.ml.batcher import MicroBatcher
+from app.core.executors import run_io, ExecutorBusyError
 
 router = APIRouter()
 
-# Khởi tạo model một lần duy nhất
+# Load sẵn model dùng chung từ registry (cả process chỉ load 1 lần)
 try:
-    model = HazardPredictor()
+    get_hazard_predictor()
 except Exception as e:
     print(f"⚠️ Model init failed: {e}")
-    model = None
+
+def _current_model():
+    """Model đang phục vụ (có thể đã được hot-swap sang version mới), None nếu chưa load được"""
+    try:
+        model = get_hazard_predictor()
+    except Exception:
+        return None
+    return model if model.model else None
+
+def _predict_versioned(items):
+    # Chốt 1 model cho cả batch để version trả về khớp đúng model đã chạy
+    current = get_hazard_predictor()
+    return [(label, current.model_version) for label in current.predict_many(items)]
+
+# Gom các request /predict đồng thời thành 1 lần gọi model
+hazard_batcher = MicroBatcher("hazard", _predict_versioned)
 
 # --- Input: Chỉ cần tọa độ ---
 class LocationReq(BaseModel):
@@ -23,6 +41,15 @@ class HazardResponse(BaseModel):
     overall_hazard: str # Kết quả dự báo (Storm, Rain...)
     confidence: str     # Độ tin cậy (High/Medium...)
     real_data_used: Optional[dict] = None # Trả về dữ liệu thật đã dùng để debug
+    model_version: Optional[str] = None # Version model đã dùng để dự báo
+
+# --- Batch: nhiều toạ độ trong 1 request ---
+class LocationBatchReq(BaseModel):
+    locations: List[LocationReq]
+
+class HazardBatchResponse(BaseModel):
+    count: int
+    results: List[HazardResponse]
 
 @router.post("/predict", response_model=HazardResponse)
 async def predict_hazard(req: LocationReq):
@@ -31,11 +58,14 @@ async def predict_hazard(req: LocationReq):
     2. Lấy dữ liệu thời tiết MỚI NHẤT từ Database (bảng events).
     3. Đưa vào Model XGBoost để dự đoán.
     """
-    if not model:
+    if not _current_model():
         raise HTTPException(status_code=500, detail="AI Model chưa được tải.")
 
-    # BƯỚC 1: Lấy dữ liệu thật từ DB
-    db_data = fetch_latest_weather_data(req.lat, req.lon)
+    # BƯỚC 1: Lấy dữ liệu thật từ DB (async, không chặn event loop)
+    try:
+        db_data = await fetch_latest_weather_data_async(req.lat, req.lon)
+    except ExecutorBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     
     if not db_data:
         # Nếu chưa có dữ liệu trong DB (vùng này chưa được Data Collector quét)
@@ -49,15 +79,55 @@ async def predict_hazard(req: LocationReq):
         # BƯỚC 2: Gọi Model dự đoán
         # db_data chính là raw_data từ DB, chứa: temperature, humidity, wind_speed...
         # Class HazardPredictor sẽ tự lọc các trường cần thiết.
-        prediction = model.predict_overall_hazard(db_data)
+        prediction, model_version = await hazard_batcher.submit(db_data)
         
         # BƯỚC 3: Trả về kết quả
         return HazardResponse(
             overall_hazard=prediction, 
             confidence="High", # Model XGBoost thường có độ tin cậy cao nếu có data
-            real_data_used=db_data # Show dữ liệu thật cho Frontend biết
+            real_data_used=db_data, # Show dữ liệu thật cho Frontend biết
+            model_version=model_version
         )
 
+    except ExecutorBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         print(f"Prediction Error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/predict-batch", response_model=HazardBatchResponse)
+async def predict_hazard_batch(req: LocationBatchReq):
+    """
+    Giống /predict nhưng cho nhiều toạ độ:
+    lấy dữ liệu DB cho từng điểm rồi chạy Model 1 lần cho cả batch.
+    """
+    model = _current_model()
+    if not model:
+        raise HTTPException(status_code=500, detail="AI Model chưa được tải.")
+    if len(req.locations) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Tối đa {MAX_BATCH_ITEMS} toạ độ mỗi request")
+
+    try:
+        # Các truy vấn chạy đồng thời trên pool async thay vì lần lượt
+        db_rows = await fetch_latest_weather_data_many([(loc.lat, loc.lon) for loc in req.locations])
+    except ExecutorBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    with_data = [row for row in db_rows if row]
+
+    try:
+        predictions = iter(await run_io(model.predict_many, with_data))
+    except Exception as e:
+        print(f"Prediction Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    results = []
+    for row in db_rows:
+        if not row:
+            results.append(HazardResponse(overall_hazard="Unknown", confidence="Low (No Data)", real_data_used={}))
+        else:
+            results.append(HazardResponse(
+                overall_hazard=next(predictions), confidence="High", real_data_used=row,
+                model_version=model.model_version
+            ))
+
+    return HazardBatchResponse(count=len(results), results=results)
@@ -1,32 +1,77 @@
 from fastapi import APIRouter, HTTPException
 # Import Schema và Predictor chúng ta đã sửa ở bước trước
-from app.ml.predictor import SafetyPredictor
-from app.ml.schemas import SafetyInput # Hoặc .schemas nếu bạn đặt tên đó
+from app.ml.predictor import get_safety_predictor
+from app.ml.schemas import SafetyInput, SafetyBatchInput, MAX_BATCH_ITEMS # Hoặc .schemas nếu bạn đặt tên đó
+from app.ml.batcher import MicroBatcher
+from app.core.executors import ExecutorBusyError
 
 router = APIRouter()
 
-# Khởi tạo model 1 lần duy nhất để dùng chung
+# Load sẵn model dùng chung từ registry (cả process chỉ load 1 lần)
 try:
-    predictor = SafetyPredictor()
+    get_safety_predictor()
 except Exception as e:
     print(f"❌ [AIRouter] Lỗi load AI Model: {e}")
-    predictor = None
+
+def _current_predictor():
+    """Predictor đang phục vụ (có thể đã được hot-swap sang version mới), None nếu chưa load được"""
+    try:
+        return get_safety_predictor()
+    except Exception:
+        return None
+
+def _predict_versioned(items):
+    # Chốt 1 predictor cho cả batch để version trả về khớp đúng model đã chạy
+    current = get_safety_predictor()
+    return [(result, current.model_version) for result in current.predict_many(items)]
+
+# Gom các request /predict đồng thời thành 1 lần gọi model
+safety_batcher = MicroBatcher("safety", _predict_versioned)
 
 @router.post("/predict")
-def predict_safety_score(data: SafetyInput):
+async def predict_safety_score(data: SafetyInput):
     """
     API nhận thông tin thời tiết -> Trả về điểm an toàn (0-100) và mức độ rủi ro.
     """
-    if not predictor:
+    if not _current_predictor():
         raise HTTPException(status_code=500, detail="AI Model chưa sẵn sàng")
     
     try:
-        # Gọi hàm predict từ class SafetyPredictor
-        result = predictor.predict(data)
+        # Gọi model qua micro-batcher (chạy trong io pool, không chặn event loop)
+        result, model_version = await safety_batcher.submit(data)
         return {
             "success": True,
             "data": result,
+            "model_version": model_version,
             "input_summary": f"{data.location} (Temp: {data.temperature})"
         }
+    except ExecutorBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Lỗi dự đoán: {str(e)}")
+
+@router.post("/predict-batch")
+def predict_safety_score_batch(data: SafetyBatchInput):
+    """
+    API batch: nhận nhiều bản ghi thời tiết -> Trả về điểm an toàn cho từng bản ghi
+    (chạy model 1 lần cho cả batch thay vì gọi /predict nhiều lần).
+    """
+    predictor = _current_predictor()
+    if not predictor:
+        raise HTTPException(status_code=500, detail="AI Model chưa sẵn sàng")
+    if len(data.items) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Tối đa {MAX_BATCH_ITEMS} bản ghi mỗi request")
+
+    try:
+        results = predictor.predict_many(data.items)
+        return {
+            "success": True,
+            "count": len(results),
+            "model_version": predictor.model_version,
+            "data": [
+                {"location": item.location, **result}
+                for item, result in zip(data.items, results)
+            ]
+        }
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Lỗi dự đoán: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=f"Lỗi dự đoán: {str(e)}")
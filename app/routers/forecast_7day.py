@@ -10,10 +10,15 @@ import time
 # Import function từ predict module
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 try:
-    from predict.seven_days_predict import generate_forecast_for_location
+    from predict.seven_days_predict import generate_forecast_for_location, generate_forecast_for_locations
 except ImportError as e:
     print(f"Warning: Could not import forecast generator: {e}")
     generate_forecast_for_location = None
+    generate_forecast_for_locations = None
+
+from app.core.config import OPEN_METEO_BATCH_SIZE, FORECAST_BATCH_MAX_LATENCY_MS
+from app.core.executors import ExecutorBusyError, io_executor
+from app.ml.batcher import MicroBatcher
 
 router = APIRouter()
 
@@ -23,6 +28,16 @@ _forecast_cache = {}
 # TTL in seconds
 _FORECAST_CACHE_TTL = 600
 
+# Các request dự báo đồng thời (nhiều toạ độ) được gộp thành 1 lần gọi Open-Meteo nhiều toạ độ
+# Batch chạy trong io pool: pool đầy -> ExecutorBusyError -> 503
+forecast_batcher = MicroBatcher(
+    "forecast_7day",
+    lambda points: generate_forecast_for_locations(points),
+    max_batch_size=OPEN_METEO_BATCH_SIZE,
+    max_latency_ms=FORECAST_BATCH_MAX_LATENCY_MS,
+    executor=io_executor,
+)
+
 # Đường dẫn tới file dữ liệu dự đoán 7 ngày (fallback)
 FORECAST_DATA_PATH = os.path.join(
     os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
@@ -95,7 +110,10 @@ async def get_7day_forecast(
                 print("🔁 Using cached forecast")
                 df = cached[1]
             else:
-                df = generate_forecast_for_location(lat, lon)
+                # Gom với các request đồng thời khác -> 1 request Open-Meteo nhiều toạ độ (chạy ngoài event loop)
+                df = await forecast_batcher.submit((float(lat), float(lon)))
+                if df is None:
+                    raise HTTPException(status_code=502, detail="Không lấy được dữ liệu dự báo từ Open-Meteo")
                 try:
                     _forecast_cache[key] = (now_ts, df)
                 except Exception:
@@ -141,6 +159,10 @@ async def get_7day_forecast(
             }
         )
     
+    except HTTPException:
+        raise
+    except ExecutorBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except FileNotFoundError as e:
         raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
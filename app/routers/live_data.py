@@ -1,9 +1,12 @@
 from fastapi import APIRouter
 from pydantic import BaseModel
 import requests
-import random  # <--- Import thư viện random
-from app.core.database import get_active_risks
-from app.core.config import OWM_API_KEYS_LIST # <--- Import danh sách Key
+from app.core.api_keys import owm_keys # <--- Chia key OWM theo quota
+from app.core.async_database import get_active_risks_async
+from app.core.executors import run_io
+from app.core.http_cache import MISS, http_cache
+
+OWM_URL = "https://api.openweathermap.org/data/2.5/weather"
 
 router = APIRouter()
 
@@ -15,21 +18,33 @@ class UserLocationReq(BaseModel):
 async def get_live_data(data: UserLocationReq):
     """
     Trả về dữ liệu tổng hợp:
-    1. Thời tiết Live (Dùng Random Key để tránh lỗi 429 Too Many Requests).
+    1. Thời tiết Live (key OWM xoay vòng theo quota, key bị 429/401 được cho nghỉ).
     2. Cảnh báo thiên tai từ DB.
     """
     
     # 1. Gọi OWM API (Live Weather)
     weather_info = {}
     try:
-        # --- LOGIC MỚI: Chọn ngẫu nhiên 1 key ---
-        current_api_key = random.choice(OWM_API_KEYS_LIST)
-        
-        url = f"https://api.openweathermap.org/data/2.5/weather?lat={data.lat}&lon={data.lon}&appid={current_api_key}&units=metric&lang=vi"
-        
-        resp = requests.get(url, timeout=5)
-        if resp.status_code == 200:
-            d = resp.json()
+        # lang=vi: "desc" trả cho người dùng là tiếng Việt -> entry cache tách riêng với collector (lang=en)
+        params = {"lat": data.lat, "lon": data.lon, "units": "metric", "lang": "vi"}
+        # Điểm gần đó vừa được hỏi (cùng ô lưới, trong TTL) -> dùng lại, không tốn quota OWM
+        d = await run_io(http_cache.get, OWM_URL, params)
+        if d is MISS:
+            d = None
+            # Không chờ quota trong request của người dùng: hết key thì bỏ qua phần live
+            current_api_key = owm_keys.try_acquire()
+            if current_api_key is None:
+                raise RuntimeError("Mọi key OWM đã hết quota")
+
+            resp = await run_io(requests.get, OWM_URL, params={**params, "appid": current_api_key}, timeout=5)
+            owm_keys.report(current_api_key, resp.status_code, resp.headers.get("Retry-After"))
+            if resp.status_code == 200:
+                d = resp.json()
+                await run_io(http_cache.put, OWM_URL, params, d)
+            else:
+                print(f"⚠️ OWM Error {resp.status_code}: {resp.text}")
+
+        if d is not None:
             weather_info = {
                 "temp": d["main"]["temp"],
                 "desc": d["weather"][0]["description"],
@@ -38,14 +53,12 @@ async def get_live_data(data: UserLocationReq):
                 "wind": d["wind"]["speed"],
                 "name": d.get("name", "") # Lấy tên địa điểm từ OWM nếu có
             }
-        else:
-            print(f"⚠️ OWM Error {resp.status_code}: {resp.text}")
             
     except Exception as e:
         print(f"❌ Lỗi kết nối OWM: {e}")
 
-    # 2. Lấy cảnh báo từ DB (Giữ nguyên)
-    alerts = get_active_risks(lat=data.lat, lon=data.lon, radius_km=50)
+    # 2. Lấy cảnh báo từ DB (async, không chặn event loop)
+    alerts = await get_active_risks_async(lat=data.lat, lon=data.lon, radius_km=50)
 
     return {
         "status": "success",
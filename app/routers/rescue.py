@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
-from app.core.rescue_finder import rescue_finder # Import logic từ bước 1
+from app.core.rescue_finder import rescue_finder, find_nearest_station # Import logic từ bước 1
+from app.core.executors import run_cpu, ExecutorBusyError
 import httpx
 
 router = APIRouter(
@@ -20,7 +21,9 @@ async def get_nearest_rescue(location: UserLocation):
     API tìm nơi viện trợ gần nhất dựa trên tọa độ người dùng.
     """
     try:
-        result = rescue_finder.find_nearest_station(
+        # Duyệt toàn bộ danh sách trạm là việc CPU -> chạy ngoài event loop
+        result = await run_cpu(
+            find_nearest_station,
             location.lat, 
             location.lon, 
             location.filter_type
@@ -37,6 +40,8 @@ async def get_nearest_rescue(location: UserLocation):
                 "status": "not_found", 
                 "message": "Không tìm thấy dữ liệu hoặc không có trạm phù hợp"
             }
+    except ExecutorBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
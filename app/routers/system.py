@@ -1,6 +1,13 @@
 # backend/app/routers/system.py
-from fastapi import APIRouter, BackgroundTasks
+from typing import Optional
+from fastapi import APIRouter, BackgroundTasks, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from process_data_integrated import run_processing_pipeline
+from app.core.metrics import collect_metrics
+from app.core.geo_cache import invalidate_event_cache
+from fastapi.responses import JSONResponse
+from app.ml.registry import registry
+from app.ml.warmup import warmup_status, is_ready
 
 router = APIRouter()
 
@@ -9,6 +16,49 @@ async def trigger_ai_processing(background_tasks: BackgroundTasks):
     """
     API để Data Collector gọi sau khi thu thập xong.
     Nó sẽ chạy script xử lý AI dưới nền (Background).
+    Collector ghi DB ở process khác -> xoá cache truy vấn theo toạ độ để request sau đọc dữ liệu mới.
     """
+    invalidate_event_cache()
     background_tasks.add_task(run_processing_pipeline)
-    return {"status": "success", "message": "AI Processing started in background"}
\ No newline at end of file
+    return {"status": "success", "message": "AI Processing started in background"}
+
+@router.get("/metrics")
+async def get_metrics():
+    """
+    Số liệu vận hành trong process hiện tại (micro-batcher, cache, pool...).
+    """
+    return {"status": "success", "metrics": collect_metrics()}
+
+@router.get("/models")
+async def get_models():
+    """
+    Version model đang phục vụ + thông tin các artifact đã load.
+    """
+    return {"status": "success", **registry.status()}
+
+@router.post("/models/reload")
+async def reload_models(model: Optional[str] = None):
+    """
+    Hot-swap model sau khi thay file trong data/models (không cần restart server).
+    - model: "safety" / "hazard"; bỏ trống = reload mọi model có file thay đổi.
+    Model mới được load + chạy thử xong mới thay model cũ; lỗi thì giữ nguyên model cũ.
+    """
+    if model is None:
+        results = await run_in_threadpool(registry.reload_changed)
+        return {"status": "success", "reloaded": results}
+
+    if model not in registry.status()["models"]:
+        raise HTTPException(status_code=404, detail=f"Không có model '{model}'")
+    try:
+        result = await run_in_threadpool(registry.reload, model)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Reload thất bại, giữ model cũ: {e}")
+    return {"status": "success", "reloaded": [result]}
+
+@router.get("/ready")
+async def readiness():
+    """
+    Readiness cho load balancer: 503 cho tới khi mọi model đã được warm-up.
+    Kèm p50/p99 latency đo được lúc warm-up cho từng kích thước batch.
+    """
+    return JSONResponse(status_code=200 if is_ready() else 503, content=warmup_status())
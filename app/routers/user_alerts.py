@@ -4,7 +4,7 @@ from datetime import datetime
 from fastapi import APIRouter, HTTPException, Depends, Header
 from pydantic import BaseModel
 from typing import Optional, List, Dict
-from app.core.database import get_active_risks
+from app.core.async_database import get_active_risks_async
 
 router = APIRouter()
 
@@ -358,7 +358,7 @@ async def check_user_risk_status(data: RiskCheckRequest):
     Frontend sẽ gọi API này thay vì dùng mock data.
     """
     # 1. Gọi hàm DB lấy rủi ro (đã import từ app.core.database)
-    risks = get_active_risks(lat=data.lat, lon=data.lon, radius_km=data.radius_km)
+    risks = await get_active_risks_async(lat=data.lat, lon=data.lon, radius_km=data.radius_km)
     
     alerts = []
     status = "Safe"
@@ -0,0 +1,311 @@
+# async_collector.py
+# Engine thu thập đồng thời cho data_collector: 1 httpx.AsyncClient dùng chung (giữ kết nối),
+# mỗi upstream có giới hạn riêng (số request đồng thời + số request/giây),
+# 4 nguồn của 1 địa điểm được gọi cùng lúc -> thời gian 1 chu kỳ phụ thuộc rate limit của upstream,
+# không còn là (số địa điểm x độ trễ).
+import asyncio
+import random
+import time
+from urllib.parse import urlsplit
+
+# httpx là tuỳ chọn cho collector: không có thì data_collector chạy bản tuần tự (requests)
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from app.core.api_keys import owm_keys
+from app.core.open_meteo import fetch_batched_async
+from app.core.http_cache import MISS, http_cache
+from app.core.config import (
+    COLLECTOR_HOST_LIMITS, COLLECTOR_DEFAULT_HOST_LIMIT,
+    COLLECTOR_HTTP_TIMEOUT, COLLECTOR_MAX_RETRIES,
+)
+from app.worker.earthquake_catalog import earthquake_catalog
+from app.worker.data_collector import (
+    OWM_URL, NOWCAST_URL, FLOOD_URL, USGS_URL, NOWCAST_PARAMS, FLOOD_PARAMS,
+    owm_params, nowcast_params, flood_params, earthquake_params,
+    parse_openmeteo_nowcast, parse_flood_forecast, parse_earthquake_stats,
+    clean_location_record, build_location_records, log, parse_or_default,
+)
+
+# Mã lỗi đáng thử lại (bị throttle / upstream quá tải)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRY_AFTER_SECONDS = 60
+# Chờ tối đa bao lâu cho 1 key OWM còn quota trước khi bỏ qua địa điểm
+OWM_KEY_WAIT_SECONDS = 120
+# Số key khác nhau được thử cho 1 địa điểm khi key bị 429/401
+OWM_KEY_ATTEMPTS = 3
+
+
+def _parse_limit(spec: str):
+    concurrency, _, rate = spec.partition(":")
+    return max(1, int(concurrency)), max(0.0, float(rate or 0))
+
+
+def parse_host_limits(spec: str = COLLECTOR_HOST_LIMITS) -> dict:
+    """"host=4:1,host2=8:0" -> {host: (số request đồng thời, request/giây)}"""
+    limits = {}
+    for item in spec.split(","):
+        host, sep, limit = item.strip().partition("=")
+        if not sep:
+            continue
+        try:
+            limits[host.strip().lower()] = _parse_limit(limit)
+        except ValueError:
+            log(f"⚠️ [Collector] Bỏ qua giới hạn không hợp lệ: '{item}'")
+    return limits
+
+
+class HostLimiter:
+    """
+    Giới hạn cho 1 upstream: semaphore (số request đang bay) + nhịp tối thiểu giữa 2 request (rate).
+    Khi bị 429, cả host bị lùi lại theo Retry-After chứ không chỉ request đó.
+    """
+
+    def __init__(self, host: str, concurrency: int, rate_per_sec: float):
+        self.host = host
+        self.concurrency = concurrency
+        self.rate_per_sec = rate_per_sec
+        self.min_interval = 1.0 / rate_per_sec if rate_per_sec > 0 else 0.0
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._slot_lock = asyncio.Lock()
+        self._next_slot = 0.0
+        self.stats = {"requests": 0, "errors": 0, "throttled": 0, "retries": 0, "wait_ms_total": 0.0, "latency_ms_total": 0.0}
+
+    async def __aenter__(self):
+        started = time.monotonic()
+        await self._semaphore.acquire()
+        async with self._slot_lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.min_interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self.stats["wait_ms_total"] += (time.monotonic() - started) * 1000
+        return self
+
+    async def __aexit__(self, *exc):
+        self._semaphore.release()
+
+    def back_off(self, seconds: float):
+        """Dời lượt request kế tiếp của host ra sau `seconds` giây"""
+        self._next_slot = max(self._next_slot, time.monotonic() + seconds)
+
+    def summary(self) -> dict:
+        n = self.stats["requests"]
+        return {
+            **{k: v for k, v in self.stats.items() if not k.endswith("_total")},
+            "limit": f"{self.concurrency}:{self.rate_per_sec:g}",
+            "avg_wait_ms": round(self.stats["wait_ms_total"] / n, 1) if n else 0.0,
+            "avg_latency_ms": round(self.stats["latency_ms_total"] / n, 1) if n else 0.0,
+        }
+
+
+def _retry_after(resp, attempt: int) -> float:
+    """Số giây chờ trước khi thử lại: theo Retry-After nếu có, không thì backoff lũy thừa + jitter"""
+    value = resp.headers.get("Retry-After") if resp is not None else None
+    if value and value.strip().isdigit():
+        return min(float(value), MAX_RETRY_AFTER_SECONDS)
+    return min(2 ** attempt + random.random(), MAX_RETRY_AFTER_SECONDS)
+
+
+class AsyncCollector:
+    """
+    Dùng: async with AsyncCollector() as c: rows, events = await c.collect(locations)
+    """
+
+    def __init__(self, host_limits: dict = None, timeout: float = COLLECTOR_HTTP_TIMEOUT, max_retries: int = COLLECTOR_MAX_RETRIES):
+        if httpx is None:
+            raise RuntimeError("Chưa cài httpx -> không dùng được engine async")
+        self.host_limits = parse_host_limits() if host_limits is None else host_limits
+        self.default_limit = _parse_limit(COLLECTOR_DEFAULT_HOST_LIMIT)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._limiters = {}
+        self.client = None
+
+    async def __aenter__(self):
+        max_connections = sum(c for c, _ in self.host_limits.values()) + self.default_limit[0]
+        self.client = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            follow_redirects=True,
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+
+    def limiter_for(self, url: str) -> HostLimiter:
+        host = urlsplit(url).hostname or ""
+        limiter = self._limiters.get(host)
+        if limiter is None:
+            concurrency, rate = self.host_limits.get(host, self.default_limit)
+            limiter = self._limiters[host] = HostLimiter(host, concurrency, rate)
+        return limiter
+
+    async def request(self, url: str, params: dict = None, headers: dict = None, retry_statuses=RETRY_STATUSES):
+        """
+        GET qua limiter của host. Thử lại khi gặp mã trong retry_statuses (mặc định 429/5xx) hoặc lỗi mạng;
+        hết lượt thử thì trả response cuối (hoặc raise lỗi mạng cuối).
+        """
+        limiter = self.limiter_for(url)
+        for attempt in range(self.max_retries + 1):
+            resp = None
+            async with limiter:
+                started = time.monotonic()
+                limiter.stats["requests"] += 1
+                try:
+                    resp = await self.client.get(url, params=params, headers=headers)
+                except httpx.HTTPError:
+                    limiter.stats["errors"] += 1
+                    if attempt >= self.max_retries:
+                        raise
+                finally:
+                    limiter.stats["latency_ms_total"] += (time.monotonic() - started) * 1000
+
+            if resp is not None and resp.status_code == 429:
+                limiter.stats["throttled"] += 1
+            if resp is not None and resp.status_code not in retry_statuses:
+                return resp
+            if resp is not None:
+                limiter.stats["errors"] += 1
+                if attempt >= self.max_retries:
+                    return resp
+
+            delay = _retry_after(resp, attempt)
+            if resp is not None and resp.status_code == 429:
+                limiter.back_off(delay)
+            limiter.stats["retries"] += 1
+            await asyncio.sleep(delay)
+
+    # --- Từng nguồn: cùng params/parse với bản đồng bộ trong data_collector ---
+
+    async def fetch_owm(self, lat, lon):
+        """
+        Key lấy từ owm_keys (chờ nếu mọi key đã hết quota -> collector tự chạy theo nhịp quota).
+        429/401 không thử lại cùng key: báo scheduler cho key nghỉ rồi đổi sang key khác.
+        Có trong http_cache thì không tốn lượt key nào.
+        """
+        # SQLite của http_cache chạy trong thread, không chặn event loop
+        cached = await asyncio.to_thread(http_cache.get, OWM_URL, owm_params(lat, lon, None))
+        if cached is not MISS:
+            return cached
+        for _ in range(OWM_KEY_ATTEMPTS):
+            key = await owm_keys.acquire_async(timeout=OWM_KEY_WAIT_SECONDS)
+            if key is None:
+                raise RuntimeError("Mọi key OWM đã hết quota")
+            resp = await self.request(OWM_URL, params=owm_params(lat, lon, key), retry_statuses=RETRY_STATUSES - {429})
+            owm_keys.report(key, resp.status_code, resp.headers.get("Retry-After"))
+            if resp.status_code not in (429, 401):
+                break
+        resp.raise_for_status()
+        data = resp.json()
+        await asyncio.to_thread(http_cache.put, OWM_URL, owm_params(lat, lon, None), data)
+        return data
+
+    async def get_json_cached(self, url: str, params: dict):
+        """GET JSON qua http_cache (chỉ response 200 được cache); lỗi HTTP -> None"""
+        cached = await asyncio.to_thread(http_cache.get, url, params)
+        if cached is not MISS:
+            return cached
+        resp = await self.request(url, params=params)
+        if resp.status_code != 200:
+            return None
+        data = resp.json()
+        await asyncio.to_thread(http_cache.put, url, params, data)
+        return data
+
+    async def fetch_nowcast(self, lat, lon):
+        try:
+            j = await self.get_json_cached(NOWCAST_URL, nowcast_params(lat, lon))
+            if j is None: return {}
+            return parse_openmeteo_nowcast(j)
+        except Exception: return {}
+
+    async def fetch_flood(self, lat, lon):
+        try:
+            return parse_flood_forecast(await self.get_json_cached(FLOOD_URL, flood_params(lat, lon)))
+        except Exception: return None
+
+    async def fetch_earthquake(self, lat, lon):
+        if earthquake_catalog.ready:
+            return earthquake_catalog.stats_for(lat, lon)
+        try:
+            resp = await self.request(USGS_URL, params=earthquake_params(lat, lon))
+            return parse_earthquake_stats(resp.json(), lat, lon)
+        except Exception: return None, None
+
+    async def fetch_nowcast_many(self, points: list) -> list:
+        """Nowcast cho nhiều điểm, gộp toạ độ vào ít request (lỗi thì gọi lẻ)"""
+        payloads = await fetch_batched_async(self.request, NOWCAST_URL, NOWCAST_PARAMS, points)
+        return [parse_or_default(parse_openmeteo_nowcast, payload, {}) for payload in payloads]
+
+    async def fetch_flood_many(self, points: list) -> list:
+        payloads = await fetch_batched_async(self.request, FLOOD_URL, FLOOD_PARAMS, points)
+        return [parse_or_default(parse_flood_forecast, payload, None) for payload in payloads]
+
+    async def collect_location(self, loc: dict, nowcast=None, flood=None):
+        """
+        4 nguồn của 1 địa điểm chạy đồng thời -> (dòng đã làm sạch, mô tả thời tiết) hoặc None nếu OWM lỗi.
+        nowcast/flood: awaitable trả về kết quả đã lấy theo batch; None thì gọi riêng cho điểm này.
+        """
+        lat, lon = loc["lat"], loc["lon"]
+        owm_data, nowcast_data, river_raw, eq_raw = await asyncio.gather(
+            self.fetch_owm(lat, lon),
+            nowcast if nowcast is not None else self.fetch_nowcast(lat, lon),
+            flood if flood is not None else self.fetch_flood(lat, lon),
+            self.fetch_earthquake(lat, lon),
+            return_exceptions=True,
+        )
+        if isinstance(owm_data, BaseException):
+            log(f"❌ Lỗi OWM {loc['name']}: {owm_data}. Bỏ qua."); return None
+        # Nguồn phụ lỗi -> giá trị mặc định giống engine tuần tự (không để exception lọt vào bước làm sạch)
+        if isinstance(nowcast_data, BaseException): nowcast_data = {}
+        if isinstance(river_raw, BaseException): river_raw = None
+        if isinstance(eq_raw, BaseException): eq_raw = (None, None)
+        return clean_location_record(lat, lon, loc["name"], owm_data, nowcast_data, river_raw, eq_raw)
+
+    async def collect(self, locations: list):
+        """Thu thập 1 lượt các địa điểm -> (csv_rows, db_events) (GDACS lấy riêng 1 lần mỗi chu kỳ)"""
+        n_locations = len(locations)
+        done = 0
+        # Open-Meteo (nowcast + lũ) lấy theo batch cho cả danh sách, chạy song song với OWM từng điểm
+        points = [(loc["lat"], loc["lon"]) for loc in locations]
+        nowcast_task = asyncio.ensure_future(self.fetch_nowcast_many(points))
+        flood_task = asyncio.ensure_future(self.fetch_flood_many(points))
+
+        async def pick(task, index):
+            return (await task)[index]
+
+        async def run_one(index, loc):
+            nonlocal done
+            result = await self.collect_location(loc, pick(nowcast_task, index), pick(flood_task, index))
+            done += 1
+            if done % 10 == 0 or done == n_locations:
+                log(f"➡️ Đã xử lý {done}/{n_locations} địa điểm")
+            return result
+
+        results = await asyncio.gather(*(run_one(i, loc) for i, loc in enumerate(locations)))
+
+        csv_rows, db_events = [], []
+        # Gán nhãn cả lượt 1 lần (vector hoá) sau khi đã có dữ liệu mọi địa điểm
+        for flat, db_ev in build_location_records([result for result in results if result]):
+            csv_rows.append(flat)
+            db_events.append(db_ev)
+        return csv_rows, db_events
+
+    def stats(self) -> dict:
+        return {host: limiter.summary() for host, limiter in sorted(self._limiters.items())}
+
+
+async def _collect(locations: list):
+    async with AsyncCollector() as collector:
+        csv_rows, db_events = await collector.collect(locations)
+        return csv_rows, db_events, collector.stats()
+
+
+def run_collection_cycle(locations: list):
+    """Chạy 1 chu kỳ thu thập bằng engine async (gọi từ code đồng bộ) -> (csv_rows, db_events, stats)"""
+    return asyncio.run(_collect(locations))
@@ -0,0 +1,76 @@
+# cycle_checkpoint.py
+# Checkpoint của chu kỳ collector đang chạy: ghi lại địa điểm nào đã thu thập + ghi xong (CSV/DB).
+# Collector chết giữa chu kỳ -> lần chạy sau tiếp tục chu kỳ đó, bỏ qua các địa điểm đã xong
+# thay vì gọi lại upstream từ địa điểm đầu tiên.
+import json
+import os
+import time
+
+from app.core.config import COLLECTOR_CHECKPOINT_PATH
+
+
+def location_key(loc: dict) -> str:
+    return f"{loc['name']}|{loc['lat']}|{loc['lon']}"
+
+
+class CycleCheckpoint:
+    """
+    Dùng: started_at = cp.begin(max_age) -> với mỗi micro-batch đã ghi: cp.mark_done(batch) -> cp.finish().
+    File chỉ tồn tại khi đang có chu kỳ dở dang.
+    """
+
+    def __init__(self, path: str = COLLECTOR_CHECKPOINT_PATH):
+        self.path = path
+        self.started_at = None
+        self.done = set()
+
+    def begin(self, max_age_seconds: float) -> float:
+        """
+        Tiếp tục chu kỳ dở dang nếu nó bắt đầu chưa quá max_age_seconds (dữ liệu còn cùng chu kỳ),
+        không thì mở chu kỳ mới. Trả về thời điểm (epoch) bắt đầu chu kỳ.
+        """
+        self.started_at, self.done = time.time(), set()
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    data = json.load(f)
+                age = time.time() - data["started_at"]
+                if 0 <= age < max_age_seconds:
+                    self.started_at, self.done = data["started_at"], set(data.get("done", []))
+                    print(f"♻️ [Checkpoint] Tiếp tục chu kỳ bắt đầu {age / 60:.1f} phút trước: đã xong {len(self.done)} địa điểm")
+                else:
+                    print(f"ℹ️ [Checkpoint] Bỏ chu kỳ dở dang cũ ({age / 60:.1f} phút) -> chu kỳ mới")
+            except Exception as e:
+                print(f"⚠️ [Checkpoint] Không đọc được checkpoint ({e}) -> chu kỳ mới")
+        self._save()
+        return self.started_at
+
+    def pending(self, locations: list) -> list:
+        """Các địa điểm chưa thu thập trong chu kỳ này (giữ nguyên thứ tự)"""
+        return [loc for loc in locations if location_key(loc) not in self.done]
+
+    def mark_done(self, locations: list):
+        self.done.update(location_key(loc) for loc in locations)
+        self._save()
+
+    def finish(self):
+        """Chu kỳ đã xong -> xoá checkpoint"""
+        self.done = set()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"started_at": self.started_at, "done": sorted(self.done)}, f)
+            os.replace(tmp_path, self.path)  # ghi file tạm rồi đổi tên: không để lại checkpoint dở dang
+        except Exception as e:
+            print(f"⚠️ [Checkpoint] Không ghi được checkpoint: {e}")
+
+
+# Checkpoint của process collector
+cycle_checkpoint = CycleCheckpoint()
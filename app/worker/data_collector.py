@@ -7,7 +7,6 @@ import time
 import random 
 import csv 
 from datetime import datetime, timezone, timedelta
-from xml.etree import ElementTree as ET
 from requests.exceptions import HTTPError
 import math
 import requests
@@ -15,9 +14,22 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(
 # --- Import từ các file khác ---
 from app.core.config import (
     OWM_API_KEYS_LIST, GDACS_URL, HEADERS, 
-    TARGET_LOCATIONS, VIETNAM_BBOX
+    TARGET_LOCATIONS, VIETNAM_BBOX, COLLECTOR_ENGINE,
+    OWM_COLLECTOR_QUOTA_SHARE, COLLECTOR_TICK_MINUTES, COLLECTOR_FLUSH_BATCH_SIZE,
+    COLLECTOR_OUTPUT, COLLECTOR_HISTORY_FORMAT
 )
-from app.core.database import write_events_to_database
+from app.core.api_keys import owm_keys
+from app.core.open_meteo import fetch_batched
+from app.core.http_cache import MISS, http_cache
+from app.core import history_store
+from app.ml.hazard_labels import label_hazards, NOWCAST
+from app.worker.gdacs_feed import gdacs_feed
+from app.worker.cycle_checkpoint import cycle_checkpoint
+from app.worker.refresh_scheduler import refresh_scheduler
+from app.worker.earthquake_catalog import (
+    earthquake_catalog, EARTHQUAKE_RADIUS_KM, EARTHQUAKE_LOOKBACK_DAYS, EARTHQUAKE_MIN_MAG
+)
+from app.core.database import write_events_to_database, maintain_event_store
 def log(msg):
     print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {msg}")
 
@@ -34,92 +46,17 @@ except ImportError:
     from datetime import timezone as _tz
     UTC_TZ = _tz.utc
 
-EARTHQUAKE_RADIUS_KM = 200
-EARTHQUAKE_LOOKBACK_DAYS = 365 * 5
-EARTHQUAKE_MIN_MAG = 3.0
 TC_LOOKBACK_DAYS = 14
 TC_PROXIMITY_KM = 800
 
 # PHẦN 1: LOGIC LÀM SẠCH & GÁN NHÃN (LABELING LOGIC)
 
-RISK_ORDER = {"no": 0, "low": 1, "mid": 2, "mid-high": 3, "high": 4}
-HAZARD_PRIORITY = ["wind", "rain", "storm", "flood", "earthquake"]
-
 def preprocess_value(val, default=-1.0, precision=2):
     """Làm sạch: None -> default, và làm tròn số."""
     if val is None: return default
     try: return round(float(val), precision)
     except (ValueError, TypeError): return default
 
-def label_rain(p6, p24):
-    p6 = max(0, p6); p24 = max(0, p24)
-    if p24 > 80 or p6 > 40: return "high"
-    if p24 > 50 or p6 > 25: return "mid-high"
-    if p24 > 20 or p6 > 10: return "mid"
-    if p24 > 3 or p6 > 1: return "low"
-    return "no"
-
-def label_wind(gust6):
-    gust6 = max(0, gust6)
-    if gust6 > 25: return "high"
-    if gust6 > 18: return "mid-high"
-    if gust6 > 10: return "mid"
-    if gust6 > 5: return "low"
-    return "no"
-
-def label_storm(gust6, p6, p24, wind, pressure, weather_desc):
-    g6 = max(0, gust6); r6 = max(0, p6); r24 = max(0, p24); w = max(0, wind)
-    pres = 1013 if pressure == -1.0 else pressure
-    score = 0
-    
-    if g6 > 25: score += 4
-    elif g6 > 18: score += 3
-    elif g6 > 12: score += 2
-    elif g6 > 8: score += 1
-    
-    if r24 > 80 or r6 > 40: score += 4
-    elif r24 > 50 or r6 > 25: score += 3
-    elif r24 > 20 or r6 > 10: score += 2
-    elif r24 > 3 or r6 > 1: score += 1
-    
-    if pres < 990: score += 4
-    elif pres < 995: score += 3
-    elif pres < 1000: score += 2
-    
-    if "thunderstorm" in str(weather_desc).lower(): score += 2
-    elif "heavy" in str(weather_desc).lower(): score += 1
-
-    if score >= 12: return "high"
-    if score >= 9: return "mid-high"
-    if score >= 6: return "mid"
-    if score >= 3: return "low"
-    return "no"
-
-def label_flood(river):
-    if river == -1.0: return "no"
-    if river > 8000: return "high"
-    if river > 5000: return "mid-high"
-    if river > 2000: return "mid"
-    if river > 500: return "low"
-    return "no"
-
-def label_earthquake(mag, dist):
-    if mag == -1.0 or dist == -1.0: return "no"
-    if mag >= 6.0 and dist <= 150: return "high"
-    if mag >= 5.5 and dist <= 300: return "mid-high"
-    if mag >= 5.0 and dist <= 500: return "mid"
-    if mag >= 4.5 and dist <= 800: return "low"
-    return "no"
-
-def overall_hazard_prediction(flood, storm, rain, wind, eq):
-    risks = {"flood": flood, "storm": storm, "rain": rain, "wind": wind, "earthquake": eq}
-    best = "no"; best_score = 0
-    for hz in HAZARD_PRIORITY:
-        lv = risks[hz]; score = RISK_ORDER[lv]
-        if score >= 2: best = hz; best_score = score
-    if best_score < 2: return "No"
-    return best.capitalize()
-
 # PHẦN 2: CÁC HÀM API & HELPER
 
 def load_locations_from_csv(filename="location.csv"):
@@ -163,6 +100,23 @@ def save_to_flat_csv(flat_data_list, filename="vietnam_weather_nowcast.csv"):
         log(f"✅ [CSV] Đã lưu {len(flat_data_list)} dòng vào '{filename}'.")
     except Exception as e: log(f"❌ [CSV] Lỗi: {e}")
 
+def columnar_output_enabled():
+    return any(fmt in ("parquet", "arrow") for fmt in COLLECTOR_OUTPUT)
+
+def save_collected_rows(flat_data_list, filename):
+    """Ghi 1 micro-batch theo COLLECTOR_OUTPUT: CSV và/hoặc lịch sử dạng cột chia partition theo ngày"""
+    columnar = columnar_output_enabled()
+    if columnar and not history_store.available():
+        log("⚠️ [History] Chưa cài pyarrow -> chỉ ghi CSV.")
+        columnar = False
+    if "csv" in COLLECTOR_OUTPUT or not columnar:
+        save_to_flat_csv(flat_data_list, filename)
+    if columnar and flat_data_list:
+        try:
+            n = history_store.write_history(flat_data_list)
+            log(f"✅ [History] Đã lưu {n} dòng ({COLLECTOR_HISTORY_FORMAT}) vào '{history_store.COLLECTOR_HISTORY_DIR}'.")
+        except Exception as e: log(f"❌ [History] Lỗi: {e}")
+
 def haversine_km(lat1, lon1, lat2, lon2):
     R = 6371.0; phi1, phi2 = math.radians(lat1), math.radians(lat2); dphi = math.radians(lat2 - lat1); dlambda = math.radians(lon2 - lon1); a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2; return 2 * R * math.asin(math.sqrt(a))
 def is_in_vietnam(lat, lon):
@@ -171,70 +125,131 @@ def is_in_vietnam(lat, lon):
            (VIETNAM_BBOX["min_lon"] <= lon <= VIETNAM_BBOX["max_lon"])
 
 # --- API CALLS ---
+# Mỗi nguồn tách thành: params (dựng query) -> gọi HTTP -> parse (JSON/XML -> giá trị đã gọn).
+# Bản đồng bộ (requests) bên dưới và engine async (async_collector.py) dùng chung params/parse.
+OWM_URL = "https://api.openweathermap.org/data/2.5/weather"
+NOWCAST_URL = "https://api.open-meteo.com/v1/forecast"
+FLOOD_URL = "https://flood-api.open-meteo.com/v1/flood"
+USGS_URL = "https://earthquake.usgs.gov/fdsnws/event/1/query"
+
+def owm_params(lat, lon, api_key):
+    return {"lat": lat, "lon": lon, "appid": api_key, "units": "metric", "lang": "en"}
+
+NOWCAST_PARAMS = {"hourly": "pressure_msl,wind_gusts_10m,precipitation", "wind_speed_unit": "ms", "past_hours": 6, "forecast_hours": 24, "timeformat": "iso8601", "timezone": "UTC"}
+FLOOD_PARAMS = {"daily": "river_discharge_max", "forecast_days": 10}
+
+def nowcast_params(lat, lon):
+    return {"latitude": lat, "longitude": lon, **NOWCAST_PARAMS}
+
+def parse_openmeteo_nowcast(j):
+    if "hourly" not in j: return {}
+    H = j["hourly"]; tarr = H.get("time", []); gust = H.get("wind_gusts_10m", []); precip = H.get("precipitation", []); n = len(tarr);
+    if n == 0: return {}
+    now = datetime.now(UTC_TZ);
+    def _to_utc(dtstr): dt = datetime.fromisoformat(dtstr); return dt.replace(tzinfo=UTC_TZ) if dt.tzinfo is None else dt
+    times = [_to_utc(t) for t in tarr]; idx_now = max((i for i, t in enumerate(times) if t <= now), default=n-1);
+    def _safe_next_slice(i0, step): a, b = i0 + 1, min(i0 + 1 + step, n); return slice(a, b) if a < b else slice(0, 0)
+    next6, next24 = _safe_next_slice(idx_now, 6), _safe_next_slice(idx_now, 24);
+    return {"gust6": max([x for x in gust[next6] if x is not None], default=None), "p6": sum([x for x in precip[next6] if x is not None], start=0.0) if next6.start < next6.stop else None, "p24": sum([x for x in precip[next24] if x is not None], start=0.0) if next24.start < next24.stop else None}
+
+def get_json_cached(url, params, timeout):
+    """GET JSON qua http_cache: chỉ gọi upstream khi cache không có, chỉ cache response 200"""
+    j = http_cache.get(url, params)
+    if j is not MISS: return j
+    r = requests.get(url, params=params, timeout=timeout)
+    if r.status_code != 200: return None
+    j = r.json(); http_cache.put(url, params, j)
+    return j
+
 def get_openmeteo_nowcast(lat, lon):
-    base = "https://api.open-meteo.com/v1/forecast"; params = {"latitude": lat, "longitude": lon, "hourly": "pressure_msl,wind_gusts_10m,precipitation", "wind_speed_unit": "ms", "past_hours": 6, "forecast_hours": 24, "timeformat": "iso8601", "timezone": "UTC"};
     try:
-        r = requests.get(base, params=params, timeout=25); j = r.json();
-        if r.status_code != 200 or "hourly" not in j: return {}
-        H = j["hourly"]; tarr = H.get("time", []); gust = H.get("wind_gusts_10m", []); precip = H.get("precipitation", []); n = len(tarr);
-        if n == 0: return {}
-        now = datetime.now(UTC_TZ);
-        def _to_utc(dtstr): dt = datetime.fromisoformat(dtstr); return dt.replace(tzinfo=UTC_TZ) if dt.tzinfo is None else dt
-        times = [_to_utc(t) for t in tarr]; idx_now = max((i for i, t in enumerate(times) if t <= now), default=n-1);
-        def _safe_next_slice(i0, step): a, b = i0 + 1, min(i0 + 1 + step, n); return slice(a, b) if a < b else slice(0, 0)
-        next6, next24 = _safe_next_slice(idx_now, 6), _safe_next_slice(idx_now, 24);
-        return {"gust6": max([x for x in gust[next6] if x is not None], default=None), "p6": sum([x for x in precip[next6] if x is not None], start=0.0) if next6.start < next6.stop else None, "p24": sum([x for x in precip[next24] if x is not None], start=0.0) if next24.start < next24.stop else None}
+        j = get_json_cached(NOWCAST_URL, nowcast_params(lat, lon), 25)
+        if j is None: return {}
+        return parse_openmeteo_nowcast(j)
     except Exception: return {}
 
+def flood_params(lat, lon):
+    return {"latitude": lat, "longitude": lon, **FLOOD_PARAMS}
+
+def parse_flood_forecast(j):
+    arr = j.get("daily", {}).get("river_discharge_max", [])
+    return max([x for x in arr if x is not None], default=None)
+
 def get_flood_forecast(lat, lon):
-    base = "https://flood-api.open-meteo.com/v1/flood"; params = {"latitude": lat, "longitude": lon, "daily": "river_discharge_max", "forecast_days": 10};
     try:
-        r = requests.get(base, params=params, timeout=25); j = r.json();
-        arr = j.get("daily", {}).get("river_discharge_max", [])
-        return max([x for x in arr if x is not None], default=None)
+        return parse_flood_forecast(get_json_cached(FLOOD_URL, flood_params(lat, lon), 25))
     except Exception: return None
 
-def get_earthquake_stats(lat, lon):
+def parse_or_default(parse, payload, default):
+    if not payload: return default
+    try: return parse(payload)
+    except Exception: return default
+
+def get_openmeteo_many(locations):
+    """Nowcast + lũ cho mọi địa điểm, gộp nhiều toạ độ vào 1 request -> list (nowcast_data, river_raw)"""
+    points = [(loc['lat'], loc['lon']) for loc in locations]
+    nowcasts = fetch_batched(NOWCAST_URL, NOWCAST_PARAMS, points)
+    floods = fetch_batched(FLOOD_URL, FLOOD_PARAMS, points)
+    return [
+        (parse_or_default(parse_openmeteo_nowcast, nc, {}), parse_or_default(parse_flood_forecast, fl, None))
+        for nc, fl in zip(nowcasts, floods)
+    ]
+
+def earthquake_params(lat, lon):
     end_dt = datetime.now(UTC_TZ); start_dt = end_dt - timedelta(days=EARTHQUAKE_LOOKBACK_DAYS); 
-    params = {"format": "geojson", "latitude": lat, "longitude": lon, "maxradiuskm": EARTHQUAKE_RADIUS_KM, "starttime": start_dt.strftime("%Y-%m-%d"), "endtime": end_dt.strftime("%Y-%m-%d"), "minmagnitude": EARTHQUAKE_MIN_MAG, "limit": 20000};
+    return {"format": "geojson", "latitude": lat, "longitude": lon, "maxradiuskm": EARTHQUAKE_RADIUS_KM, "starttime": start_dt.strftime("%Y-%m-%d"), "endtime": end_dt.strftime("%Y-%m-%d"), "minmagnitude": EARTHQUAKE_MIN_MAG, "limit": 20000}
+
+def parse_earthquake_stats(j, lat, lon):
+    feats = j.get("features", []); 
+    if not feats: return None, None
+    recent = max(feats, key=lambda f: f["properties"].get("time", 0)); 
+    min_dist = min([haversine_km(lat, lon, f["geometry"]["coordinates"][1], f["geometry"]["coordinates"][0]) for f in feats])
+    return recent["properties"].get("mag"), min_dist
+
+def get_earthquake_stats(lat, lon):
+    """Hỏi USGS riêng cho 1 địa điểm (chỉ dùng khi catalog vùng chưa tải được)"""
     try:
-        r = requests.get("https://earthquake.usgs.gov/fdsnws/event/1/query", params=params, timeout=30); j = r.json();
-        feats = j.get("features", []); 
-        if not feats: return None, None
-        recent = max(feats, key=lambda f: f["properties"].get("time", 0)); 
-        min_dist = min([haversine_km(lat, lon, f["geometry"]["coordinates"][1], f["geometry"]["coordinates"][0]) for f in feats])
-        return recent["properties"].get("mag"), min_dist
+        r = requests.get(USGS_URL, params=earthquake_params(lat, lon), timeout=30)
+        return parse_earthquake_stats(r.json(), lat, lon)
     except Exception: return None, None
 
 def fetch_disaster_data():
+    """Chỉ các item GDACS mới trong lãnh thổ VN; feed không đổi -> 304, không tải/parse lại"""
     try:
-        resp = requests.get(GDACS_URL, headers=HEADERS, timeout=10); resp.raise_for_status(); xml_content = resp.content.decode('utf-8-sig'); root = ET.fromstring(xml_content); namespaces = {'geo': 'http://www.w3.org/2003/01/geo/wgs84_pos#'}; relevant_events = [];
-        for item in root.findall(".//item", namespaces):
-            title = item.find("title").text if item.find("title") is not None else ""; lat, lon = None, None; geo_point = item.find("geo:Point", namespaces);
-            if geo_point is not None: 
-                lat = float(geo_point.find("geo:lat", namespaces).text)
-                lon = float(geo_point.find("geo:lon", namespaces).text)
-            if is_in_vietnam(lat, lon):
-                relevant_events.append({"source": "gdacs_rss", "event_type": "disaster", "title": title, "description": item.find("description").text, "event_time": None, "lat": lat, "lon": lon, "raw_data": {}})
-        return relevant_events
+        with requests.get(GDACS_URL, headers=gdacs_feed.request_headers(HEADERS), timeout=10, stream=True) as resp:
+            if resp.status_code != 304: resp.raise_for_status()
+            return gdacs_feed.ingest(resp.status_code, resp.headers, resp.iter_content(chunk_size=64 * 1024), is_in_vietnam)
     except Exception: return []
 
 # =========================================================
 # PHẦN 3: XỬ LÝ & ĐÓNG GÓI DỮ LIỆU
 # =========================================================
-def process_single_location(lat, lon, location_name):
+def process_single_location(lat, lon, location_name, prefetched=None):
+    """prefetched: (nowcast_data, river_raw) đã lấy theo batch; None thì gọi API riêng cho điểm này"""
     # 1. EXTRACT (Thu thập)
-    current_key = random.choice(OWM_API_KEYS_LIST)
-    try:
-        owm_url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={current_key}&units=metric&lang=en"
-        resp = requests.get(owm_url, timeout=10); resp.raise_for_status(); owm_data = resp.json()
-    except Exception as e: 
-        log(f"❌ Lỗi OWM {location_name}: {e}. Bỏ qua."); return None
-
-    nowcast_data = get_openmeteo_nowcast(lat, lon)
-    river_raw = get_flood_forecast(lat, lon)
-    eq_raw = get_earthquake_stats(lat, lon)
-
+    owm_data = http_cache.get(OWM_URL, owm_params(lat, lon, None)) # Key cache không chứa appid
+    if owm_data is MISS:
+        current_key = owm_keys.acquire(timeout=120) # Chờ tới khi có key còn quota
+        if current_key is None:
+            log(f"❌ Hết quota OWM, bỏ qua {location_name}."); return None
+        try:
+            resp = requests.get(OWM_URL, params=owm_params(lat, lon, current_key), timeout=10)
+            owm_keys.report(current_key, resp.status_code, resp.headers.get("Retry-After"))
+            resp.raise_for_status(); owm_data = resp.json()
+            http_cache.put(OWM_URL, owm_params(lat, lon, None), owm_data)
+        except Exception as e: 
+            log(f"❌ Lỗi OWM {location_name}: {e}. Bỏ qua."); return None
+
+    if prefetched is None:
+        nowcast_data = get_openmeteo_nowcast(lat, lon)
+        river_raw = get_flood_forecast(lat, lon)
+    else:
+        nowcast_data, river_raw = prefetched
+    eq_raw = earthquake_catalog.stats_for(lat, lon) if earthquake_catalog.ready else get_earthquake_stats(lat, lon)
+    return clean_location_record(lat, lon, location_name, owm_data, nowcast_data, river_raw, eq_raw)
+
+def clean_location_record(lat, lon, location_name, owm_data, nowcast_data, river_raw, eq_raw):
+    """Dữ liệu thô của 4 nguồn -> (dòng CSV phẳng chưa gán nhãn, mô tả thời tiết OWM)"""
     # 2. TRANSFORM (Làm sạch)
     temp = preprocess_value(owm_data.get("main", {}).get("temp"), -99.0, 1)
     hum = preprocess_value(owm_data.get("main", {}).get("humidity"), -1.0, 0)
@@ -250,16 +265,6 @@ def process_single_location(lat, lon, location_name):
     eq_mag = preprocess_value(eq_raw[0] if eq_raw else None, -1.0)
     eq_dist = preprocess_value(eq_raw[1] if eq_raw else None, -1.0)
 
-    # 3. LABELING (Gán nhãn)
-    rain_lb = label_rain(p6, p24)
-    wind_lb = label_wind(gust6)
-    storm_lb = label_storm(gust6, p6, p24, wind, pres, weather_desc)
-    flood_lb = label_flood(river)
-    eq_lb = label_earthquake(eq_mag, eq_dist)
-    overall_lb = overall_hazard_prediction(flood_lb, storm_lb, rain_lb, wind_lb, eq_lb)
-
-    # 4. LOAD (Đóng gói Dictionary)
-    
     # Lấy thời gian hiện tại dạng string đẹp (ISO format hoặc 'YYYY-MM-DD HH:MM:SS')
     current_time_str = datetime.now(UTC_TZ).strftime('%Y-%m-%d %H:%M:%S')
 
@@ -270,20 +275,110 @@ def process_single_location(lat, lon, location_name):
         "precip6": p6, "precip24": p24, "gust6": gust6,
         "river_discharge": river,
         "eq_mag": eq_mag, "eq_dist": eq_dist,
-        "rain_label": rain_lb, "wind_label": wind_lb, "storm_label": storm_lb,
-        "flood_label": flood_lb, "earthquake_label": eq_lb,
-        "overall_hazard_prediction": overall_lb
-    }
-    
-    # Tạo data cho DB (tương thích api_receiver)
-    db_event = {
-        "source": "owm_flat_batch", "event_type": "weather_analytics",
-        "title": f"[{overall_lb}] {location_name}",
-        "description": f"Risk: {overall_lb}. Temp: {temp}. RainLbl: {rain_lb}",
-        "event_time": datetime.now(UTC_TZ), "lat": lat, "lon": lon, "raw_data": flat_data
     }
+    return flat_data, weather_desc
 
-    return flat_data, db_event
+def build_location_records(cleaned):
+    """
+    [(dòng đã làm sạch, mô tả thời tiết)] -> [(dòng CSV phẳng, event cho DB)].
+    Nhãn của mọi địa điểm được tính 1 lần trên cả mảng (hazard_labels, profile nowcast).
+    """
+    if not cleaned: return []
+    rows = [flat for flat, _ in cleaned]
+    def col(name): return [row[name] for row in rows]
+
+    # 3. LABELING (Gán nhãn)
+    labels = label_hazards(
+        NOWCAST, p6=col("precip6"), p24=col("precip24"), gust6=col("gust6"), wind=col("wind_speed"),
+        pressure=col("pressure"), river=col("river_discharge"), eq_mag=col("eq_mag"), eq_dist=col("eq_dist"),
+        weather_desc=[desc for _, desc in cleaned],
+    )
+
+    # 4. LOAD (Đóng gói Dictionary)
+    records = []
+    for i, flat_data in enumerate(rows):
+        overall_lb = labels["overall"][i]
+        flat_data.update({
+            "rain_label": labels["rain"][i], "wind_label": labels["wind"][i], "storm_label": labels["storm"][i],
+            "flood_label": labels["flood"][i], "earthquake_label": labels["earthquake"][i],
+            "overall_hazard_prediction": overall_lb
+        })
+        # Tạo data cho DB (tương thích api_receiver)
+        db_event = {
+            "source": "owm_flat_batch", "event_type": "weather_analytics",
+            "title": f"[{overall_lb}] {flat_data['location']}",
+            "description": f"Risk: {overall_lb}. Temp: {flat_data['temperature']}. RainLbl: {flat_data['rain_label']}",
+            "event_time": datetime.now(UTC_TZ), "lat": flat_data["lat"], "lon": flat_data["lon"], "raw_data": flat_data
+        }
+        records.append((flat_data, db_event))
+    return records
+
+COLLECTOR_CSV_FILE = "vietnam_weather_disaster.csv"
+
+def collect_sequential(active_locations):
+    """Bản tuần tự cũ (requests): dùng khi COLLECTOR_ENGINE=sync hoặc không có httpx"""
+    n_locations = len(active_locations)
+    cleaned = []
+    open_meteo = get_openmeteo_many(active_locations) # Vài request cho cả danh sách
+    
+    for idx, loc in enumerate(active_locations):
+        if idx % 10 == 0: log(f"➡️ Xử lý {idx+1}/{n_locations}: {loc['name']}")
+        
+        result = process_single_location(loc['lat'], loc['lon'], loc['name'], prefetched=open_meteo[idx])
+        if result: cleaned.append(result)
+        time.sleep(1) 
+
+    csv_buffer = []; db_buffer = []
+    for flat, db_ev in build_location_records(cleaned): # Gán nhãn cả batch 1 lần
+        csv_buffer.append(flat)
+        db_buffer.append(db_ev)
+    return csv_buffer, db_buffer
+
+def collect_batch(locations):
+    """1 micro-batch địa điểm -> (csv_buffer, db_buffer)"""
+    if COLLECTOR_ENGINE == "async":
+        try:
+            from app.worker.async_collector import httpx, run_collection_cycle
+            if httpx is not None:
+                csv_buffer, db_buffer, stats = run_collection_cycle(locations)
+                log(f"📊 [Collector] Upstream: {json.dumps(stats, ensure_ascii=False)}")
+                return csv_buffer, db_buffer
+            log("⚠️ [Collector] Chưa cài httpx -> chạy tuần tự.")
+        except Exception as e:
+            log(f"⚠️ [Collector] Engine async lỗi ({e}) -> chạy tuần tự.")
+    return collect_sequential(locations)
+
+def collect_cycle(active_locations, checkpoint=cycle_checkpoint, region_locations=None):
+    """
+    1 lượt thu thập các địa điểm chưa xong trong checkpoint.
+    Mỗi micro-batch COLLECTOR_FLUSH_BATCH_SIZE địa điểm được ghi DB + CSV ngay rồi mới đánh dấu xong,
+    nên bộ nhớ chỉ giữ 1 batch và collector chết giữa chừng chỉ mất batch đang chạy.
+    region_locations: toàn bộ địa điểm theo dõi (vùng của catalog động đất), mặc định = active_locations.
+    """
+    # 1 request USGS cho cả vùng (chỉ event mới sau watermark), thay cho 1 request 5 năm mỗi địa điểm
+    earthquake_catalog.refresh(region_locations or active_locations)
+    # GDACS: 1 request mỗi chu kỳ; chỉ đánh dấu item đã gửi khi DB ghi thành công
+    if write_events_to_database(fetch_disaster_data()):
+        gdacs_feed.commit()
+    else:
+        gdacs_feed.rollback()
+
+    pending = checkpoint.pending(active_locations)
+    if len(pending) < len(active_locations):
+        log(f"⏭️ [Collector] Bỏ qua {len(active_locations) - len(pending)} địa điểm đã thu thập trong chu kỳ này.")
+    batch_size = max(1, COLLECTOR_FLUSH_BATCH_SIZE)
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        csv_buffer, db_buffer = collect_batch(batch)
+        # Ghi DB trước: lỗi thì không ghi CSV, không đánh dấu xong -> batch được thu thập lại
+        # (tick sau hoặc khi chạy tiếp checkpoint) mà CSV không bị trùng dòng
+        if not write_events_to_database(db_buffer): # <-- Ghi DB
+            log(f"❌ [Collector] Ghi DB lỗi, batch {len(batch)} địa điểm sẽ được thu thập lại.")
+            continue
+        save_collected_rows(csv_buffer, COLLECTOR_CSV_FILE) # <-- Ghi CSV / Parquet
+        checkpoint.mark_done(batch)
+        refresh_scheduler.observe(batch, csv_buffer) # Mức rủi ro + tốc độ thay đổi mới -> lịch làm mới
+        log(f"💾 [Collector] Đã ghi batch {start + len(batch)}/{len(pending)} địa điểm.")
 
 # *** HÀM MAIN ***
 def main():
@@ -293,38 +388,34 @@ def main():
     
     if n_keys == 0: log("❌ LỖI: Không tìm thấy API Key."); return
 
-    TARGET_CYCLE_MINUTES = max(15, int(120 / n_keys))
-    estimated_execution_time = n_locations * 2 
-    UPDATE_INTERVAL = max(0, (TARGET_CYCLE_MINUTES * 60) - estimated_execution_time)
+    owm_keys.set_share(OWM_COLLECTOR_QUOTA_SHARE) # Phần quota còn lại để dành cho API live
     
-    log(f"Hệ thống All-in-One: {n_locations} điểm. Chu kỳ: {TARGET_CYCLE_MINUTES} phút.")
+    log(f"Hệ thống All-in-One: {n_locations} điểm, {n_keys} key OWM. Engine: {COLLECTOR_ENGINE}.")
 
     while True:
-        log("🔄 [Collector] Bắt đầu chu kỳ...")
-        csv_buffer = []; db_buffer = []
-        
-        db_buffer.extend(fetch_disaster_data()) # GDACS
-        
-        for idx, loc in enumerate(active_locations):
-            if idx % 10 == 0: log(f"➡️ Xử lý {idx+1}/{n_locations}: {loc['name']}")
-            
-            result = process_single_location(loc['lat'], loc['lon'], loc['name'])
-            if result:
-                flat, db_ev = result
-                csv_buffer.append(flat)
-                db_buffer.append(db_ev)
-            time.sleep(1) 
-        
-        save_to_flat_csv(csv_buffer, "vietnam_weather_disaster.csv") # <-- Ghi CSV
-        write_events_to_database(db_buffer) # <-- Ghi DB
-        try:
-            print("📞 Đang gọi Backend để xử lý lại vùng nguy hiểm...")
-            requests.post("http://localhost:8000/api/v1/system/trigger-processing", timeout=5)
-        except Exception as e:
-            print(f"⚠️ Không gọi được Backend trigger: {e}")
-
-        log(f"✅ Hoàn tất. Chờ {UPDATE_INTERVAL/60:.1f} phút.\n")
+        tick_started = time.monotonic()
+        # Mỗi tick chỉ làm mới các địa điểm đến hạn theo mức rủi ro/tốc độ thay đổi, trong giới hạn quota OWM
+        due = refresh_scheduler.plan(active_locations, owm_keys.sustainable_rate(60))
+        log(f"🔄 [Collector] Tick: {json.dumps(refresh_scheduler.stats(), ensure_ascii=False)}. Quota OWM: {json.dumps(owm_keys.remaining(), ensure_ascii=False)}")
+        if due:
+            # Tick dở dang (collector vừa khởi động lại) được chạy tiếp, bỏ qua địa điểm đã ghi
+            cycle_checkpoint.begin(COLLECTOR_TICK_MINUTES * 60)
+            maintain_event_store() # Migration + partition tháng tới / xoá partition hết hạn
+            collect_cycle(due, region_locations=active_locations) # Thu thập + ghi CSV/DB theo từng micro-batch
+            cycle_checkpoint.finish()
+            if columnar_output_enabled() and history_store.available():
+                history_store.compact_partitions() # Gộp file nhỏ của các ngày đã qua
+            try:
+                print("📞 Đang gọi Backend để xử lý lại vùng nguy hiểm...")
+                requests.post("http://localhost:8000/api/v1/system/trigger-processing", timeout=5)
+            except Exception as e:
+                print(f"⚠️ Không gọi được Backend trigger: {e}")
+
+        # Chờ tới tick kế tiếp theo thời gian chạy thực tế
+        elapsed = time.monotonic() - tick_started
+        UPDATE_INTERVAL = max(0, (COLLECTOR_TICK_MINUTES * 60) - elapsed)
+        log(f"✅ Hoàn tất {len(due)} địa điểm sau {elapsed:.0f}s. Chờ {UPDATE_INTERVAL/60:.1f} phút.\n")
         time.sleep(UPDATE_INTERVAL)
 
 if __name__ == "__main__":
-    main() 
+    main()
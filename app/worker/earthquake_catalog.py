@@ -0,0 +1,225 @@
+# earthquake_catalog.py
+# Catalog động đất của cả vùng theo dõi, cache trên đĩa.
+# Mỗi chu kỳ chỉ hỏi USGS các event mới/được cập nhật sau watermark (1 request cho cả vùng,
+# thay vì 5 năm dữ liệu cho từng địa điểm), còn thống kê từng địa điểm tính từ index lưới trong bộ nhớ.
+import json
+import math
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import requests
+
+from app.core.config import EARTHQUAKE_CATALOG_PATH, EARTHQUAKE_CATALOG_FULL_REFRESH_HOURS
+
+EARTHQUAKE_RADIUS_KM = 200
+EARTHQUAKE_LOOKBACK_DAYS = 365 * 5
+EARTHQUAKE_MIN_MAG = 3.0
+
+USGS_URL = "https://earthquake.usgs.gov/fdsnws/event/1/query"
+USGS_PAGE_SIZE = 20000  # giới hạn tối đa của USGS cho 1 request
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEG_LAT = 111.32
+
+
+def _iso(ms: float) -> str:
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]
+
+
+def _haversine_km(lat, lon, lats, lons):
+    """Khoảng cách (km) từ 1 điểm tới mảng điểm"""
+    phi1, phi2 = math.radians(lat), np.radians(lats)
+    dphi = phi2 - phi1
+    dlambda = np.radians(lons) - math.radians(lon)
+    a = np.sin(dphi / 2) ** 2 + math.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+class EarthquakeCatalog:
+    """
+    events: id USGS -> [time_ms, lat, lon, mag]; watermark = 'updated' lớn nhất đã thấy.
+    stats_for(lat, lon) trả đúng như get_earthquake_stats cũ: (độ lớn của trận gần đây nhất, khoảng cách gần nhất)
+    trong bán kính radius_km, chỉ xét các trận >= min_mag trong lookback_days.
+    """
+
+    def __init__(self, radius_km: float, lookback_days: int, min_mag: float,
+                 path: str = EARTHQUAKE_CATALOG_PATH, cell_deg: float = 1.0):
+        self.radius_km = radius_km
+        self.lookback_days = lookback_days
+        self.min_mag = min_mag
+        self.path = path
+        self.cell_deg = cell_deg
+
+        self.events = {}
+        self.bbox = None  # vùng catalog đang phủ: [min_lat, max_lat, min_lon, max_lon]
+        self.watermark = None
+        self.full_refreshed_at = 0.0
+        self._index = None
+        self.stats = {"refreshes": 0, "full_refreshes": 0, "fetched": 0, "errors": 0, "lookups": 0}
+        self._load()
+
+    @property
+    def ready(self) -> bool:
+        return self._index is not None
+
+    # --- Lưu / đọc cache trên đĩa ---
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            if (data.get("radius_km"), data.get("min_mag")) != (self.radius_km, self.min_mag):
+                return  # cấu hình khác -> tải lại từ đầu
+            self.events = data.get("events", {})
+            self.bbox = data.get("bbox")
+            self.watermark = data.get("watermark")
+            self.full_refreshed_at = data.get("full_refreshed_at", 0.0)
+            self._rebuild_index()
+            print(f"✅ [Earthquake] Đọc {len(self.events)} trận từ cache {self.path}")
+        except Exception as e:
+            print(f"⚠️ [Earthquake] Không đọc được cache ({e}) -> tải lại toàn bộ")
+            self.events, self.bbox, self.watermark = {}, None, None
+
+    def _save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "radius_km": self.radius_km, "min_mag": self.min_mag,
+                "bbox": self.bbox, "watermark": self.watermark,
+                "full_refreshed_at": self.full_refreshed_at, "events": self.events,
+            }, f)
+        os.replace(tmp_path, self.path)  # ghi file tạm rồi đổi tên: không bao giờ để lại file dở dang
+
+    # --- Đồng bộ với USGS ---
+
+    def region_for(self, locations) -> list:
+        """Bbox bao mọi địa điểm, nới thêm radius_km mỗi phía"""
+        lats = [loc["lat"] for loc in locations]
+        lons = [loc["lon"] for loc in locations]
+        pad_lat = self.radius_km / KM_PER_DEG_LAT
+        max_abs_lat = min(89.0, max(abs(min(lats)), abs(max(lats))) + pad_lat)
+        pad_lon = self.radius_km / (KM_PER_DEG_LAT * math.cos(math.radians(max_abs_lat)))
+        return [
+            round(max(-90.0, min(lats) - pad_lat), 3), round(min(90.0, max(lats) + pad_lat), 3),
+            round(max(-180.0, min(lons) - pad_lon), 3), round(min(180.0, max(lons) + pad_lon), 3),
+        ]
+
+    def _covers(self, region) -> bool:
+        b = self.bbox
+        return bool(b) and b[0] <= region[0] and b[1] >= region[1] and b[2] <= region[2] and b[3] >= region[3]
+
+    def _fetch(self, region, updated_after=None, http_get=requests.get) -> list:
+        start = datetime.now(timezone.utc) - timedelta(days=self.lookback_days)
+        params = {
+            "format": "geojson", "starttime": start.strftime("%Y-%m-%d"),
+            "minlatitude": region[0], "maxlatitude": region[1],
+            "minlongitude": region[2], "maxlongitude": region[3],
+            "minmagnitude": self.min_mag, "orderby": "time-asc", "limit": USGS_PAGE_SIZE,
+        }
+        if updated_after is not None:
+            params["updatedafter"] = _iso(updated_after)
+
+        features, offset = [], 1
+        while True:
+            resp = http_get(USGS_URL, params={**params, "offset": offset}, timeout=60)
+            resp.raise_for_status()
+            page = resp.json().get("features", [])
+            features.extend(page)
+            if len(page) < USGS_PAGE_SIZE:
+                return features
+            offset += len(page)
+
+    def refresh(self, locations, http_get=requests.get) -> bool:
+        """
+        Cập nhật catalog cho các địa điểm: lần đầu / vùng mới / quá hạn full refresh thì tải toàn bộ,
+        còn lại chỉ lấy event có 'updated' sau watermark. Lỗi mạng thì giữ catalog cũ.
+        """
+        if not locations:
+            return self.ready
+        region = self.region_for(locations)
+        full = (
+            not self.ready or not self._covers(region)
+            or time.time() - self.full_refreshed_at > EARTHQUAKE_CATALOG_FULL_REFRESH_HOURS * 3600
+        )
+        started = time.monotonic()
+        try:
+            features = self._fetch(region if full else self.bbox, None if full else self.watermark, http_get)
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"⚠️ [Earthquake] Không cập nhật được catalog: {e} (dùng {len(self.events)} trận đã cache)")
+            return self.ready
+
+        if full:
+            self.events, self.bbox, self.watermark = {}, region, None
+            self.full_refreshed_at = time.time()
+            self.stats["full_refreshes"] += 1
+        for f in features:
+            try:
+                props, coords = f["properties"], f["geometry"]["coordinates"]
+                updated = props.get("updated") or props.get("time") or 0
+                self.watermark = max(self.watermark or 0, updated)
+                if props.get("mag") is None or props["mag"] < self.min_mag:
+                    self.events.pop(f["id"], None)  # bị hạ độ lớn xuống dưới ngưỡng
+                    continue
+                self.events[f["id"]] = [props.get("time", 0), coords[1], coords[0], props["mag"]]
+            except (KeyError, TypeError, IndexError):
+                continue
+
+        cutoff = (time.time() - self.lookback_days * 86400) * 1000
+        self.events = {k: v for k, v in self.events.items() if v[0] >= cutoff}
+        self._rebuild_index()
+        self.stats["refreshes"] += 1
+        self.stats["fetched"] += len(features)
+        try:
+            self._save()
+        except Exception as e:
+            print(f"⚠️ [Earthquake] Không ghi được cache: {e}")
+        print(f"🌏 [Earthquake] {'Tải toàn bộ' if full else 'Cập nhật'}: +{len(features)} bản ghi, "
+              f"{len(self.events)} trận trong catalog ({time.monotonic() - started:.1f}s)")
+        return True
+
+    # --- Index lưới + truy vấn ---
+
+    def _rebuild_index(self):
+        rows = list(self.events.values())
+        arr = np.array(rows, dtype=np.float64).reshape(-1, 4)
+        self._times, self._lats, self._lons, self._mags = arr[:, 0], arr[:, 1], arr[:, 2], arr[:, 3]
+        cells = {}
+        for i, (lat, lon) in enumerate(zip(self._lats, self._lons)):
+            cells.setdefault((math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)), []).append(i)
+        self._index = {cell: np.array(ids, dtype=np.int64) for cell, ids in cells.items()}
+
+    def _candidates(self, lat, lon) -> np.ndarray:
+        """Chỉ số các trận nằm trong những ô lưới giao với hình vuông bán kính quanh điểm"""
+        d_lat = self.radius_km / KM_PER_DEG_LAT
+        d_lon = self.radius_km / (KM_PER_DEG_LAT * max(math.cos(math.radians(min(89.0, abs(lat) + d_lat))), 1e-6))
+        i0, i1 = math.floor((lat - d_lat) / self.cell_deg), math.floor((lat + d_lat) / self.cell_deg)
+        j0, j1 = math.floor((lon - d_lon) / self.cell_deg), math.floor((lon + d_lon) / self.cell_deg)
+        parts = [self._index[(i, j)] for i in range(i0, i1 + 1) for j in range(j0, j1 + 1) if (i, j) in self._index]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def stats_for(self, lat, lon):
+        """(mag trận gần đây nhất, khoảng cách km tới trận gần nhất) trong bán kính; (None, None) nếu không có"""
+        if not self.ready:
+            raise RuntimeError("Catalog động đất chưa được tải")
+        self.stats["lookups"] += 1
+        ids = self._candidates(lat, lon)
+        if ids.size == 0:
+            return None, None
+        dist = _haversine_km(lat, lon, self._lats[ids], self._lons[ids])
+        inside = dist <= self.radius_km
+        if not inside.any():
+            return None, None
+        ids, dist = ids[inside], dist[inside]
+        recent = ids[np.argmax(self._times[ids])]
+        return float(self._mags[recent]), float(dist.min())
+
+
+# Dùng chung trong process collector (cả engine tuần tự lẫn async)
+earthquake_catalog = EarthquakeCatalog(EARTHQUAKE_RADIUS_KM, EARTHQUAKE_LOOKBACK_DAYS, EARTHQUAKE_MIN_MAG)
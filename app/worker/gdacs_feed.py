@@ -0,0 +1,152 @@
+# gdacs_feed.py
+# Trạng thái đọc feed GDACS (rssarchive.xml) giữa các chu kỳ collector, lưu trên đĩa:
+# - ETag / Last-Modified -> request có điều kiện, feed không đổi thì GDACS chỉ trả 304 (không tải, không parse).
+# - GUID các item đã gửi vào DB -> chỉ phát ra sự kiện mới (event GDACS không có event_time nên DB không tự lọc trùng).
+# XML được parse tăng dần theo từng chunk (XMLPullParser), mỗi <item> xử lý xong thì giải phóng.
+import json
+import os
+import time
+from xml.etree import ElementTree as ET
+
+from app.core.config import GDACS_STATE_PATH, GDACS_SEEN_TTL_DAYS
+
+GEO_NS = "{http://www.w3.org/2003/01/geo/wgs84_pos#}"
+
+
+def _text(elem, tag):
+    child = elem.find(tag)
+    return child.text if child is not None else None
+
+
+def _parse_item(item):
+    """<item> -> (guid, event); guid thiếu thì dùng link / title làm khoá"""
+    title = _text(item, "title") or ""
+    lat, lon = None, None
+    geo_point = item.find(f"{GEO_NS}Point")
+    if geo_point is not None:
+        try:
+            lat = float(_text(geo_point, f"{GEO_NS}lat"))
+            lon = float(_text(geo_point, f"{GEO_NS}lon"))
+        except (TypeError, ValueError):
+            lat, lon = None, None
+    guid = (_text(item, "guid") or _text(item, "link") or f"{title}|{lat}|{lon}").strip()
+    event = {
+        "source": "gdacs_rss", "event_type": "disaster", "title": title,
+        "description": _text(item, "description"), "event_time": None,
+        "lat": lat, "lon": lon, "raw_data": {"guid": guid},
+    }
+    return guid, event
+
+
+def iter_gdacs_items(chunks):
+    """Parse feed tăng dần từ các chunk bytes -> (guid, event) cho từng <item>"""
+    parser = ET.XMLPullParser(events=("end",))
+
+    def drain():
+        for _, elem in parser.read_events():
+            if elem.tag == "item":
+                yield _parse_item(elem)
+                elem.clear()  # không giữ cây XML của item đã xử lý
+
+    for chunk in chunks:
+        if chunk:
+            parser.feed(chunk)
+            yield from drain()
+    parser.close()
+    yield from drain()
+
+
+class GdacsFeed:
+    """
+    Dùng: headers = feed.request_headers(HEADERS) -> GET -> events = feed.ingest(status, resp.headers, chunks, accept)
+    rồi feed.commit() sau khi ghi DB thành công. Chưa commit (VD ghi DB lỗi) thì lượt sau tải và phát lại các item đó.
+    """
+
+    def __init__(self, path: str = GDACS_STATE_PATH, seen_ttl_days: float = GDACS_SEEN_TTL_DAYS):
+        self.path = path
+        self.seen_ttl = seen_ttl_days * 86400
+        self.etag = None
+        self.last_modified = None
+        self.seen = {}  # guid -> lần cuối còn thấy trong feed (epoch)
+        self._pending = None  # (etag, last_modified, {guid: ts}) chờ commit
+        self.stats = {"polls": 0, "not_modified": 0, "items": 0, "new_events": 0}
+        self._load()
+
+    # --- Lưu / đọc trạng thái trên đĩa ---
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.etag = data.get("etag")
+            self.last_modified = data.get("last_modified")
+            self.seen = data.get("seen", {})
+        except Exception as e:
+            print(f"⚠️ [GDACS] Không đọc được trạng thái feed ({e}) -> đọc lại toàn bộ feed")
+            self.etag, self.last_modified, self.seen = None, None, {}
+
+    def _save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"etag": self.etag, "last_modified": self.last_modified, "seen": self.seen}, f)
+        os.replace(tmp_path, self.path)
+
+    # --- Request có điều kiện + parse ---
+
+    def request_headers(self, base_headers: dict) -> dict:
+        headers = dict(base_headers)
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def ingest(self, status_code: int, headers, chunks, accept) -> list:
+        """
+        Response GDACS -> list event mới (chưa gửi lần nào) có toạ độ thoả accept(lat, lon).
+        304 -> []. Trạng thái mới chỉ được giữ tạm tới khi commit().
+        """
+        self.stats["polls"] += 1
+        if status_code == 304:
+            self.stats["not_modified"] += 1
+            return []
+
+        now = time.time()
+        in_feed, new_events = {}, []
+        for guid, event in iter_gdacs_items(chunks):
+            self.stats["items"] += 1
+            if not accept(event["lat"], event["lon"]) or guid in in_feed:
+                continue
+            in_feed[guid] = now
+            if guid not in self.seen:
+                new_events.append(event)
+        self._pending = (headers.get("ETag"), headers.get("Last-Modified"), in_feed)
+        self.stats["new_events"] += len(new_events)
+        return new_events
+
+    def commit(self):
+        """Ghi nhận các item của lượt ingest gần nhất là đã xử lý (gọi sau khi ghi DB thành công)"""
+        if self._pending is None:
+            return
+        self.etag, self.last_modified, in_feed = self._pending
+        self._pending = None
+        cutoff = time.time() - self.seen_ttl
+        # Giữ GUID còn trong feed; GUID đã rời feed quá seen_ttl thì bỏ cho file trạng thái không phình mãi
+        self.seen = {guid: ts for guid, ts in {**self.seen, **in_feed}.items() if ts >= cutoff}
+        try:
+            self._save()
+        except Exception as e:
+            print(f"⚠️ [GDACS] Không ghi được trạng thái feed: {e}")
+
+    def rollback(self):
+        """Bỏ kết quả lượt ingest gần nhất (lượt sau gửi lại request không điều kiện cho các item đó)"""
+        self._pending = None
+
+
+# Dùng chung trong process collector (cả engine tuần tự lẫn async)
+gdacs_feed = GdacsFeed()
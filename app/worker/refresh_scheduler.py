@@ -0,0 +1,155 @@
+# refresh_scheduler.py
+# Lịch làm mới riêng cho từng địa điểm thay vì cả danh sách cùng 1 nhịp:
+# - Mức rủi ro hiện tại càng cao -> làm mới càng dày (VD high: 5 phút, không rủi ro: 60 phút).
+# - Số đo thay đổi nhanh giữa 2 lần đọc -> rút ngắn khoảng làm mới.
+# - Tổng nhu cầu vượt quota OWM bền vững -> giãn đều mọi khoảng, mỗi tick chỉ lấy các điểm gấp nhất.
+import json
+import os
+import time
+
+from app.core.config import COLLECTOR_REFRESH_MINUTES, COLLECTOR_TICK_MINUTES, COLLECTOR_SCHEDULE_PATH
+from app.ml.hazard_labels import RISK_LEVELS, RISK_ORDER
+from app.worker.cycle_checkpoint import location_key
+
+LABEL_FIELDS = ("rain_label", "wind_label", "storm_label", "flood_label", "earthquake_label")
+# Độ thay đổi "đáng kể" của từng số đo; tốc độ thay đổi = max(|Δ| / thang đo) mỗi giờ
+CHANGE_SCALES = {"precip6": 10.0, "precip24": 20.0, "gust6": 5.0, "pressure": 3.0, "river_discharge": 500.0}
+
+
+def parse_refresh_minutes(spec: str = COLLECTOR_REFRESH_MINUTES) -> list:
+    """"no=60,low=30,..." -> [phút cho no, low, mid, mid-high, high] (mức thiếu lấy theo mức thấp hơn liền kề)"""
+    given = {}
+    for item in spec.split(","):
+        level, sep, minutes = item.strip().partition("=")
+        if sep and level.strip() in RISK_ORDER:
+            given[RISK_ORDER[level.strip()]] = float(minutes)
+    intervals, current = [], given.get(0, 60.0)
+    for i in range(len(RISK_LEVELS)):
+        current = given.get(i, current)
+        intervals.append(current)
+    return intervals
+
+
+def _rate_of_change(old: dict, new: dict, hours: float) -> float:
+    changes = [
+        abs(new[f] - old[f]) / scale for f, scale in CHANGE_SCALES.items()
+        if new.get(f) not in (None, -1.0) and old.get(f) not in (None, -1.0)
+    ]
+    return max(changes, default=0.0) / max(hours, 1 / 60)
+
+
+class RefreshScheduler:
+    """
+    Dùng: due = s.plan(locations, rate_per_minute) -> thu thập -> s.observe(batch, rows) sau mỗi batch.
+    Trạng thái (lần làm mới cuối, mức rủi ro, số đo, tốc độ thay đổi) lưu trên đĩa để khởi động lại không phải lấy lại hết.
+    """
+
+    def __init__(self, refresh_minutes: list = None, tick_minutes: float = COLLECTOR_TICK_MINUTES,
+                 path: str = COLLECTOR_SCHEDULE_PATH):
+        self.refresh_minutes = refresh_minutes or parse_refresh_minutes()
+        self.tick_minutes = tick_minutes
+        self.path = path
+        self.states = {}  # location_key -> {"refreshed_at", "attempted_at", "level", "change", "readings"}
+        self.last_plan = {}
+        self.tick_started_at = None  # thời điểm plan() của tick hiện tại
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.states = json.load(f)
+        except Exception as e:
+            print(f"⚠️ [Schedule] Không đọc được lịch làm mới ({e}) -> làm mới mọi địa điểm")
+            self.states = {}
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.states, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"⚠️ [Schedule] Không ghi được lịch làm mới: {e}")
+
+    def interval_minutes(self, key: str) -> float:
+        """Khoảng làm mới mong muốn (chưa tính quota): theo mức rủi ro, chia (1 + tốc độ thay đổi), tối thiểu 1 tick"""
+        state = self.states.get(key)
+        if state is None:
+            return self.tick_minutes
+        base = self.refresh_minutes[state.get("level", 0)]
+        return max(self.tick_minutes, base / (1.0 + state.get("change", 0.0)))
+
+    def plan(self, locations: list, rate_per_minute: float, now: float = None) -> list:
+        """
+        Các địa điểm cần làm mới ở tick này, gấp nhất trước.
+        rate_per_minute: số lượt OWM/phút collector được dùng lâu dài (owm_keys.sustainable_rate(60)).
+        """
+        now = time.time() if now is None else now
+        self.tick_started_at = now
+        intervals = {location_key(loc): self.interval_minutes(location_key(loc)) for loc in locations}
+        demand = sum(1.0 / minutes for minutes in intervals.values())  # lượt/phút nếu theo đúng lịch mong muốn
+        stretch = max(1.0, demand / rate_per_minute) if rate_per_minute > 0 else float("inf")
+
+        # Dữ liệu ghi xong sau thời điểm bắt đầu tick -> cho phép sớm nửa tick, không thì điểm 5 phút bị đẩy sang 10 phút
+        slack = self.tick_minutes * 60 / 2
+        due = []
+        for loc in locations:
+            key = location_key(loc)
+            state = self.states.get(key, {})
+            interval = intervals[key] * stretch * 60
+            # Lần thử trước lỗi (VD OWM hỏng) -> thử lại ở tick kế tiếp (attempted_at = lúc bắt đầu tick đó)
+            if now - state.get("attempted_at", 0) + slack < self.tick_minutes * 60:
+                continue
+            age = now - state.get("refreshed_at", 0)
+            if age + slack >= interval:
+                due.append((age / interval if interval > 0 else float("inf"), loc))
+        due.sort(key=lambda item: item[0], reverse=True)
+
+        capacity = int(rate_per_minute * self.tick_minutes) if rate_per_minute > 0 else 0
+        selected = [loc for _, loc in due[:capacity]]
+        self.last_plan = {
+            "locations": len(locations),
+            "due": len(due),
+            "selected": len(selected),
+            "capacity": capacity,
+            "demand_per_minute": round(demand, 2),
+            "stretch": round(stretch, 2) if stretch != float("inf") else None,
+        }
+        return selected
+
+    def observe(self, locations: list, rows: list, now: float = None):
+        """Cập nhật lịch sau 1 batch: rows là các dòng CSV đã gán nhãn (địa điểm lỗi không có dòng)"""
+        now = time.time() if now is None else now
+        by_key = {location_key({"name": row["location"], "lat": row["lat"], "lon": row["lon"]}): row for row in rows}
+        # Ghi theo lúc bắt đầu tick (không phải lúc batch xong) để tick kế tiếp đã đủ 1 tick
+        attempted_at = self.tick_started_at if self.tick_started_at is not None else now
+        for loc in locations:
+            key = location_key(loc)
+            state = self.states.setdefault(key, {})
+            state["attempted_at"] = attempted_at
+            row = by_key.get(key)
+            if row is None:
+                continue
+            readings = {f: row.get(f) for f in CHANGE_SCALES}
+            if state.get("readings") and "refreshed_at" in state:
+                state["change"] = round(_rate_of_change(state["readings"], readings, (now - state["refreshed_at"]) / 3600), 3)
+            state["level"] = max(RISK_ORDER.get(row.get(f), 0) for f in LABEL_FIELDS)
+            state["readings"] = readings
+            state["refreshed_at"] = now
+            state.pop("attempted_at")
+        self._save()
+
+    def stats(self) -> dict:
+        levels = [0] * len(RISK_LEVELS)
+        for state in self.states.values():
+            levels[state.get("level", 0)] += 1
+        return {**self.last_plan, "by_level": dict(zip(RISK_LEVELS, levels))}
+
+
+# Lịch làm mới của process collector
+refresh_scheduler = RefreshScheduler()
@@ -2,7 +2,6 @@ import requests
 import pandas as pd
 from datetime import datetime
 import numpy as np
-import joblib
 import os
 import sys
 
@@ -12,176 +11,64 @@ import sys
 
 # Sửa đường dẫn - từ thư mục predict lên data folder
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-MODEL_PATH = os.path.join(BASE_DIR, "data", "models", "hazard_model.pkl")
-FEATURE_PATH = os.path.join(BASE_DIR, "data", "models", "hazard_features.pkl")
-ENCODER_PATH = os.path.join(BASE_DIR, "data", "models", "hazard_label_encoder.pkl")
-SCALER_PATH = os.path.join(BASE_DIR, "data", "models", "hazard_scaler.pkl")
+sys.path.append(BASE_DIR)
 
-print(f"Loading models from: {BASE_DIR}")
-print(f"Model path: {MODEL_PATH}")
+# Model/encoder/scaler lấy từ registry dùng chung với API (load lazy, 1 lần/process)
+from app.ml.registry import registry
+from app.ml.predictor_hazard import get_hazard_predictor
+from app.core.open_meteo import fetch_batched
+from app.ml.hazard_labels import label_hazards, FORECAST, RISK_ORDER
 
-model = joblib.load(MODEL_PATH)
-feature_list = joblib.load(FEATURE_PATH)
-label_encoder = joblib.load(ENCODER_PATH)
-scaler = joblib.load(SCALER_PATH)
+MODEL_PATH = registry.path_of("hazard_model")
+FEATURE_PATH = registry.path_of("hazard_features")
+ENCODER_PATH = registry.path_of("hazard_label_encoder")
+SCALER_PATH = registry.path_of("hazard_scaler")
 
-# ==============================
-# HÀM HỖ TRỢ GIỐNG historical_data.py
-# ==============================
 
-def level(v):
-    return v or 0.0
-
-# 🌧 Rain
-def label_rain(p6, p24):
-    p6 = level(p6)
-    p24 = level(p24)
-
-    if p24 > 80 or p6 > 40:
-        return "high"
-    if p24 > 50 or p6 > 25:
-        return "mid-high"
-    if p24 > 20 or p6 > 10:
-        return "mid"
-    if p24 > 3 or p6 > 1:
-        return "low"
-    return "no"
-
-# 💨 Wind
-def label_wind(gust6):
-    gust6 = level(gust6)
-
-    if gust6 > 30:
-        return "high"
-    if gust6 > 22:
-        return "mid-high"
-    if gust6 > 15:
-        return "mid"
-    if gust6 > 8:
-        return "low"
-    return "no"
-
-# 🌩 Storm (OPTION B)
-def label_storm(gust6, p6, p24, wind, pres):
-    gust6 = level(gust6)
-    p6 = level(p6)
-    p24 = level(p24)
-
-    score = 0
-
-    # 1) Gió giật
-    if gust6 > 28: score += 4
-    elif gust6 > 20: score += 3
-    elif gust6 > 13: score += 2
-    elif gust6 > 7:  score += 1
-
-    # thêm rule
-    if gust6 > wind + 12 and p6 > 20:
-        score += 2
-    elif gust6 > wind + 8 and p6 > 10:
-        score += 1
-
-    # 2) Mưa
-    if p24 > 80 or p6 > 40:
-        score += 4
-    elif p24 > 50 or p6 > 25:
-        score += 3
-    elif p24 > 20 or p6 > 10:
-        score += 2
-    elif p24 > 3 or p6 > 1:
-        score += 1
-
-    # 3) Áp suất
-    if pres < 990: score += 4
-    elif pres < 995: score += 3
-    elif pres < 1000: score += 2
-    elif pres < 1005: score += 1
-
-    if score >= 14:
-        return "high"
-    if score >= 10:
-        return "mid-high"
-    if score >= 7:
-        return "mid"
-    if score >= 3:
-        return "low"
-    return "no"
-
-# 🌊 Flood
-def label_flood(river):
-    river = level(river)
-
-    if river > 8000: return "high"
-    if river > 5000: return "mid-high"
-    if river > 2000: return "mid"
-    if river > 500:  return "low"
-    return "no"
-
-# 🌏 Earthquake
-def label_earthquake(mag, dist):
-    if mag is None or dist is None:
-        return "no"
-
-    if mag >= 6.0 and dist <= 150:
-        return "high"
-    if mag >= 5.5 and dist <= 300:
-        return "mid-high"
-    if mag >= 5.0 and dist <= 500:
-        return "mid"
-    if mag >= 4.5 and dist <= 800:
-        return "low"
-    return "no"
-
-# Overall
-RISK_ORDER = {"no": 0, "low": 1, "mid": 2, "mid-high": 3, "high": 4}
-HAZARD_PRIORITY = ["wind", "rain", "storm", "flood", "earthquake"]
-
-def overall_hazard_prediction_rule(flood, storm, rain, wind, eq):
-    risks = {
-        "flood": flood,
-        "storm": storm,
-        "rain": rain,
-        "wind": wind,
-        "earthquake": eq,
-    }
-
-    best = "no"
-    best_score = 0
-    
-    for hz in HAZARD_PRIORITY:
-        lv = risks[hz]
-        score = RISK_ORDER[lv]
-        
-        # Wind cần score >= 3 (mid-high hoặc cao hơn), còn lại cần score >= 2 (mid hoặc cao hơn)
-        if hz == "wind":
-            min_threshold = 3  # mid-high hoặc cao hơn
-        else:
-            min_threshold = 2
-        
-        if score >= min_threshold and score > best_score:
-            best = hz
-            best_score = score
-
-    if best_score == 0:  # Không có hazard nào thỏa mãn điều kiện
-        return "No"
-    return best.capitalize()
+def load_forecast_artifacts():
+    """
+    Trả về (model, feature_list, label_encoder, scaler) của cùng 1 bản HazardPredictor đang phục vụ:
+    hot-swap thay cả 4 cùng lúc, không ghép model mới với scaler/feature list cũ.
+    """
+    predictor = get_hazard_predictor()
+    artifacts = (predictor.raw_model, predictor.forecast_features, predictor.label_encoder, predictor.scaler)
+    if any(artifact is None for artifact in artifacts):
+        raise FileNotFoundError(f"❌ Thiếu artifact dự báo 7 ngày (model/feature/encoder/scaler) trong {os.path.dirname(MODEL_PATH)}")
+    return artifacts
 
 # ==============================
 # GET 7-DAY FORECAST
 # ==============================
 
-def get_7day(lat, lon):
-    url = (
-        f"https://api.open-meteo.com/v1/forecast?"
-        f"latitude={lat}&longitude={lon}"
-        f"&hourly=precipitation,windgusts_10m,windspeed_10m,pressure_msl"
-        f"&hourly=precipitation,windgusts_10m,windspeed_10m,pressure_msl,relativehumidity_2m"
-        f"&daily=temperature_2m_max,temperature_2m_min,precipitation_sum"
-        f"&timezone=auto"
-    )
+SEVEN_DAY_URL = "https://api.open-meteo.com/v1/forecast"
+SEVEN_DAY_PARAMS = {
+    "hourly": "precipitation,windgusts_10m,windspeed_10m,pressure_msl,relativehumidity_2m",
+    "daily": "temperature_2m_max,temperature_2m_min,precipitation_sum",
+    "timezone": "auto",
+}
+
+def get_7day_many(points):
+    """
+    Dự báo 7 ngày cho nhiều (lat, lon): gộp toạ độ vào ít request Open-Meteo.
+    Trả về list DataFrame theo thứ tự points (None nếu điểm đó lỗi).
+    """
+    payloads = fetch_batched(SEVEN_DAY_URL, SEVEN_DAY_PARAMS, list(points))
+    results = []
+    for data in payloads:
+        try:
+            results.append(_daily_frame(data) if data else None)
+        except Exception as e:
+            print(f"⚠️ Không đọc được dự báo 7 ngày: {e}")
+            results.append(None)
+    return results
 
-    data = requests.get(url).json()
+def get_7day(lat, lon):
+    df = get_7day_many([(lat, lon)])[0]
+    if df is None:
+        raise RuntimeError(f"Không lấy được dự báo 7 ngày cho ({lat}, {lon})")
+    return df
 
+def _daily_frame(data):
     # ----- DAILY -----
     daily = data["daily"]
     df_daily = pd.DataFrame({
@@ -260,176 +147,207 @@ def get_7day(lat, lon):
 # INTEGRATION WITH DATA COLLECTOR
 # ==============================
 
-def get_river_discharge_for_location(lat, lon):
+LIVE_DATA_PATH = os.path.join(BASE_DIR, "data", "live_data.csv")
+
+def load_live_river_discharge():
     """
-    Lấy dữ liệu river discharge real-time từ data_collector
+    Đọc live_data.csv 1 lần -> (lat, lon, river_discharge) dạng mảng numpy (river thiếu -> NaN).
+    Không có file thì trả về None.
+    """
+    if not os.path.exists(LIVE_DATA_PATH):
+        return None
+    import csv as _csv
+    lats, lons, rivers = [], [], []
+    with open(LIVE_DATA_PATH, mode='r', encoding='utf-8-sig') as f:
+        for row in _csv.DictReader(f):
+            try:
+                rlat = float(row.get('lat') or 0)
+                rlon = float(row.get('lon') or 0)
+            except Exception:
+                continue
+            try:
+                river = float(row.get('river_discharge')) if row.get('river_discharge') else np.nan
+            except Exception:
+                river = np.nan
+            lats.append(rlat); lons.append(rlon); rivers.append(river)
+    return np.array(lats), np.array(lons), np.array(rivers)
+
+def _haversine(lat1, lon1, lat2, lon2):
+    R = 6371.0
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = np.radians(lat2 - lat1)
+    dlambda = np.radians(lon2 - lon1)
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return 2 * R * np.arcsin(np.sqrt(a))
+
+def get_river_discharge_many(points):
+    """
+    River discharge cho nhiều (lat, lon), trả về list theo thứ tự points (None nếu không có).
     
-    Cố gắng import function get_flood_forecast từ data_collector.
-    Nếu thành công, lấy river data real-time.
-    Nếu thất bại, dùng fallback value.
+    1. live_data.csv đọc 1 lần cho cả batch: mỗi điểm lấy giá trị của dòng gần nhất.
+    2. Điểm chưa có giá trị -> Open-Meteo flood API gộp nhiều toạ độ/request (như collector).
     """
+    points = list(points)
+    values = [None] * len(points)
     try:
-        # Thay vì gọi API chậm, cố gắng đọc nhanh từ file live_data.csv trong backend/data
-        live_path = os.path.join(BASE_DIR, "data", "live_data.csv")
-        if os.path.exists(live_path):
-            import csv as _csv
-            best = None
-            best_dist = None
-            # Hàm haversine nhẹ dùng numpy
-            def _haversine(lat1, lon1, lat2, lon2):
-                R = 6371.0
-                phi1, phi2 = np.radians(lat1), np.radians(lat2)
-                dphi = np.radians(lat2 - lat1)
-                dlambda = np.radians(lon2 - lon1)
-                a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
-                return 2 * R * np.arcsin(np.sqrt(a))
-
-            with open(live_path, mode='r', encoding='utf-8-sig') as f:
-                reader = _csv.DictReader(f)
-                for row in reader:
-                    try:
-                        rlat = float(row.get('lat') or 0)
-                        rlon = float(row.get('lon') or 0)
-                        dist = _haversine(lat, lon, rlat, rlon)
-                        if best is None or dist < best_dist:
-                            best = row
-                            best_dist = dist
-                    except Exception:
-                        continue
-
-            if best is not None and best.get('river_discharge'):
-                try:
-                    val = float(best.get('river_discharge'))
-                    print(f"[live_data] Using river discharge from live_data.csv: {val} (dist {best_dist:.2f} km)")
-                    return val
-                except Exception:
-                    pass
-
-        # Nếu không có live file hoặc không tìm được giá trị, fallback sang data_collector
-        sys.path.insert(0, os.path.join(BASE_DIR, "app", "worker"))
-        from data_collector import get_flood_forecast
-        river_value = get_flood_forecast(lat, lon)
-        if river_value is not None:
-            print(f"[data_collector] Got river discharge: {river_value}")
-            return river_value
-        else:
-            print(f"[data_collector] No river data available, using fallback")
-            return None
+        live = load_live_river_discharge()
+        if live is not None and len(live[0]):
+            lats, lons, rivers = live
+            for i, (lat, lon) in enumerate(points):
+                dist = _haversine(lat, lon, lats, lons)
+                best = int(np.argmin(dist))
+                if not np.isnan(rivers[best]):
+                    values[i] = float(rivers[best])
     except Exception as e:
-        print(f"Warning: Could not load river data from data_collector or live file: {e}")
-        return None
+        print(f"Warning: Could not read river data from live file: {e}")
+
+    missing = [i for i, value in enumerate(values) if value is None]
+    if missing:
+        print(f"[live_data] Có {len(points) - len(missing)}/{len(points)} điểm có river discharge, gọi flood API cho phần còn lại")
+        try:
+            from app.worker.data_collector import FLOOD_URL, FLOOD_PARAMS, parse_flood_forecast, parse_or_default
+            floods = fetch_batched(FLOOD_URL, FLOOD_PARAMS, [points[i] for i in missing])
+            for i, payload in zip(missing, floods):
+                values[i] = parse_or_default(parse_flood_forecast, payload, None)
+        except Exception as e:
+            print(f"Warning: Could not load river data from flood API: {e}")
+    return values
+
+def get_river_discharge_for_location(lat, lon):
+    """River discharge cho 1 điểm (live_data.csv, thiếu thì gọi flood API); None nếu không có"""
+    return get_river_discharge_many([(lat, lon)])[0]
 
 # ==============================
 # MAIN 7-DAY PIPELINE
 # ==============================
 
-def forecast_7_days(lat, lon):
-    df_fc = get_7day(lat, lon)
-
-    # Lấy river discharge từ data_collector
-    river_discharge = get_river_discharge_for_location(lat, lon)
-    if river_discharge is None:
-        river_discharge = 15  # fallback
-
-    results = []
+# Thứ tự cột input cho scaler và các cột nhãn rule (khớp lúc train)
+SCALER_FEATURES = [
+    'temperature', 'humidity', 'pressure', 'wind_speed',
+    'precip6', 'precip24', 'gust6', 'river_discharge', 'eq_mag', 'eq_dist'
+]
+LABEL_COLUMNS = ["rain_label", "wind_label", "storm_label", "flood_label", "earthquake_label"]
 
-    for _, row in df_fc.iterrows():
+def forecast_7_days_many(points):
+    """
+    Dự báo 7 ngày cho nhiều (lat, lon): gộp toạ độ khi gọi Open-Meteo và chạy model 1 lần cho mọi ngày của mọi điểm.
+    Trả về list DataFrame theo thứ tự points (None nếu không lấy được dự báo cho điểm đó).
+    """
+    points = list(points)
+    model, feature_list, label_encoder, scaler = load_forecast_artifacts()
+    frames = get_7day_many(points)
+    # River discharge cho cả batch: đọc live_data.csv 1 lần + 1 lượt flood API gộp toạ độ
+    rivers = get_river_discharge_many([p for p, df_fc in zip(points, frames) if df_fc is not None])
+    rivers = iter(rivers)
+
+    per_point = []
+    feature_rows = []
+
+    for (lat, lon), df_fc in zip(points, frames):
+        if df_fc is None:
+            per_point.append(None)
+            continue
+        results = []
+        per_point.append(results)
+
+        river_discharge = next(rivers)
+        if river_discharge is None:
+            river_discharge = 15  # fallback
+
+        for _, row in df_fc.iterrows():
         
-        temp_avg = (row["temp_max"] + row["temp_min"]) / 2
-        precip24 = row["precip24"]
-        precip6  = row["precip6"]
-        wind     = row["wind_max"]
-        gust6    = row["gust6"] + 3
-        pressure = row["pressure"]
-
-        river    = river_discharge
-        eq_mag   = 0
-        eq_dist  = 999
-
-        # ===== RULE LABELS =====
-        rain_lb  = label_rain(precip6, precip24)
-        wind_lb  = label_wind(gust6)
-        storm_lb = label_storm(gust6, precip6, precip24, wind, pressure)
-        flood_lb = label_flood(river)
-        eq_lb    = label_earthquake(None, None)
-        overall_rule = overall_hazard_prediction_rule(
-            flood_lb, storm_lb, rain_lb, wind_lb, eq_lb
+            temp_avg = (row["temp_max"] + row["temp_min"]) / 2
+            precip24 = row["precip24"]
+            precip6  = row["precip6"]
+            wind     = row["wind_max"]
+            gust6    = row["gust6"] + 3
+            pressure = row["pressure"]
+
+            river    = river_discharge
+            eq_mag   = 0
+            eq_dist  = 999
+
+            # ===== FEATURES FOR MODEL =====
+            # Use daily humidity computed earlier (fallback to 70 if missing)
+            day_humidity = row.get("humidity")
+            try:
+                day_humidity = float(day_humidity) if day_humidity is not None and not pd.isna(day_humidity) else 70.0
+            except Exception:
+                day_humidity = 70.0
+
+            feature_values = {
+                "temperature": temp_avg,
+                "humidity": day_humidity,
+                "pressure": pressure,
+                "wind_speed": wind,
+                "precip6": precip6,
+                "precip24": precip24,
+                "gust6": gust6,
+                "river_discharge": river,
+                "eq_mag": eq_mag,
+                "eq_dist": eq_dist,
+            }
+
+            feature_rows.append([feature_values[f] for f in SCALER_FEATURES])
+
+            results.append({
+                "date": row["date"],
+                "lat": lat,
+                "lon": lon,
+                "temp_avg": temp_avg,
+                "temp_min": row.get("temp_min"),
+                "temp_max": row.get("temp_max"),
+                "humidity": feature_values["humidity"],
+                "precip24": precip24,
+                "precip6": precip6,
+                "wind_max": wind,
+                "gust6": gust6,
+                "pressure": pressure,
+                "river_discharge": river,
+            })
+
+    all_results = [result for results in per_point if results for result in results]
+    if all_results:
+        # ===== RULE LABELS: gán nhãn mọi ngày của mọi điểm 1 lần =====
+        def col(name): return [result[name] for result in all_results]
+        labels = label_hazards(
+            FORECAST, p6=col("precip6"), p24=col("precip24"), gust6=col("gust6"), wind=col("wind_max"),
+            pressure=col("pressure"), river=col("river_discharge"),  # không có dữ liệu động đất cho dự báo
         )
-
-        # ===== FEATURES FOR MODEL =====
-        # Use daily humidity computed earlier (fallback to 70 if missing)
-        day_humidity = row.get("humidity")
-        try:
-            day_humidity = float(day_humidity) if day_humidity is not None and not pd.isna(day_humidity) else 70.0
-        except Exception:
-            day_humidity = 70.0
-
-        feature_values = {
-            "temperature": temp_avg,
-            "humidity": day_humidity,
-            "pressure": pressure,
-            "wind_speed": wind,
-            "precip6": precip6,
-            "precip24": precip24,
-            "gust6": gust6,
-            "river_discharge": river,
-            "eq_mag": eq_mag,
-            "eq_dist": eq_dist,
-        }
-
-        scaler_features = [
-            'temperature', 'humidity', 'pressure', 'wind_speed',
-            'precip6', 'precip24', 'gust6', 'river_discharge', 'eq_mag', 'eq_dist'
-        ]
-
-        df_input_raw = pd.DataFrame([[feature_values[f] for f in scaler_features]],
-                                    columns=scaler_features)
-
+        for i, result in enumerate(all_results):
+            result.update({
+                "rain_label_rule": labels["rain"][i],
+                "wind_label_rule": labels["wind"][i],
+                "storm_label_rule": labels["storm"][i],
+                "flood_label_rule": labels["flood"][i],
+                "earthquake_label_rule": labels["earthquake"][i],
+                "overall_hazard_rule": labels["overall"][i],
+            })
+
+        # ===== ML PREDICTION: scale + predict mọi ngày của mọi điểm trong 1 lần gọi =====
+        df_input_raw = pd.DataFrame(feature_rows, columns=SCALER_FEATURES)
         df_input_scaled = pd.DataFrame(
             scaler.transform(df_input_raw),
-            columns=scaler_features
+            columns=SCALER_FEATURES
+        )
+        df_input_scaled[LABEL_COLUMNS] = np.column_stack(
+            [[RISK_ORDER[lb] for lb in labels[hz]] for hz in ("rain", "wind", "storm", "flood", "earthquake")]
         )
-
-        label_to_numeric = {"no": 0, "low": 1, "mid": 2, "mid-high": 3, "high": 4}
-        df_input_scaled["rain_label"] = label_to_numeric[rain_lb]
-        df_input_scaled["wind_label"] = label_to_numeric[wind_lb]
-        df_input_scaled["storm_label"] = label_to_numeric[storm_lb]
-        df_input_scaled["flood_label"] = label_to_numeric[flood_lb]
-        df_input_scaled["earthquake_label"] = label_to_numeric[eq_lb]
 
         df_input = df_input_scaled[feature_list]
 
-        pred = model.predict(df_input)[0]
-        hazard_ml = label_encoder.inverse_transform([pred])[0]
-
-        results.append({
-            "date": row["date"],
-            "lat": lat,
-            "lon": lon,
-            "temp_avg": temp_avg,
-            "temp_min": row.get("temp_min"),
-            "temp_max": row.get("temp_max"),
-            "humidity": feature_values["humidity"],
-            "precip24": precip24,
-            "precip6": precip6,
-            "wind_max": wind,
-            "gust6": gust6,
-            "pressure": pressure,
-            "river_discharge": river,
-
-            # Rule labels
-            "rain_label_rule": rain_lb,
-            "wind_label_rule": wind_lb,
-            "storm_label_rule": storm_lb,
-            "flood_label_rule": flood_lb,
-            "earthquake_label_rule": eq_lb,
-            "overall_hazard_rule": overall_rule,
-
-            # ML prediction
-            "overall_hazard_ml": hazard_ml,
-        })
-
-    return pd.DataFrame(results)
+        preds = model.predict(df_input)
+        hazards_ml = label_encoder.inverse_transform(preds)
+        for result, hazard_ml in zip(all_results, hazards_ml):
+            result["overall_hazard_ml"] = hazard_ml
+
+    return [pd.DataFrame(results) if results is not None else None for results in per_point]
+
+def forecast_7_days(lat, lon):
+    df = forecast_7_days_many([(lat, lon)])[0]
+    if df is None:
+        raise RuntimeError(f"Không lấy được dự báo 7 ngày cho ({lat}, {lon})")
+    return df
 
 
 # ==============================
@@ -464,3 +382,15 @@ def generate_forecast_for_location(lat: float, lon: float) -> pd.DataFrame:
         DataFrame với 7 ngày dự đoán
     """
     return forecast_7_days(lat, lon)
+
+def generate_forecast_for_locations(points) -> list:
+    """
+    Generate dự đoán 7 ngày cho nhiều tọa độ cùng lúc (gộp request Open-Meteo + 1 lần chạy model)
+
+    Args:
+        points: danh sách (lat, lon)
+
+    Returns:
+        List DataFrame theo thứ tự points (None nếu điểm đó không lấy được dữ liệu)
+    """
+    return forecast_7_days_many(points)
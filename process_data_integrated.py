@@ -1,22 +1,14 @@
 import os
 import json
 import math
-import psycopg2
 from psycopg2.extras import RealDictCursor
-from app.core.config import DB_CONFIG
-from app.ml.predictor_hazard import HazardPredictor
+from app.core.database import db_connection
+from app.ml.predictor_hazard import get_hazard_predictor
 from app.core.gis_utils import get_risk_classification, get_radius_in_meters
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 OUTPUT_FILE = os.path.join(BASE_DIR, "data", "processed", "processed_risk_zones.json")
 
-def get_db_connection():
-    try:
-        return psycopg2.connect(**DB_CONFIG)
-    except Exception as e:
-        print(f"❌ DB Connection Failed: {e}")
-        return None
-
 # --- HÀM TẠO POLYGON TỪ TÂM (Thay vì để Frontend vẽ) ---
 def create_geo_polygon(lat, lon, radius_meters, num_points=32):
     """
@@ -62,82 +54,88 @@ def run_processing_pipeline():
     print("🔄 Bắt đầu xử lý dữ liệu (Tạo Polygon & Đánh giá rủi ro)...")
     
     try:
-        predictor = HazardPredictor()
+        # Dùng lại model đã load trong process thay vì đọc pickle mỗi lần chạy
+        predictor = get_hazard_predictor()
     except Exception as e:
         print(f"❌ Lỗi khởi tạo Model: {e}")
         return
 
-    conn = get_db_connection()
-    if not conn: return
+    # Mượn kết nối từ pool chỉ trong lúc query, trả lại ngay trước khi chạy model
+    with db_connection() as conn:
+        if not conn: return
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                # Lấy dữ liệu trong 24h qua (Bỏ DISTINCT ON để lấy nhiều event hơn)
+                sql = """
+                    SELECT id, title, description, event_time, raw_data,
+                        ST_X(geom::geometry) as lon, ST_Y(geom::geometry) as lat
+                    FROM events
+                    WHERE event_type = 'weather_analytics'
+                    AND event_time >= NOW() - INTERVAL '24 HOURS'
+                    ORDER BY event_time DESC
+                    LIMIT 100
+                """
+                cur.execute(sql)
+                rows = cur.fetchall()
+        except Exception as e:
+            print(f"❌ Lỗi xử lý: {e}")
+            return
 
     features_collection = []
 
     try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            # Lấy dữ liệu trong 24h qua (Bỏ DISTINCT ON để lấy nhiều event hơn)
-            sql = """
-                SELECT id, title, description, event_time, raw_data,
-                    ST_X(geom::geometry) as lon, ST_Y(geom::geometry) as lat
-                FROM events
-                WHERE event_type = 'weather_analytics'
-                AND event_time >= NOW() - INTERVAL '24 HOURS'
-                ORDER BY event_time DESC
-                LIMIT 100
-            """
-            cur.execute(sql)
-            rows = cur.fetchall()
-            print(f"📊 Đã lấy {len(rows)} điểm dữ liệu.")
-
-            for row in rows:
-                raw_data = row['raw_data']
-                
-                # A. Dự báo AI
-                predicted_hazard = predictor.predict_overall_hazard(raw_data)
-                
-                # B. Xác định mức độ
-                if predicted_hazard in ['No', 'Unknown']:
-                    # Vẫn xử lý nhưng gán mức thấp để bản đồ có dữ liệu xanh/vàng
-                    risk_level = "Info"
-                else:
-                    label_key = f"{predicted_hazard.lower()}_label"
-                    risk_level = str(raw_data.get(label_key, 'low')).capitalize()
-
-                # C. Tính điểm & Màu sắc
-                safety_score = calculate_dynamic_safety_score(risk_level, raw_data)
-                
-                # Lấy màu từ utils (Đã có logic Xanh/Vàng/Cam/Đỏ)
-                risk_class = get_risk_classification(safety_score)
-                color = risk_class['color_code']
-
-                # D. Tính bán kính & Tạo Polygon
-                intensity = map_intensity_for_radius(risk_level)
-                radius = get_radius_in_meters(predicted_hazard, intensity)
-                
-                # TẠO GEOMETRY POLYGON
-                polygon_coords = create_geo_polygon(row['lat'], row['lon'], radius)
-
-                # E. Tạo Feature
-                feature = {
-                    "type": "Feature",
-                    "properties": {
-                        "id": row['id'],
-                        "name": row['title'],
-                        "description": row['description'],
-                        "hazard_type": predicted_hazard,
-                        "risk_level": risk_level,
-                        "safety_score": safety_score,
-                        "radius": radius,
-                        "color": color,
-                        "time": str(row['event_time']),
-                        # Lưu tâm để frontend dễ bay tới
-                        "center": [row['lat'], row['lon']] 
-                    },
-                    "geometry": {
-                        "type": "Polygon",
-                        "coordinates": polygon_coords
-                    }
+        print(f"📊 Đã lấy {len(rows)} điểm dữ liệu.")
+
+        # A. Dự báo AI cho cả batch trong 1 lần gọi model
+        predictions = predictor.predict_many([row['raw_data'] for row in rows])
+
+        for row, predicted_hazard in zip(rows, predictions):
+            raw_data = row['raw_data']
+            
+            # B. Xác định mức độ
+            if predicted_hazard in ['No', 'Unknown']:
+                # Vẫn xử lý nhưng gán mức thấp để bản đồ có dữ liệu xanh/vàng
+                risk_level = "Info"
+            else:
+                label_key = f"{predicted_hazard.lower()}_label"
+                risk_level = str(raw_data.get(label_key, 'low')).capitalize()
+
+            # C. Tính điểm & Màu sắc
+            safety_score = calculate_dynamic_safety_score(risk_level, raw_data)
+            
+            # Lấy màu từ utils (Đã có logic Xanh/Vàng/Cam/Đỏ)
+            risk_class = get_risk_classification(safety_score)
+            color = risk_class['color_code']
+
+            # D. Tính bán kính & Tạo Polygon
+            intensity = map_intensity_for_radius(risk_level)
+            radius = get_radius_in_meters(predicted_hazard, intensity)
+            
+            # TẠO GEOMETRY POLYGON
+            polygon_coords = create_geo_polygon(row['lat'], row['lon'], radius)
+
+            # E. Tạo Feature
+            feature = {
+                "type": "Feature",
+                "properties": {
+                    "id": row['id'],
+                    "name": row['title'],
+                    "description": row['description'],
+                    "hazard_type": predicted_hazard,
+                    "risk_level": risk_level,
+                    "safety_score": safety_score,
+                    "radius": radius,
+                    "color": color,
+                    "time": str(row['event_time']),
+                    # Lưu tâm để frontend dễ bay tới
+                    "center": [row['lat'], row['lon']] 
+                },
+                "geometry": {
+                    "type": "Polygon",
+                    "coordinates": polygon_coords
                 }
-                features_collection.append(feature)
+            }
+            features_collection.append(feature)
 
         # Ghi file
         final_geojson = {
@@ -153,8 +151,6 @@ def run_processing_pipeline():
 
     except Exception as e:
         print(f"❌ Lỗi xử lý: {e}")
-    finally:
-        if conn: conn.close()
 
 if __name__ == "__main__":
     run_processing_pipeline()
\ No newline at end of file
@@ -0,0 +1,287 @@
+"""
+Parity của app/ml/hazard_labels.py (vector hoá) với các hàm gán nhãn scalar cũ
+của collector (data_collector.py) và dự báo 7 ngày (seven_days_predict.py).
+Các hàm tham chiếu bên dưới chép nguyên từ bản scalar đã bị thay thế.
+"""
+import math
+
+import numpy as np
+import pytest
+
+from app.ml.hazard_labels import FORECAST, NOWCAST, RISK_ORDER, label_hazards
+
+HAZARD_PRIORITY = ["wind", "rain", "storm", "flood", "earthquake"]
+
+
+# ---------- Tham chiếu: collector (nowcast) ----------
+
+def nc_label_rain(p6, p24):
+    p6 = max(0, p6); p24 = max(0, p24)
+    if p24 > 80 or p6 > 40: return "high"
+    if p24 > 50 or p6 > 25: return "mid-high"
+    if p24 > 20 or p6 > 10: return "mid"
+    if p24 > 3 or p6 > 1: return "low"
+    return "no"
+
+
+def nc_label_wind(gust6):
+    gust6 = max(0, gust6)
+    if gust6 > 25: return "high"
+    if gust6 > 18: return "mid-high"
+    if gust6 > 10: return "mid"
+    if gust6 > 5: return "low"
+    return "no"
+
+
+def nc_label_storm(gust6, p6, p24, wind, pressure, weather_desc):
+    g6 = max(0, gust6); r6 = max(0, p6); r24 = max(0, p24)
+    pres = 1013 if pressure == -1.0 else pressure
+    score = 0
+    if g6 > 25: score += 4
+    elif g6 > 18: score += 3
+    elif g6 > 12: score += 2
+    elif g6 > 8: score += 1
+    if r24 > 80 or r6 > 40: score += 4
+    elif r24 > 50 or r6 > 25: score += 3
+    elif r24 > 20 or r6 > 10: score += 2
+    elif r24 > 3 or r6 > 1: score += 1
+    if pres < 990: score += 4
+    elif pres < 995: score += 3
+    elif pres < 1000: score += 2
+    if "thunderstorm" in str(weather_desc).lower(): score += 2
+    elif "heavy" in str(weather_desc).lower(): score += 1
+    if score >= 12: return "high"
+    if score >= 9: return "mid-high"
+    if score >= 6: return "mid"
+    if score >= 3: return "low"
+    return "no"
+
+
+def nc_label_flood(river):
+    if river == -1.0: return "no"
+    if river > 8000: return "high"
+    if river > 5000: return "mid-high"
+    if river > 2000: return "mid"
+    if river > 500: return "low"
+    return "no"
+
+
+def nc_label_earthquake(mag, dist):
+    if mag == -1.0 or dist == -1.0: return "no"
+    if mag >= 6.0 and dist <= 150: return "high"
+    if mag >= 5.5 and dist <= 300: return "mid-high"
+    if mag >= 5.0 and dist <= 500: return "mid"
+    if mag >= 4.5 and dist <= 800: return "low"
+    return "no"
+
+
+def nc_overall(flood, storm, rain, wind, eq):
+    risks = {"flood": flood, "storm": storm, "rain": rain, "wind": wind, "earthquake": eq}
+    best = "no"; best_score = 0
+    for hz in HAZARD_PRIORITY:
+        score = RISK_ORDER[risks[hz]]
+        if score >= 2: best = hz; best_score = score
+    if best_score < 2: return "No"
+    return best.capitalize()
+
+
+# ---------- Tham chiếu: dự báo 7 ngày (forecast) ----------
+
+def level(v):
+    return v or 0.0
+
+
+def fc_label_rain(p6, p24):
+    p6 = level(p6); p24 = level(p24)
+    if p24 > 80 or p6 > 40: return "high"
+    if p24 > 50 or p6 > 25: return "mid-high"
+    if p24 > 20 or p6 > 10: return "mid"
+    if p24 > 3 or p6 > 1: return "low"
+    return "no"
+
+
+def fc_label_wind(gust6):
+    gust6 = level(gust6)
+    if gust6 > 30: return "high"
+    if gust6 > 22: return "mid-high"
+    if gust6 > 15: return "mid"
+    if gust6 > 8: return "low"
+    return "no"
+
+
+def fc_label_storm(gust6, p6, p24, wind, pres):
+    gust6 = level(gust6); p6 = level(p6); p24 = level(p24)
+    score = 0
+    if gust6 > 28: score += 4
+    elif gust6 > 20: score += 3
+    elif gust6 > 13: score += 2
+    elif gust6 > 7: score += 1
+    if gust6 > wind + 12 and p6 > 20: score += 2
+    elif gust6 > wind + 8 and p6 > 10: score += 1
+    if p24 > 80 or p6 > 40: score += 4
+    elif p24 > 50 or p6 > 25: score += 3
+    elif p24 > 20 or p6 > 10: score += 2
+    elif p24 > 3 or p6 > 1: score += 1
+    if pres < 990: score += 4
+    elif pres < 995: score += 3
+    elif pres < 1000: score += 2
+    elif pres < 1005: score += 1
+    if score >= 14: return "high"
+    if score >= 10: return "mid-high"
+    if score >= 7: return "mid"
+    if score >= 3: return "low"
+    return "no"
+
+
+def fc_label_flood(river):
+    river = level(river)
+    if river > 8000: return "high"
+    if river > 5000: return "mid-high"
+    if river > 2000: return "mid"
+    if river > 500: return "low"
+    return "no"
+
+
+def fc_label_earthquake(mag, dist):
+    if mag is None or dist is None: return "no"
+    if mag >= 6.0 and dist <= 150: return "high"
+    if mag >= 5.5 and dist <= 300: return "mid-high"
+    if mag >= 5.0 and dist <= 500: return "mid"
+    if mag >= 4.5 and dist <= 800: return "low"
+    return "no"
+
+
+def fc_overall(flood, storm, rain, wind, eq):
+    risks = {"flood": flood, "storm": storm, "rain": rain, "wind": wind, "earthquake": eq}
+    best = "no"; best_score = 0
+    for hz in HAZARD_PRIORITY:
+        score = RISK_ORDER[risks[hz]]
+        min_threshold = 3 if hz == "wind" else 2
+        if score >= min_threshold and score > best_score:
+            best = hz; best_score = score
+    if best_score == 0: return "No"
+    return best.capitalize()
+
+
+# ---------- Dữ liệu: đúng ngưỡng, sát ngưỡng và giá trị "thiếu" ----------
+
+def around(*thresholds):
+    """Mỗi ngưỡng t -> t - 0.5, t, t + 0.5"""
+    return sorted({v for t in thresholds for v in (t - 0.5, t, t + 0.5)})
+
+
+NAN = float("nan")
+RAIN_P6 = around(1, 10, 25, 40) + [0.0, -3.0, NAN]
+RAIN_P24 = around(3, 20, 50, 80) + [0.0, -3.0, NAN]
+GUST = around(5, 7, 8, 10, 12, 13, 15, 18, 20, 22, 25, 28, 30) + [0.0, -2.0, NAN]
+WIND = [0.0, 5.0, 8.0, 12.0, NAN]
+PRESSURE = around(990, 995, 1000, 1005) + [1013.0, -1.0, NAN]
+RIVER = around(500, 2000, 5000, 8000) + [0.0, -1.0, NAN]
+EQ_MAG = [4.0, 4.5, 5.0, 5.5, 6.0, 6.5, -1.0, NAN]
+EQ_DIST = [100.0, 150.0, 300.0, 500.0, 800.0, 801.0, -1.0, NAN]
+DESCS = ["clear sky", "heavy intensity rain", "thunderstorm with rain", "Thunderstorm heavy", ""]
+
+
+def random_rows(n, seed, missing_as_none=False):
+    rng = np.random.default_rng(seed)
+    pick = lambda values: [values[i] for i in rng.integers(0, len(values), n)]  # noqa: E731
+    rows = {
+        "p6": pick(RAIN_P6), "p24": pick(RAIN_P24), "gust6": pick(GUST), "wind": pick(WIND),
+        "pressure": pick(PRESSURE), "river": pick(RIVER), "eq_mag": pick(EQ_MAG), "eq_dist": pick(EQ_DIST),
+        "weather_desc": pick(DESCS),
+    }
+    if missing_as_none:
+        # Forecast: rain/gust/river/động đất có thể là None (wind/pressure là trung bình pandas -> NaN)
+        for field in ("p6", "p24", "gust6", "river", "eq_mag", "eq_dist"):
+            rows[field] = [None if isinstance(v, float) and math.isnan(v) and rng.random() < 0.5 else v for v in rows[field]]
+    return rows
+
+
+def nowcast_reference(r, i):
+    rain = nc_label_rain(r["p6"][i], r["p24"][i])
+    wind = nc_label_wind(r["gust6"][i])
+    storm = nc_label_storm(r["gust6"][i], r["p6"][i], r["p24"][i], r["wind"][i], r["pressure"][i], r["weather_desc"][i])
+    flood = nc_label_flood(r["river"][i])
+    eq = nc_label_earthquake(r["eq_mag"][i], r["eq_dist"][i])
+    return rain, wind, storm, flood, eq, nc_overall(flood, storm, rain, wind, eq)
+
+
+def forecast_reference(r, i, with_eq=True):
+    rain = fc_label_rain(r["p6"][i], r["p24"][i])
+    wind = fc_label_wind(r["gust6"][i])
+    storm = fc_label_storm(r["gust6"][i], r["p6"][i], r["p24"][i], r["wind"][i], r["pressure"][i])
+    flood = fc_label_flood(r["river"][i])
+    eq = fc_label_earthquake(r["eq_mag"][i], r["eq_dist"][i]) if with_eq else fc_label_earthquake(None, None)
+    return rain, wind, storm, flood, eq, fc_overall(flood, storm, rain, wind, eq)
+
+
+def vectorized(labels, i):
+    return tuple(str(labels[hz][i]) for hz in ("rain", "wind", "storm", "flood", "earthquake", "overall"))
+
+
+def assert_parity(labels, reference, n):
+    mismatches = [(i, vectorized(labels, i), reference(i)) for i in range(n) if vectorized(labels, i) != reference(i)]
+    assert not mismatches, f"{len(mismatches)}/{n} dòng lệch, VD: {mismatches[:3]}"
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_nowcast_matches_scalar_reference(seed):
+    r = random_rows(20000, seed)
+    labels = label_hazards(
+        NOWCAST, p6=r["p6"], p24=r["p24"], gust6=r["gust6"], wind=r["wind"], pressure=r["pressure"],
+        river=r["river"], eq_mag=r["eq_mag"], eq_dist=r["eq_dist"], weather_desc=r["weather_desc"],
+    )
+    assert_parity(labels, lambda i: nowcast_reference(r, i), 20000)
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_forecast_matches_scalar_reference(seed):
+    r = random_rows(20000, seed, missing_as_none=True)
+    labels = label_hazards(
+        FORECAST, p6=r["p6"], p24=r["p24"], gust6=r["gust6"], wind=r["wind"], pressure=r["pressure"],
+        river=r["river"], eq_mag=r["eq_mag"], eq_dist=r["eq_dist"],
+    )
+    assert_parity(labels, lambda i: forecast_reference(r, i), 20000)
+
+
+def test_forecast_without_earthquake_data():
+    # seven_days_predict không có dữ liệu động đất -> eq_mag/eq_dist = None
+    r = random_rows(2000, 7, missing_as_none=True)
+    labels = label_hazards(
+        FORECAST, p6=r["p6"], p24=r["p24"], gust6=r["gust6"], wind=r["wind"], pressure=r["pressure"], river=r["river"],
+    )
+    assert set(labels["earthquake"]) == {"no"}
+    assert_parity(labels, lambda i: forecast_reference(r, i, with_eq=False), 2000)
+
+
+@pytest.mark.parametrize("profile, reference", [(NOWCAST, nc_label_wind), (FORECAST, fc_label_wind)])
+def test_wind_exact_thresholds(profile, reference):
+    # Giá trị đúng bằng ngưỡng thuộc mức thấp hơn (so sánh ">")
+    labels = label_hazards(profile, p6=[0.0] * len(GUST), p24=[0.0] * len(GUST), gust6=GUST, wind=[0.0] * len(GUST),
+                           pressure=[1013.0] * len(GUST), river=[0.0] * len(GUST))
+    assert [str(v) for v in labels["wind"]] == [reference(g) for g in GUST]
+
+
+def test_flood_and_earthquake_sentinels():
+    nowcast = label_hazards(NOWCAST, p6=[0.0] * 3, p24=[0.0] * 3, gust6=[0.0] * 3, wind=[0.0] * 3,
+                            pressure=[-1.0] * 3, river=[-1.0, NAN, 8000.5],
+                            eq_mag=[-1.0, 6.5, NAN], eq_dist=[10.0, -1.0, 10.0])
+    assert list(nowcast["flood"]) == ["no", "no", "high"]
+    assert list(nowcast["earthquake"]) == ["no", "no", "no"]
+    # Áp suất -1 (thiếu) được coi là 1013 hPa -> không cộng điểm bão
+    assert list(nowcast["storm"]) == ["no", "no", "no"]
+
+    forecast = label_hazards(FORECAST, p6=[None, NAN], p24=[None, NAN], gust6=[None, NAN], wind=[NAN, NAN],
+                             pressure=[NAN, NAN], river=[None, NAN], eq_mag=[None, 6.5], eq_dist=[10.0, None])
+    for hz in ("rain", "wind", "storm", "flood", "earthquake"):
+        assert list(forecast[hz]) == ["no", "no"]
+    assert list(forecast["overall"]) == ["No", "No"]
+
+
+@pytest.mark.parametrize("profile", [NOWCAST, FORECAST])
+def test_empty_input(profile):
+    labels = label_hazards(profile, p6=[], p24=[], gust6=[], wind=[], pressure=[], river=[],
+                           eq_mag=[] if profile is NOWCAST else None, eq_dist=[] if profile is NOWCAST else None,
+                           weather_desc=[] if profile is NOWCAST else None)
+    assert set(labels) == {"rain", "wind", "storm", "flood", "earthquake", "overall"}
+    assert all(len(values) == 0 for values in labels.values())
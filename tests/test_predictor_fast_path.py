@@ -0,0 +1,131 @@
+"""
+Fast path của SafetyPredictor (buffer float32 + inplace_predict) phải cho kết quả giống hệt
+đường DataFrame + DMatrix cũ, với cả bản ghi thiếu feature và nhiều kích thước batch.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+xgb = pytest.importorskip("xgboost")
+
+from app.ml import predictor as predictor_module  # noqa: E402
+from app.ml.schemas import SafetyInput  # noqa: E402
+
+pytestmark = pytest.mark.skipif(
+    not (os.path.exists(predictor_module.MODEL_PATH) and os.path.exists(predictor_module.FEATURES_PATH)),
+    reason="Thiếu artifact model safety",
+)
+
+BATCH_SIZES = [1, 2, 7, 64, 513, 3]  # lớn rồi nhỏ lại: buffer của thread được nới rộng rồi dùng lại
+
+
+def legacy_predict_safety_score(model, features, input_data: dict) -> dict:
+    """predict_safety_score trước fast path (DataFrame 1 dòng + DMatrix)"""
+    input_df = pd.DataFrame([input_data])
+    for col in features:
+        if col not in input_df.columns:
+            input_df[col] = 0.0
+    input_df = input_df[features]
+    final_score = float(model.predict(xgb.DMatrix(input_df))[0])
+    risk_level = "Info"
+    if final_score < 25: risk_level = "High"
+    elif final_score < 50: risk_level = "Medium"
+    elif final_score < 80: risk_level = "Low"
+    return {"safety_score": round(final_score, 2), "risk_level": risk_level}
+
+
+def random_inputs(features, n, seed):
+    """Bản ghi thời tiết ngẫu nhiên; khoảng 1/3 bản ghi thiếu vài feature, một số có NaN"""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n):
+        row = {
+            "lat": rng.uniform(8, 23), "lon": rng.uniform(102, 110),
+            "temperature": rng.uniform(5, 40), "humidity": rng.uniform(20, 100),
+            "pressure": rng.uniform(960, 1030), "wind_speed": rng.uniform(0, 40),
+            "precip6": rng.exponential(10), "precip24": rng.exponential(30), "gust6": rng.uniform(0, 50),
+            "river_discharge": rng.choice([-1.0, rng.uniform(0, 12000)]),
+            "eq_mag": rng.choice([-1.0, rng.uniform(3, 7)]), "eq_dist": rng.choice([-1.0, rng.uniform(0, 1000)]),
+        }
+        row = {col: float(row.get(col, rng.normal(0, 10))) for col in features}
+        if i % 3 == 1:
+            for col in features[i % 4::4]:
+                row.pop(col)
+        if i % 11 == 5:
+            row[features[i % len(features)]] = float("nan")
+        rows.append(row)
+    return rows
+
+
+@pytest.fixture(scope="module")
+def predictor():
+    p = predictor_module.SafetyPredictor()
+    p._engine = None  # chỉ so 2 đường XGBoost, không phải backend compiled
+    return p
+
+
+@pytest.fixture(autouse=True)
+def no_prediction_cache(monkeypatch):
+    # Tắt cache để mỗi lần gọi đều chạy model
+    monkeypatch.setattr(predictor_module.prediction_cache, "maxsize", 0)
+
+
+def run_path(predictor, fast: bool, fn, *args):
+    previous = predictor._use_fast_path
+    predictor._use_fast_path = fast
+    try:
+        return fn(*args)
+    finally:
+        predictor._use_fast_path = previous
+
+
+def test_fast_path_enabled_for_real_model(predictor):
+    # Tự kiểm tra lúc load phải chọn fast path; False nghĩa là fast path lệch đường DataFrame
+    assert predictor._use_fast_path
+
+
+@pytest.mark.parametrize("batch_size", BATCH_SIZES)
+def test_raw_scores_match_dataframe_path(predictor, batch_size):
+    inputs = random_inputs(predictor.features, batch_size, seed=batch_size)
+    fast = predictor._score_fast(inputs)
+    reference = predictor._score_reference(inputs)
+    assert fast.shape == (batch_size,)
+    np.testing.assert_array_equal(fast, reference)
+
+
+@pytest.mark.parametrize("batch_size", BATCH_SIZES)
+def test_predict_many_matches_dataframe_path(predictor, batch_size):
+    inputs = random_inputs(predictor.features, batch_size, seed=100 + batch_size)
+    fast = run_path(predictor, True, predictor.predict_many, inputs)
+    slow = run_path(predictor, False, predictor.predict_many, inputs)
+    assert fast == slow
+
+
+def test_predict_many_matrix_input(predictor):
+    inputs = random_inputs(predictor.features, 50, seed=7)
+    X = np.array([[row.get(col, 0.0) for col in predictor.features] for row in inputs])
+    fast = run_path(predictor, True, predictor.predict_many, X)
+    slow = run_path(predictor, False, predictor.predict_many, X)
+    assert fast == slow == run_path(predictor, True, predictor.predict_many, inputs)
+
+
+def test_predict_safety_score_matches_legacy(predictor):
+    for row in random_inputs(predictor.features, 40, seed=3):
+        legacy = legacy_predict_safety_score(predictor.model, predictor.features, row)
+        assert run_path(predictor, True, predictor.predict_safety_score, row) == legacy
+        assert run_path(predictor, False, predictor.predict_safety_score, row) == legacy
+
+
+def test_pydantic_input_matches_dict_input(predictor):
+    items = [
+        SafetyInput(location=f"P{i}", **row)
+        for i, row in enumerate(random_inputs(predictor.features, 20, seed=11))
+        if all(k in row for k in ("lat", "lon", "temperature", "humidity", "pressure", "wind_speed"))  # field bắt buộc
+    ]
+    assert items
+    fast = run_path(predictor, True, predictor.predict_many, items)
+    slow = run_path(predictor, False, predictor.predict_many, items)
+    legacy = [legacy_predict_safety_score(predictor.model, predictor.features, item.dict()) for item in items]
+    assert fast == slow == legacy
@@ -0,0 +1,136 @@
+"""
+Parity của CompiledTreeEnsemble (app/ml/tree_engine.py) với Booster.predict của XGBoost:
+artifact model thật trong data/models, input NaN, input đúng bằng ngưỡng split, và output multi-class.
+"""
+import numpy as np
+import pytest
+
+xgb = pytest.importorskip("xgboost")
+
+from app.ml.registry import registry  # noqa: E402
+from app.ml.tree_engine import CompiledTreeEnsemble, compile_booster  # noqa: E402
+
+
+def load_booster(name: str):
+    if not registry.exists(name):
+        pytest.skip(f"Thiếu artifact {name}")
+    obj = registry.get(name).obj
+    return obj.get_booster() if hasattr(obj, "get_booster") else obj
+
+
+def booster_predict(booster, X: np.ndarray) -> np.ndarray:
+    return booster.predict(xgb.DMatrix(X, missing=np.nan, feature_names=booster.feature_names))
+
+
+def split_values(engine: CompiledTreeEnsemble) -> dict:
+    """feature -> các ngưỡng split thật của model"""
+    is_split = engine._left != np.arange(len(engine._left))
+    values = {}
+    for f, t in zip(engine._feature[is_split], engine._threshold[is_split]):
+        values.setdefault(int(f), set()).add(float(t))
+    return {f: np.array(sorted(v), dtype=np.float32) for f, v in values.items()}
+
+
+def threshold_inputs(engine: CompiledTreeEnsemble, n: int, seed: int) -> np.ndarray:
+    """Mỗi ô là 1 ngưỡng split của đúng feature đó (hoặc số liền kề float32 của ngưỡng)"""
+    rng = np.random.default_rng(seed)
+    thresholds = split_values(engine)
+    X = rng.normal(0, 100, size=(n, engine.num_feature)).astype(np.float32)
+    for f, values in thresholds.items():
+        col = values[rng.integers(0, len(values), n)]
+        step = rng.integers(-1, 2, n)  # -1: sát dưới ngưỡng, 0: đúng ngưỡng, 1: sát trên
+        X[:, f] = np.where(step == 0, col, np.nextafter(col, np.where(step < 0, -np.inf, np.inf).astype(np.float32)))
+    return X
+
+
+def random_inputs(n_features: int, n: int, seed: int, nan_fraction: float = 0.0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    X = rng.normal(0, 100, size=(n, n_features)).astype(np.float32)
+    X[rng.random(X.shape) < nan_fraction] = np.nan
+    return X
+
+
+def assert_parity(engine, booster, X):
+    expected = booster_predict(booster, X)
+    got = engine.predict(X)
+    assert got.shape == expected.shape
+    np.testing.assert_allclose(got, expected, rtol=1e-5, atol=1e-5)
+
+
+# ---------- Model safety thật (hồi quy) ----------
+
+@pytest.fixture(scope="module")
+def safety():
+    booster = load_booster("safety_model")
+    return CompiledTreeEnsemble.from_booster(booster), booster
+
+
+def test_safety_model_random_inputs(safety):
+    engine, booster = safety
+    assert_parity(engine, booster, random_inputs(engine.num_feature, 2000, seed=0))
+
+
+@pytest.mark.parametrize("nan_fraction", [0.05, 0.5, 1.0])
+def test_safety_model_nan_inputs(safety, nan_fraction):
+    # NaN đi theo nhánh default_left của từng node
+    engine, booster = safety
+    assert_parity(engine, booster, random_inputs(engine.num_feature, 1000, seed=1, nan_fraction=nan_fraction))
+
+
+def test_safety_model_inputs_on_split_thresholds(safety):
+    # x == ngưỡng phải đi nhánh phải (XGBoost so sánh x < ngưỡng trên float32)
+    engine, booster = safety
+    X = threshold_inputs(engine, 2000, seed=2)
+    X[::7, ::3] = np.nan
+    assert_parity(engine, booster, X)
+
+
+def test_safety_model_realistic_inputs(safety):
+    engine, booster = safety
+    rng = np.random.default_rng(3)
+    lows = np.array([8, 102, 5, 20, 960, 0, 0, 0, 0, -1, -1, -1], dtype=np.float32)
+    highs = np.array([23, 110, 40, 100, 1030, 40, 80, 200, 50, 12000, 7, 1000], dtype=np.float32)
+    if engine.num_feature != len(lows):
+        pytest.skip("Feature list của model safety đã đổi")
+    X = (lows + rng.random((2000, len(lows))) * (highs - lows)).astype(np.float32)
+    assert_parity(engine, booster, X)
+
+
+def test_compile_booster_accepts_real_model(safety):
+    # Kiểm tra parity lúc load không được tự quay về runtime XGBoost với model thật
+    _, booster = safety
+    engine = compile_booster(booster, lambda X: booster_predict(booster, X), booster.num_features(), label="safety")
+    assert engine is not None
+
+
+# ---------- Multi-class (model hazard thật nếu có, và 1 model softprob nhỏ) ----------
+
+def small_multiclass_booster(objective: str):
+    rng = np.random.default_rng(4)
+    X = rng.normal(0, 1, size=(600, 6)).astype(np.float32)
+    X[rng.random(X.shape) < 0.1] = np.nan
+    y = (np.nan_to_num(X[:, 0]) > 0).astype(int) + (np.nan_to_num(X[:, 1]) > 0.5).astype(int) * 2
+    params = {"objective": objective, "num_class": 4, "max_depth": 4, "eta": 0.3, "verbosity": 0}
+    return xgb.train(params, xgb.DMatrix(X, label=y, missing=np.nan), num_boost_round=20)
+
+
+@pytest.mark.parametrize("objective", ["multi:softprob", "multi:softmax"])
+def test_multiclass_output_shape_and_values(objective):
+    booster = small_multiclass_booster(objective)
+    engine = CompiledTreeEnsemble.from_booster(booster)
+    X = random_inputs(6, 500, seed=5, nan_fraction=0.1) / 100
+    expected = booster_predict(booster, X)
+    got = engine.predict(X)
+    assert got.shape == expected.shape == ((500, 4) if objective == "multi:softprob" else (500,))
+    np.testing.assert_allclose(got, expected, rtol=1e-5, atol=1e-5)
+    assert_parity(engine, booster, threshold_inputs(engine, 500, seed=6))
+
+
+def test_real_hazard_model():
+    booster = load_booster("hazard_model")
+    engine = CompiledTreeEnsemble.from_booster(booster)
+    X = random_inputs(engine.num_feature, 1000, seed=7, nan_fraction=0.05) / 10
+    assert_parity(engine, booster, X)
+    assert_parity(engine, booster, threshold_inputs(engine, 1000, seed=8))
+    if engine.num_class > 1:
+        assert engine.predict(X).shape == (1000, engine.num_class)